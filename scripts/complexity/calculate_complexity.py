@@ -1,11 +1,67 @@
 import pandas as pd
-import numpy as np
 import os
-from scipy import sparse
-from scipy.sparse.linalg import eigs
 import matplotlib.pyplot as plt
 import plotly.express as px
 import plotly.graph_objects as go
+import argparse
+import sys
+from functools import partial
+
+# The workbook writer and the job-task matrix are shared with the data processing scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_processing'))
+from oews_excel import write_xlsx
+from job_task_matrix import DEFAULT_MATRIX_PATH, load_job_task_matrix
+from complexity_engine import (CHANGE_TOL, DEFAULT_OPERATOR_CACHE, SOLVERS, apply_wage_delta, calculate_complexity,
+                               calculate_complexity_bands, calculate_complexity_batch, complexity_operator,
+                               read_complexity_results, solver_report_frame, write_solver_settings)
+from complexity_pool import calculate_complexity_pool
+from economic_complexity import RCA_THRESHOLD, economic_complexity, relatedness_density
+
+parser = argparse.ArgumentParser(description="Calculate job and task complexity for the US, states and metros")
+parser.add_argument('--workers', type=int, default=1,
+                    help="Number of worker processes writing the Excel sheets in parallel")
+parser.add_argument('--skip-excel', action='store_true',
+                    help="Do not write job_task_complexity_data.xlsx (e.g. in CI runs)")
+parser.add_argument('--job-task-matrix', default=DEFAULT_MATRIX_PATH,
+                    help="Job-task RCA matrix built by build_job_task_matrix.py (falls back to "
+                         "data/processed/job_task_matrix.csv when it does not exist)")
+parser.add_argument('--operator-cache', default=DEFAULT_OPERATOR_CACHE,
+                    help="Directory of the cached complexity operators, keyed by the job-task matrix's content")
+parser.add_argument('--region-workers', type=int, default=1,
+                    help="Solve the states and metros one region per task across this many worker "
+                         "processes instead of in one batch")
+parser.add_argument('--solver', choices=SOLVERS, default='reflections',
+                    help="Solver of the JCI/TCI fixed point: the method of reflections of the R script, "
+                         "power iteration or a Lanczos eigenvector solve")
+parser.add_argument('--tol', type=float, default=None,
+                    help="Stop once the standardized indexes change by less than this (default: "
+                         "20 reflections as in the R script, 1e-10 for the eigenvector solvers)")
+parser.add_argument('--max-iter', type=int, default=None,
+                    help="Iteration limit of the solver")
+parser.add_argument('--previous', default=None,
+                    help="Directory of an earlier run's job_complexity.csv, task_complexity.csv and "
+                         "complexity_solver.json to revise: with the reflections, regions with the same jobs "
+                         "get the previous indexes plus the reflections of their wage changes (the eigenvector "
+                         "solvers start from the previous JCI), and the results get JCI_Change/TCI_Change and "
+                         "Moved columns")
+parser.add_argument('--wage-delta', default=None,
+                    help="CSV of wage revisions (O_NET_SOC_Code, Wage_Delta and optionally State or Metro to "
+                         "revise one region only) added to the A_MEAN wages of the jobs data")
+parser.add_argument('--change-tol', type=float, default=CHANGE_TOL,
+                    help="Change of a published JCI or TCI, in standard deviations of the region's previous "
+                         "index, beyond which --previous reports it as moved")
+parser.add_argument('--draws', type=int, default=0,
+                    help="Monte Carlo wage draws for the uncertainty bands of the US indexes (0: no bands)")
+parser.add_argument('--rse-column', default='MEAN_PRSE',
+                    help="Column of jobs.csv with the relative standard error (percent) of the mean wage")
+parser.add_argument('--lq-column', default='LOC_QUOTIENT',
+                    help="Column of the state and metro jobs data with the BLS location quotients, used as "
+                         "the occupations' RCA where given (computed from TOT_EMP otherwise)")
+parser.add_argument('--rca-threshold', type=float, default=RCA_THRESHOLD,
+                    help="RCA from which a region counts as specialized in an occupation (ECI/OCI)")
+parser.add_argument('--job-proximity', default='data/processed/complexity/job_proximity.csv',
+                    help="Occupation proximity edge list (Job1, Job2, Proximity) for the relatedness density")
+args = parser.parse_args()
 
 # Create output directories
 os.makedirs('data/processed/complexity', exist_ok=True)
@@ -15,7 +71,13 @@ print("Loading processed data...")
 # Load processed data
 df_job = pd.read_csv('data/processed/jobs.csv')
 df_task = pd.read_csv('data/processed/tasks.csv')
-job_task_matrix = pd.read_csv('data/processed/job_task_matrix.csv')
+if os.path.exists(args.job_task_matrix):
+    # (matrix, job codes, task IDs) as saved, handed to the complexity operator without a long table
+    job_task_matrix = load_job_task_matrix(args.job_task_matrix)
+    job_task_shape = job_task_matrix[0].shape
+else:
+    job_task_matrix = pd.read_csv('data/processed/job_task_matrix.csv')
+    job_task_shape = job_task_matrix.shape
 task_rating_dwa_wage = pd.read_csv('data/processed/task_rating_dwa_wage.csv')
 
 # Load state and metro data
@@ -24,121 +86,41 @@ metro_job_df = pd.read_csv('data/processed/metros/metro_job_data.csv')
 
 print(f"Jobs data shape: {df_job.shape}")
 print(f"Tasks data shape: {df_task.shape}")
-print(f"Job-Task matrix shape: {job_task_matrix.shape}")
+print(f"Job-Task matrix shape: {job_task_shape}")
 print(f"State jobs data shape: {state_job_df.shape}")
 print(f"Metro jobs data shape: {metro_job_df.shape}")
 
-print("Calculating job and task complexity for US data...")
+if args.wage_delta:
+    # Wage revisions, for every region or for the states or metros they name
+    wage_delta_df = pd.read_csv(args.wage_delta, dtype={'O_NET_SOC_Code': str})
+    print(f"Revising the wages of {wage_delta_df['O_NET_SOC_Code'].nunique()} jobs from {args.wage_delta}")
+    df_job = apply_wage_delta(df_job, wage_delta_df)
+    state_job_df = apply_wage_delta(state_job_df, wage_delta_df, 'State')
+    metro_job_df = apply_wage_delta(metro_job_df, wage_delta_df, 'Metro')
 
-def calculate_complexity(job_task_df, job_df, region_type='US', region_name='United States'):
-    """
-    Calculate job complexity index (JCI) and task complexity index (TCI) using the method from the R script.
-    
-    Parameters:
-    job_task_df: DataFrame with job-task relationships (O_NET_SOC_Code, DWA_ID, RCA)
-    job_df: DataFrame with job information (O_NET_SOC_Code, wage, employment)
-    region_type: Type of region (US, State, Metro)
-    region_name: Name of the region
-    
-    Returns:
-    job_complexity_df: DataFrame with job complexity metrics
-    task_complexity_df: DataFrame with task complexity metrics
-    """
-    print(f"Calculating complexity for {region_type}: {region_name}")
-    
-    # Create job-task matrix (Mjt)
-    job_codes = job_df['O_NET_SOC_Code'].unique()
-    task_ids = job_task_df['DWA_ID'].unique()
-    
-    # Create dictionaries to map codes to indices
-    job_to_idx = {code: i for i, code in enumerate(job_codes)}
-    task_to_idx = {tid: i for i, tid in enumerate(task_ids)}
-    
-    # Create sparse matrix
-    Nj = len(job_codes)
-    Nt = len(task_ids)
-    mjt = sparse.lil_matrix((Nj, Nt), dtype=np.float64)
-    
-    # Fill the matrix with RCA values
-    for _, row in job_task_df.iterrows():
-        job_idx = job_to_idx.get(row['O_NET_SOC_Code'])
-        task_idx = task_to_idx.get(row['DWA_ID'])
-        if job_idx is not None and task_idx is not None:
-            mjt[job_idx, task_idx] = row['RCA']
-    
-    # Convert to CSR format for efficient operations
-    mjt = mjt.tocsr()
-    
-    # Calculate number of tasks per job and number of jobs per task
-    nj = np.array(mjt.sum(axis=1)).flatten()  # Number of tasks per job
-    nt = np.array(mjt.sum(axis=0)).flatten()  # Number of jobs per task
-    
-    # Create wage vector
-    job_df_sorted = job_df.sort_values('O_NET_SOC_Code')
-    wj = job_df_sorted['A_MEAN'].values
-    
-    # Stage 1: Calculate initial task complexity (average wage)
-    # kt1 = (mjt.T @ wj) / nt
-    kt1 = np.zeros(Nt)
-    for j in range(Nj):
-        for t in mjt.getrow(j).nonzero()[1]:
-            kt1[t] += wj[j]
-    kt1 = kt1 / nt
-    
-    # Normalize matrices for iteration
-    # mjt1 = mjt / nj[:, np.newaxis]  # Divide each row by number of tasks per job
-    # mjt2 = mjt.T / nt[:, np.newaxis]  # Divide each row of transpose by number of jobs per task
-    
-    # Create Mjj and Mtt matrices
-    # Mjj = mjt1 @ mjt2.T
-    # Mtt = mjt2.T @ mjt1
-    
-    # Method 2: Iterative method for complexity calculation
-    # Initialize with Stage 1 values
-    kjn_1 = wj.copy()
-    ktn_1 = kt1.copy()
-    
-    # Normalize matrices for iteration
-    mjt_norm_j = sparse.diags(1/nj) @ mjt
-    mjt_norm_t = mjt.T @ sparse.diags(1/nt)
-    
-    # Iterate 20 times as in the R script
-    for i in range(20):
-        # Calculate new complexity values
-        kjn = mjt_norm_j @ ktn_1
-        ktn = mjt_norm_t @ kjn_1
-        
-        # Update for next iteration
-        kjn_1 = kjn
-        ktn_1 = ktn
-    
-    # Final complexity values
-    jci = kjn
-    tci = ktn
-    
-    # Create DataFrames with results
-    job_complexity_df = pd.DataFrame({
-        'O_NET_SOC_Code': job_codes,
-        'JCI': jci,
-        'Wage': wj,
-        'Region_Type': region_type,
-        'Region': region_name
-    })
-    
-    task_complexity_df = pd.DataFrame({
-        'DWA_ID': task_ids,
-        'TCI': tci,
-        'Avg_Wage': kt1,
-        'Region_Type': region_type,
-        'Region': region_name
-    })
-    
-    return job_complexity_df, task_complexity_df
+# Results of an earlier run to revise instead of solving every region from its wages
+previous_complexity = read_complexity_results(args.previous) if args.previous else None
+
+# Normalized job-task operator shared by the US, state and metro calculations, loaded
+# from the cache when this job-task matrix was seen before
+job_task_operator = complexity_operator(job_task_matrix, args.operator_cache)
+
+# States and metros are solved in one batch, or region by region in a process pool
+if args.region_workers > 1:
+    regional_complexity = partial(calculate_complexity_pool, workers=args.region_workers)
+else:
+    regional_complexity = calculate_complexity_batch
+
+print("Calculating job and task complexity for US data...")
+# Iterations, residuals and time of the solver for every region
+solver_reports = []
 
 # Calculate complexity for US data
 us_job_complexity, us_task_complexity = calculate_complexity(
-    job_task_matrix, 
-    df_job
+    job_task_operator,
+    df_job,
+    solver=args.solver, tol=args.tol, max_iter=args.max_iter, reports=solver_reports,
+    warm_start=previous_complexity, change_tol=args.change_tol
 )
 
 # Merge with job and task information
@@ -156,40 +138,33 @@ us_task_complexity = pd.merge(
     how='left'
 )
 
-print("Calculating job and task complexity for states...")
-# Calculate complexity for each state
-state_job_complexity_list = []
-state_task_complexity_list = []
+if args.draws:
+    if args.rse_column in df_job.columns:
+        # Percentile bands of the US indexes under the sampling error of the BLS wages
+        us_job_bands, us_task_bands = calculate_complexity_bands(
+            job_task_operator,
+            df_job,
+            draws=args.draws, rse_col=args.rse_column,
+            solver=args.solver, tol=args.tol, max_iter=args.max_iter
+        )
+        us_job_bands.to_csv('data/processed/complexity/job_complexity_bands.csv', index=False)
+        us_task_bands.to_csv('data/processed/complexity/task_complexity_bands.csv', index=False)
+    else:
+        print(f"No {args.rse_column} column in the jobs data; skipping the uncertainty bands")
 
-# Get unique states
+print("Calculating job and task complexity for states...")
+# Calculate complexity for every state
 states = state_job_df['State'].unique()
-
-# Process a subset of states for demonstration (to save time)
-demo_states = states[:5]  # First 5 states for demo
-for state in demo_states:
-    # Filter data for this state
-    state_data = state_job_df[state_job_df['State'] == state]
-    
-    # Create job-task matrix for this state
-    state_job_task = job_task_matrix.copy()  # Use same job-task relationships
-    
-    # Calculate complexity
-    job_complexity, task_complexity = calculate_complexity(
-        state_job_task,
-        state_data,
+if len(states):
+    all_state_job_complexity, all_state_task_complexity = regional_complexity(
+        job_task_operator,
+        state_job_df,
+        'State',
         region_type='State',
-        region_name=state
+        solver=args.solver, tol=args.tol, max_iter=args.max_iter, reports=solver_reports,
+        warm_start=previous_complexity, change_tol=args.change_tol
     )
     
-    # Add to lists
-    state_job_complexity_list.append(job_complexity)
-    state_task_complexity_list.append(task_complexity)
-
-# Combine all state results
-if state_job_complexity_list:
-    all_state_job_complexity = pd.concat(state_job_complexity_list)
-    all_state_task_complexity = pd.concat(state_task_complexity_list)
-    
     # Merge with job and task information
     all_state_job_complexity = pd.merge(
         all_state_job_complexity,
@@ -206,39 +181,18 @@ if state_job_complexity_list:
     )
 
 print("Calculating job and task complexity for metropolitan areas...")
-# Calculate complexity for each metro area
-metro_job_complexity_list = []
-metro_task_complexity_list = []
-
-# Get unique metros
+# Calculate complexity for every metro area
 metros = metro_job_df['Metro'].unique()
-
-# Process a subset of metros for demonstration (to save time)
-demo_metros = metros[:3]  # First 3 metros for demo
-for metro in demo_metros:
-    # Filter data for this metro
-    metro_data = metro_job_df[metro_job_df['Metro'] == metro]
-    
-    # Create job-task matrix for this metro
-    metro_job_task = job_task_matrix.copy()  # Use same job-task relationships
-    
-    # Calculate complexity
-    job_complexity, task_complexity = calculate_complexity(
-        metro_job_task,
-        metro_data,
+if len(metros):
+    all_metro_job_complexity, all_metro_task_complexity = regional_complexity(
+        job_task_operator,
+        metro_job_df,
+        'Metro',
         region_type='Metro',
-        region_name=metro
+        solver=args.solver, tol=args.tol, max_iter=args.max_iter, reports=solver_reports,
+        warm_start=previous_complexity, change_tol=args.change_tol
     )
     
-    # Add to lists
-    metro_job_complexity_list.append(job_complexity)
-    metro_task_complexity_list.append(task_complexity)
-
-# Combine all metro results
-if metro_job_complexity_list:
-    all_metro_job_complexity = pd.concat(metro_job_complexity_list)
-    all_metro_task_complexity = pd.concat(metro_task_complexity_list)
-    
     # Merge with job and task information
     all_metro_job_complexity = pd.merge(
         all_metro_job_complexity,
@@ -254,6 +208,28 @@ if metro_job_complexity_list:
         how='left'
     )
 
+print("Calculating economic complexity of the states and metropolitan areas...")
+# ECI of every state and metro and OCI of the occupations, from the regions' employment
+job_proximity_df = pd.read_csv(args.job_proximity) if os.path.exists(args.job_proximity) else None
+if job_proximity_df is None:
+    print(f"No job proximity file at {args.job_proximity}; skipping the relatedness density")
+for region_col, region_job_df in (('State', state_job_df), ('Metro', metro_job_df)):
+    if len(region_job_df):
+        region_eci, occupation_oci = economic_complexity(region_job_df, region_col, rca_col=args.lq_column,
+                                                         threshold=args.rca_threshold)
+        region_eci.to_csv(f'data/processed/complexity/{region_col.lower()}_economic_complexity.csv', index=False)
+        occupation_oci.to_csv(f'data/processed/complexity/{region_col.lower()}_occupation_complexity.csv',
+                              index=False)
+
+        # Density of related occupations already present, to rank each region's growth opportunities
+        if job_proximity_df is not None:
+            region_density = relatedness_density(region_job_df, region_col, job_proximity_df,
+                                                 rca_col=args.lq_column, threshold=args.rca_threshold)
+            region_density = pd.merge(region_density, occupation_oci[['O_NET_SOC_Code', 'OCI']],
+                                      on='O_NET_SOC_Code', how='left')
+            region_density.to_csv(f'data/processed/complexity/{region_col.lower()}_relatedness_density.csv',
+                                  index=False)
+
 # Combine all complexity results
 all_job_complexity = pd.concat([
     us_job_complexity,
@@ -270,6 +246,8 @@ all_task_complexity = pd.concat([
 # Save complexity results
 all_job_complexity.to_csv('data/processed/complexity/job_complexity.csv', index=False)
 all_task_complexity.to_csv('data/processed/complexity/task_complexity.csv', index=False)
+solver_report_frame(solver_reports).to_csv('data/processed/complexity/solver_report.csv', index=False)
+write_solver_settings('data/processed/complexity', args.solver, args.tol, args.max_iter)
 
 print("Creating complexity visualizations...")
 # Create scatter plot of wage vs JCI for US
@@ -373,21 +351,16 @@ if 'all_metro_job_complexity' in locals():
     fig.update_layout(width=900, height=700, xaxis_tickangle=-45)
     fig.write_html('visualizations/complexity/metro_jci_comparison.html')
 
-print("Creating Excel file with complexity data...")
-# Create Excel writer
-with pd.ExcelWriter('data/processed/complexity/job_task_complexity_data.xlsx') as writer:
-    # Write US data
-    us_job_complexity.to_excel(writer, sheet_name='US_Job_Complexity', index=False)
-    us_task_complexity.to_excel(writer, sheet_name='US_Task_Complexity', index=False)
-    
-    # Write state data if available
+if args.skip_excel:
+    print("Skipping the Excel file with complexity data (--skip-excel)")
+else:
+    print("Creating Excel file with complexity data...")
+    # US data, then state and metro data if available
+    sheets = [('US_Job_Complexity', us_job_complexity), ('US_Task_Complexity', us_task_complexity)]
     if 'all_state_job_complexity' in locals():
-        all_state_job_complexity.to_excel(writer, sheet_name='State_Job_Complexity', index=False)
-        all_state_task_complexity.to_excel(writer, sheet_name='State_Task_Complexity', index=False)
-    
-    # Write metro data if available
+        sheets += [('State_Job_Complexity', all_state_job_complexity), ('State_Task_Complexity', all_state_task_complexity)]
     if 'all_metro_job_complexity' in locals():
-        all_metro_job_complexity.to_excel(writer, sheet_name='Metro_Job_Complexity', index=False)
-        all_metro_task_complexity.to_excel(writer, sheet_name='Metro_Task_Complexity', index=False)
+        sheets += [('Metro_Job_Complexity', all_metro_job_complexity), ('Metro_Task_Complexity', all_metro_task_complexity)]
+    write_xlsx('data/processed/complexity/job_task_complexity_data.xlsx', sheets, workers=args.workers)
 
 print("Job and task complexity calculation and visualization complete!")
@@ -0,0 +1,902 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator, eigsh
+
+# Solvers of the JCI/TCI fixed point (see solve_complexity)
+SOLVERS = ('reflections', 'power', 'eigs')
+
+# Iterations of the method of reflections in the R script
+REFLECTIONS = 20
+
+# Relative spread below which the reflections have collapsed to a constant
+COLLAPSED_SPREAD = 1e-9
+
+# Defaults of the eigenvector solvers
+EIGEN_TOL = 1e-10
+EIGEN_MAX_ITER = 1000
+
+# Change of a published index, in standard deviations of the region's previous index,
+# beyond which a warm-started recomputation reports a job or task as moved
+CHANGE_TOL = 0.01
+
+# File recording the solver settings of saved results (see write_solver_settings)
+SOLVER_SETTINGS_FILE = 'complexity_solver.json'
+
+# Columns of a wage revision table naming the region a revision is for (see apply_wage_delta)
+REGION_COLUMNS = ('State', 'Metro')
+
+# Monte Carlo draws and percentiles of the uncertainty bands (see calculate_complexity_bands)
+DEFAULT_DRAWS = 1000
+DEFAULT_PERCENTILES = (5, 50, 95)
+
+# Directory of the cached complexity operators (see complexity_operator)
+DEFAULT_OPERATOR_CACHE = 'data/processed/cache/complexity'
+
+
+def job_task_csr(job_task, job_codes=None):
+    """
+    Job x task RCA matrix restricted to the given jobs.
+
+    Parameters:
+    job_task: long DataFrame (O_NET_SOC_Code, DWA_ID, RCA), or a (matrix, job codes,
+              task IDs) tuple as returned by job_task_matrix.load_job_task_matrix
+    job_codes: jobs to keep (default: all)
+
+    Returns:
+    (CSR matrix, job codes of the rows, task IDs of the columns); tasks no kept job
+    performs are left out
+    """
+    if isinstance(job_task, pd.DataFrame):
+        if job_codes is not None:
+            job_task = job_task[job_task['O_NET_SOC_Code'].isin(job_codes)]
+        # For repeated (job, task) pairs the last RCA value counts
+        job_task = job_task.drop_duplicates(['O_NET_SOC_Code', 'DWA_ID'], keep='last')
+        job_positions, row_codes = pd.factorize(job_task['O_NET_SOC_Code'])
+        task_positions, task_ids = pd.factorize(job_task['DWA_ID'])
+        mjt = sparse.csr_matrix((job_task['RCA'].to_numpy(dtype=np.float64), (job_positions, task_positions)),
+                                shape=(len(row_codes), len(task_ids)))
+        mjt.eliminate_zeros()
+        return mjt, np.asarray(row_codes, dtype=object), np.asarray(task_ids, dtype=object)
+
+    mjt, row_codes, task_ids = job_task
+    mjt = sparse.csr_matrix(mjt, dtype=np.float64)
+    row_codes = np.asarray(row_codes, dtype=object)
+    task_ids = np.asarray(task_ids, dtype=object)
+    if job_codes is not None:
+        rows = np.flatnonzero(pd.Index(row_codes).isin(job_codes) & (np.diff(mjt.indptr) > 0))
+        mjt, row_codes = mjt[rows], row_codes[rows]
+    mjt.eliminate_zeros()
+    columns = np.flatnonzero(np.bincount(mjt.indices, minlength=mjt.shape[1]))
+    return mjt[:, columns].tocsr(), row_codes, task_ids[columns]
+
+
+class ComplexityOperator:
+    """
+    Job x task RCA matrix M with everything the complexity iteration derives from it:
+    M in CSR form for the job step, M' in CSR form (the CSC layout of M) for the task
+    step, the binary pattern of M' for the stage-1 wages and the degree vectors nj
+    (sum of RCA over each job's tasks) and nt (over each task's jobs).
+
+    The matrix is the same for every region and every run, so the operator is built
+    once (see complexity_operator) and a region selects its jobs with a presence mask.
+    """
+
+    def __init__(self, matrix, job_codes=None, task_ids=None, matrix_t=None, nj=None, nt=None):
+        self.matrix = sparse.csr_matrix(matrix, dtype=np.float64)
+        n_jobs, n_tasks = self.matrix.shape
+        self.job_codes = np.asarray(np.arange(n_jobs) if job_codes is None else job_codes, dtype=object)
+        self.task_ids = np.asarray(np.arange(n_tasks) if task_ids is None else task_ids, dtype=object)
+        self.matrix_t = self.matrix.T.tocsr() if matrix_t is None else sparse.csr_matrix(matrix_t, dtype=np.float64)
+        self.pattern_t = sparse.csr_matrix((np.ones(self.matrix_t.nnz), self.matrix_t.indices, self.matrix_t.indptr),
+                                           shape=self.matrix_t.shape)
+        self.nj = np.asarray(self.matrix.sum(axis=1)).ravel() if nj is None else np.asarray(nj, dtype=np.float64)
+        self.nt = np.asarray(self.matrix_t.sum(axis=1)).ravel() if nt is None else np.asarray(nt, dtype=np.float64)
+        # Check for zero values to avoid division by zero
+        self.inverse_nj = 1 / np.where(self.nj > 0, self.nj, 1.0)
+        self.job_index = pd.Index(self.job_codes)
+
+    @classmethod
+    def build(cls, job_task):
+        """
+        Build the operator of a job-task table or (matrix, job codes, task IDs) tuple
+        (see job_task_csr).
+        """
+        return cls(*job_task_csr(job_task))
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def digest(self):
+        """
+        Content hash of the matrix and its job codes and task IDs.
+        """
+        return _matrix_digest(self.matrix, self.job_codes, self.task_ids)
+
+    def presence(self, job_codes):
+        """
+        Boolean mask of the operator's jobs that are among job_codes and perform any task.
+        """
+        return self.job_index.isin(job_codes) & (self.nj > 0)
+
+    def task_degrees(self, present=None):
+        """
+        nt counting only the present jobs: one column per column of the jobs (x regions)
+        mask `present` (default: all jobs).
+        """
+        if present is None:
+            return self.nt
+        return self.matrix_t @ np.asarray(present, dtype=np.float64)
+
+    def task_step(self, job_values, nt):
+        """
+        diag(1/nt) M' kj for a jobs (x regions) array kj, zero outside the region's jobs,
+        and the matching task degrees nt (see task_degrees).
+        """
+        return (self.matrix_t @ job_values) / np.where(nt > 0, nt, 1.0)
+
+    def job_step(self, task_values):
+        """
+        diag(1/nj) M kt for a tasks (x regions) array kt.
+        """
+        inverse_nj = self.inverse_nj if np.ndim(task_values) == 1 else self.inverse_nj[:, None]
+        return inverse_nj * (self.matrix @ task_values)
+
+    def apply(self, job_values, present=None):
+        """
+        Job-job operator diag(1/nj) M diag(1/nt) M' applied to a jobs (x k) array of
+        wage vectors, each restricted to the present jobs of its column (default: all).
+        """
+        job_values = np.asarray(job_values, dtype=np.float64)
+        if present is None:
+            nt = self.nt if job_values.ndim == 1 else self.nt[:, None]
+            return self.job_step(self.task_step(job_values, nt))
+        present = np.asarray(present, dtype=bool)
+        result = self.job_step(self.task_step(np.where(present, job_values, 0.0), self.task_degrees(present)))
+        return np.where(present, result, 0.0)
+
+    def save(self, path):
+        """
+        Save the operator as a compressed .npz file.
+        """
+        np.savez_compressed(path, job_codes=self.job_codes.astype(str), task_ids=self.task_ids.astype(str),
+                            data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                            data_t=self.matrix_t.data, indices_t=self.matrix_t.indices,
+                            indptr_t=self.matrix_t.indptr, shape=np.array(self.matrix.shape),
+                            nj=self.nj, nt=self.nt)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an operator saved with save().
+        """
+        with np.load(path) as arrays:
+            shape = tuple(arrays['shape'])
+            matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape)
+            matrix_t = sparse.csr_matrix((arrays['data_t'], arrays['indices_t'], arrays['indptr_t']),
+                                         shape=shape[::-1])
+            return cls(matrix, arrays['job_codes'].astype(object), arrays['task_ids'].astype(object),
+                       matrix_t, arrays['nj'], arrays['nt'])
+
+
+def _matrix_digest(matrix, job_codes, task_ids):
+    digest = hashlib.md5()
+    digest.update(np.asarray(matrix.shape, dtype=np.int64).tobytes())
+    digest.update(np.asarray(matrix.indptr, dtype=np.int64).tobytes())
+    digest.update(np.asarray(matrix.indices, dtype=np.int64).tobytes())
+    digest.update(np.asarray(matrix.data, dtype=np.float64).tobytes())
+    digest.update('\n'.join(map(str, job_codes)).encode())
+    digest.update(b'|')
+    digest.update('\n'.join(map(str, task_ids)).encode())
+    return digest.hexdigest()
+
+
+def _input_digest(job_task):
+    # Content hash of a job-task table or (matrix, job codes, task IDs) tuple as given, so
+    # that a cached operator is found without setting up the CSR matrix first
+    if isinstance(job_task, pd.DataFrame):
+        rows = pd.util.hash_pandas_object(job_task[['O_NET_SOC_Code', 'DWA_ID', 'RCA']], index=False)
+        digest = hashlib.md5(b'table|')
+        digest.update(rows.to_numpy().tobytes())
+        return digest.hexdigest()
+    matrix, job_codes, task_ids = job_task
+    if not (sparse.issparse(matrix) and matrix.format == 'csr'):
+        matrix = sparse.csr_matrix(matrix)
+    return _matrix_digest(matrix, job_codes, task_ids)
+
+
+def complexity_operator(job_task, cache_dir=DEFAULT_OPERATOR_CACHE):
+    """
+    Complexity operator of a job-task matrix, built once and kept in cache_dir under
+    the hash of job_task's content; later runs load it without setting up the matrix again.
+
+    Parameters:
+    job_task: job-task table or (matrix, job codes, task IDs) tuple (see job_task_csr)
+    cache_dir: directory of the cached operators
+
+    Returns:
+    ComplexityOperator
+    """
+    if isinstance(job_task, ComplexityOperator):
+        return job_task
+    path = os.path.join(cache_dir, f"complexity_operator_{_input_digest(job_task)}.npz")
+    if os.path.exists(path):
+        return ComplexityOperator.load(path)
+    operator = ComplexityOperator(*job_task_csr(job_task))
+    os.makedirs(cache_dir, exist_ok=True)
+    operator.save(path)
+    return operator
+
+
+def _region_operator(job_task, job_codes):
+    # Operator and mask of the given jobs: a prebuilt operator is shared as it is, a
+    # table is restricted to the jobs first
+    if isinstance(job_task, ComplexityOperator):
+        return job_task, job_task.presence(job_codes)
+    operator = ComplexityOperator(*job_task_csr(job_task, job_codes))
+    return operator, np.ones(operator.shape[0], dtype=bool)
+
+
+def _column_stats(values):
+    # Mean and standard deviation of the finite entries of each column, and whether it has any
+    finite = np.isfinite(values)
+    count = np.maximum(finite.sum(axis=0), 1)
+    mean = np.where(finite, values, 0.0).sum(axis=0) / count
+    spread = np.sqrt((np.where(finite, values - mean, 0.0) ** 2).sum(axis=0) / count)
+    return mean, spread, finite.any(axis=0)
+
+
+def _standardized(values, present):
+    # z-scores of each column over its present entries (zeros for a constant column), the
+    # scale-free shape of an index
+    values = np.where(present, values, np.nan)
+    mean, spread, _ = _column_stats(values)
+    return np.where(spread > 0, (values - mean) / np.where(spread > 0, spread, 1.0), 0.0)
+
+
+def _change(current, previous, present):
+    # Largest change of the standardized indexes of each column
+    change = np.abs(_standardized(current, present) - _standardized(previous, present))
+    return np.where(np.isfinite(change), change, 0.0).max(axis=0, initial=0.0)
+
+
+def _collapsed(values, present):
+    # Columns whose spread drowned in rounding errors (or that have no finite values left)
+    mean, spread, finite = _column_stats(np.where(present, values, np.nan))
+    return ~finite | ~(spread > COLLAPSED_SPREAD * np.abs(mean))
+
+
+def _on_wage_scale(index, wages, present):
+    # Eigenvectors have no scale or sign: orient them so they increase with wages and map
+    # them to the mean and spread of the wages, the units the reflections produce
+    z = _standardized(index, present)
+    wages = np.where(present, wages, np.nan)
+    mean, spread, _ = _column_stats(wages)
+    both = np.isfinite(wages) & np.isfinite(z)
+    covariance = np.where(both, (wages - mean) * z, 0.0).sum(axis=0)
+    z = np.where(covariance < 0, -z, z)
+    return np.where(present, mean + spread * z, np.nan)
+
+
+def solve_complexity(operator, wages, present=None, solver='reflections', tol=None, max_iter=None, start=None,
+                     monitor=True):
+    """
+    Solve for the job and task complexity indexes of one or many regions sharing a
+    job-task matrix, as one sparse x dense iteration over all regions at once.
+
+    Parameters:
+    operator: ComplexityOperator (or a job x task CSR matrix)
+    wages: jobs x regions array of wages (a 1-d array for one region)
+    present: jobs x regions boolean mask of the jobs of each region (default: all); a
+             region's indexes are those of the matrix restricted to its jobs and their tasks
+    solver: 'reflections' - the method of reflections of the R script, started from the
+                            wages (kj <- diag(1/nj) M kt, kt <- diag(1/nt) M' kj)
+            'power'       - power iteration on the job-job operator
+                            diag(1/nj) M diag(1/nt) M' with the constant vector removed
+            'eigs'        - Lanczos solve for the same eigenvector, on the operator's
+                            symmetric form diag(nj)^-1/2 M diag(1/nt) M' diag(nj)^-1/2
+                            (one solve per region)
+    tol: stop once no standardized index changes by more than tol between iterations
+         (reflections: compared with two iterations back, as jobs and tasks alternate;
+         they stop unconverged when the indexes collapse to a constant);
+         None runs max_iter reflections as the R script does, or uses 1e-10 for the
+         eigenvector solvers. Regions stop iterating independently.
+    max_iter: iteration limit (default 20 reflections, 1000 otherwise)
+    start: jobs x regions initial job indexes of the eigenvector solvers (e.g. a previous
+           solution) instead of the wages; the reflections always start from the wages
+    monitor: compute the residuals of reflections run without tol (NaN otherwise), a few
+             passes over the iterates that large batches of wage vectors can skip
+
+    Returns:
+    (jci, tci, kt1, reports): jobs x regions and tasks x regions arrays (NaN outside each
+    region's jobs and tasks; 1-d for 1-d wages) of the indexes and the stage-1 task wages,
+    and one report per region with the solver, iterations, per-iteration residuals,
+    whether tol was reached and the seconds spent on the whole batch. The eigenvector
+    solvers return indexes mapped to the wage scale (see _on_wage_scale).
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown complexity solver: {solver} (expected one of {', '.join(SOLVERS)})")
+    start_time = time.time()
+    if not isinstance(operator, ComplexityOperator):
+        operator = ComplexityOperator(operator)
+    single = np.ndim(wages) == 1
+    wages = np.asarray(wages, dtype=np.float64).reshape(operator.shape[0], -1)
+    start = wages if start is None else np.asarray(start, dtype=np.float64).reshape(wages.shape)
+    present = np.ones(wages.shape, dtype=bool) if present is None else np.asarray(present, dtype=bool).reshape(wages.shape)
+    regions = wages.shape[1]
+
+    # Number of jobs per task, counting each region's jobs
+    nt = operator.task_degrees(present)
+    tasks = nt > 0
+    nt[~tasks] = 1
+
+    # Stage 1: initial task complexity (average wage), the wages of the jobs performing
+    # each task summed with one sparse product
+    job_wages = np.where(present, wages, 0.0)
+    kt1 = (operator.pattern_t @ job_wages) / nt
+
+    residuals = [[] for _ in range(regions)]
+    active = np.ones(regions, dtype=bool)
+    if solver == 'reflections':
+        max_iter = REFLECTIONS if max_iter is None else max_iter
+        # The last iterates, initial values first; each iterate is compared with the
+        # one two iterations back, computed from the same side (jobs or tasks)
+        history = [(job_wages, kt1)]
+        for i in range(max_iter):
+            if not active.any():
+                break
+            kj, kt = history[-1]
+            kjn = operator.job_step(kt)
+            ktn = operator.task_step(np.where(present, kj, 0.0), nt)
+            # Regions that stopped keep their last iterate
+            kjn[:, ~active] = kj[:, ~active]
+            ktn[:, ~active] = kt[:, ~active]
+            history = history[-2:] + [(kjn, ktn)]
+            if len(history) < 3 or (tol is None and not monitor):
+                residual = np.full(regions, np.nan)
+            else:
+                # The reflections tend to a constant; once their spread drowns in rounding
+                # errors the indexes carry no ordering anymore and cannot converge
+                collapsed = _collapsed(kjn, present)
+                residual = np.maximum(_change(kjn, history[0][0], present), _change(ktn, history[0][1], tasks))
+                residual[collapsed] = np.nan
+            for region in np.flatnonzero(active):
+                residuals[region].append(float(residual[region]))
+            if tol is not None and len(history) == 3:
+                active &= ~(collapsed | (residual <= tol))
+        jci, tci = history[-1]
+    else:
+        tol = EIGEN_TOL if tol is None else tol
+        max_iter = EIGEN_MAX_ITER if max_iter is None else max_iter
+        iterations = np.zeros(regions, dtype=int)
+        if solver == 'power':
+            mean, _, _ = _column_stats(np.where(present, start, np.nan))
+            kj = np.where(present, np.where(np.isnan(start), mean, start), 0.0)
+            for i in range(max_iter):
+                if not active.any():
+                    break
+                kjn = operator.job_step(operator.task_step(kj, nt))
+                kjn = np.where(present, kjn - _column_stats(np.where(present, kjn, np.nan))[0], 0.0)
+                norm = np.linalg.norm(kjn, axis=0)
+                kjn = kjn / np.where(norm > 0, norm, 1.0)
+                kjn[:, ~active] = kj[:, ~active]
+                residual = _change(kjn, kj, present)
+                for region in np.flatnonzero(active):
+                    residuals[region].append(float(residual[region]))
+                active &= ~((residual <= tol) | (norm == 0))
+                kj = kjn
+        else:
+            kj = np.zeros(wages.shape)
+            for region in range(regions):
+                # The region's operator, restricted to its jobs and their tasks; the symmetric
+                # form's eigenvectors y map back to kj = diag(nj)^-1/2 y
+                rows = np.flatnonzero(present[:, region])
+                columns = np.flatnonzero(tasks[:, region])
+                block = operator.matrix[rows][:, columns]
+                block_t = block.T.tocsr()
+                scale = np.sqrt(operator.inverse_nj[rows])
+                inverse_nt = 1 / nt[columns, region]
+                products = []
+                def symmetric(y):
+                    products.append(1)
+                    y = np.ravel(y)
+                    return scale * (block @ (inverse_nt * (block_t @ (scale * y))))
+                size = len(rows)
+                if size > 2:
+                    symmetric_operator = LinearOperator((size, size), matvec=symmetric, dtype=np.float64)
+                    # A finite start vector seeds the Lanczos iteration (y = diag(nj)^1/2 kj)
+                    v0 = start[rows, region] / scale
+                    v0 = v0 if np.isfinite(v0).all() and v0.any() else None
+                    values, vectors = eigsh(symmetric_operator, k=2, which='LA', tol=tol, maxiter=max_iter, v0=v0)
+                elif size > 0:
+                    values, vectors = np.linalg.eigh(np.column_stack([symmetric(e) for e in np.eye(size)]))
+                else:
+                    continue
+                # The leading eigenvector (eigenvalue 1) is the constant one; the next one orders the jobs
+                second = np.argsort(values)[::-1][min(1, len(values) - 1)]
+                y = vectors[:, second]
+                kj[rows, region] = scale * y
+                iterations[region] = len(products)
+                residuals[region].append(float(np.linalg.norm(symmetric(y) - values[second] * y)))
+        jci = _on_wage_scale(kj, wages, present)
+        tci = operator.task_step(np.where(present, jci, 0.0), nt)
+
+    seconds = time.time() - start_time
+    reports = []
+    for region in range(regions):
+        region_residuals = residuals[region]
+        reports.append({'solver': solver,
+                        'iterations': int(iterations[region]) if solver == 'eigs' else len(region_residuals),
+                        'residuals': region_residuals,
+                        'converged': tol is not None and bool(region_residuals) and region_residuals[-1] <= tol,
+                        'seconds': seconds})
+    jci = np.where(present, jci, np.nan)
+    tci = np.where(tasks, tci, np.nan)
+    kt1 = np.where(tasks, kt1, np.nan)
+    if single:
+        return jci[:, 0], tci[:, 0], kt1[:, 0], reports
+    return jci, tci, kt1, reports
+
+
+def _print_report(report):
+    residual = report['residuals'][-1] if report['residuals'] else np.nan
+    print(f"  Solver {report['solver']}: {report['iterations']} iterations, final residual {residual:.2e}, "
+          f"{'converged' if report['converged'] else 'not converged'}, {report['seconds']:.3f}s")
+
+
+def _solver_settings(solver, tol, max_iter):
+    # Solver settings a result was computed with, with the solver's defaults filled in
+    if solver == 'reflections':
+        return {'solver': solver, 'tol': tol, 'max_iter': REFLECTIONS if max_iter is None else max_iter}
+    return {'solver': solver, 'tol': EIGEN_TOL if tol is None else tol,
+            'max_iter': EIGEN_MAX_ITER if max_iter is None else max_iter}
+
+
+def write_solver_settings(directory, solver='reflections', tol=None, max_iter=None):
+    """
+    Record the solver settings of the job_complexity.csv and task_complexity.csv written to
+    directory, so that a later run can revise them (see read_complexity_results).
+    """
+    with open(os.path.join(directory, SOLVER_SETTINGS_FILE), 'w') as f:
+        json.dump(_solver_settings(solver, tol, max_iter), f)
+
+
+def read_complexity_results(directory):
+    """
+    Read the job_complexity.csv and task_complexity.csv of an earlier run, with the solver
+    settings recorded next to them (see write_solver_settings), as the warm_start of
+    calculate_complexity and calculate_complexity_batch.
+
+    Returns:
+    (job_complexity_df, task_complexity_df) with the settings in attrs['complexity_solver']
+    """
+    settings_path = os.path.join(directory, SOLVER_SETTINGS_FILE)
+    if not os.path.exists(settings_path):
+        raise FileNotFoundError(f"No {SOLVER_SETTINGS_FILE} in {directory}: the previous results must come "
+                                f"from a run that recorded its solver settings")
+    with open(settings_path) as f:
+        settings = json.load(f)
+    # Wages are read back exactly, so that unchanged wages show no change
+    job_complexity = pd.read_csv(os.path.join(directory, 'job_complexity.csv'), dtype={'O_NET_SOC_Code': str},
+                                 float_precision='round_trip')
+    task_complexity = pd.read_csv(os.path.join(directory, 'task_complexity.csv'), dtype={'DWA_ID': str},
+                                  float_precision='round_trip')
+    job_complexity.attrs['complexity_solver'] = settings
+    task_complexity.attrs['complexity_solver'] = settings
+    return job_complexity, task_complexity
+
+
+def apply_wage_delta(job_df, wage_delta, region_col=None):
+    """
+    Add wage revisions to the A_MEAN column of job_df.
+
+    Parameters:
+    job_df: DataFrame with job information (O_NET_SOC_Code, A_MEAN and region_col for regional data)
+    wage_delta: Series of wage changes by O_NET_SOC_Code, or DataFrame with O_NET_SOC_Code,
+                Wage_Delta and optionally State and Metro columns: a row naming a region only
+                revises that region, a row naming none revises every region and the US
+                (for repeated rows the last one counts)
+    region_col: column of job_df naming its regions (None for the US)
+
+    Returns:
+    copy of job_df with the revised wages
+    """
+    if isinstance(wage_delta, pd.Series):
+        wage_delta = pd.DataFrame({'O_NET_SOC_Code': wage_delta.index, 'Wage_Delta': wage_delta.to_numpy()})
+    wage_delta = wage_delta.assign(Wage_Delta=pd.to_numeric(wage_delta['Wage_Delta'], errors='coerce').fillna(0))
+    regional = wage_delta[[col for col in REGION_COLUMNS if col in wage_delta.columns]].notna().any(axis=1)
+
+    everywhere = wage_delta[~regional].drop_duplicates('O_NET_SOC_Code', keep='last')
+    change = job_df['O_NET_SOC_Code'].map(everywhere.set_index('O_NET_SOC_Code')['Wage_Delta']).fillna(0)
+    if region_col is not None and region_col in wage_delta.columns:
+        own = wage_delta[wage_delta[region_col].notna()].drop_duplicates([region_col, 'O_NET_SOC_Code'], keep='last')
+        own = own.set_index([region_col, 'O_NET_SOC_Code'])['Wage_Delta']
+        keys = pd.MultiIndex.from_frame(job_df[[region_col, 'O_NET_SOC_Code']])
+        change = change + own.reindex(keys).fillna(0).to_numpy()
+    return job_df.assign(A_MEAN=job_df['A_MEAN'] + change.to_numpy())
+
+
+def _previous_indexes(operator, warm_start, settings, region_type, regions):
+    # Results of an earlier run for the given regions as jobs x regions (JCI, Wage) and
+    # tasks x regions (TCI, Avg_Wage) arrays aligned with the operator, NaN where a region
+    # had no such job or task; they must come from the same solver and iteration limit
+    job_complexity, task_complexity = warm_start
+    previous_settings = job_complexity.attrs.get('complexity_solver')
+    if previous_settings is None:
+        raise ValueError("warm_start must be the (job, task) DataFrames returned by calculate_complexity or "
+                         "read_complexity_results, which record the solver settings they were computed with")
+    if settings['solver'] == 'reflections' and settings['tol'] is not None:
+        raise ValueError("warm_start revises the fixed number of reflections; it cannot be used with tol")
+    keys = ('solver', 'max_iter', 'tol') if settings['solver'] == 'reflections' else ('solver', 'max_iter')
+    mismatch = [key for key in keys if previous_settings.get(key) != settings[key]]
+    if mismatch:
+        raise ValueError("warm_start was computed with " +
+                         ', '.join(f"{key}={previous_settings.get(key)}" for key in mismatch) + ", not " +
+                         ', '.join(f"{key}={settings[key]}" for key in mismatch))
+
+    region_index = pd.Index(regions)
+    previous = {}
+    for frame, labels, code_col, columns in ((job_complexity, operator.job_index, 'O_NET_SOC_Code', ('JCI', 'Wage')),
+                                             (task_complexity, pd.Index(operator.task_ids), 'DWA_ID',
+                                              ('TCI', 'Avg_Wage'))):
+        frame = frame[frame['Region_Type'] == region_type]
+        rows = labels.get_indexer(frame[code_col])
+        columns_of = region_index.get_indexer(frame['Region'])
+        keep = (rows >= 0) & (columns_of >= 0)
+        for col in columns:
+            values = np.full((len(labels), len(region_index)), np.nan)
+            # For repeated rows the last one counts, as in the results of one run
+            values[rows[keep], columns_of[keep]] = frame[col].to_numpy(dtype=np.float64)[keep]
+            previous[col] = values
+    return previous
+
+
+def _solve_from_previous(operator, wages, present, previous, solver, tol, max_iter):
+    # solve_complexity for jobs x regions wages, reusing previous results where given. The
+    # reflections and the stage-1 wages are linear in the wages, so for a region whose jobs
+    # (and so tasks) are those of the previous results, the fixed number of reflections of
+    # the new wages is the previous indexes plus the same reflections of the wage changes:
+    # regions without changes keep their previous indexes and the others only reflect their
+    # changes. Regions whose jobs changed are solved from the wages; the eigenvector
+    # solvers start from the previous JCI.
+    if previous is None:
+        return solve_complexity(operator, wages, present, solver=solver, tol=tol, max_iter=max_iter)
+    if solver != 'reflections':
+        start = np.where(np.isfinite(previous['JCI']), previous['JCI'], wages)
+        jci, tci, kt1, reports = solve_complexity(operator, wages, present, solver=solver, tol=tol,
+                                                  max_iter=max_iter, start=start)
+        for report in reports:
+            report['warm_start'] = 'started'
+        return jci, tci, kt1, reports
+
+    start_time = time.time()
+    tasks = operator.task_degrees(present) > 0
+    same = ((np.isfinite(previous['JCI']) == present).all(axis=0) &
+            (np.isfinite(previous['TCI']) == tasks).all(axis=0))
+    delta = np.where(present, wages - previous['Wage'], 0.0)
+    changed = same & (delta != 0).any(axis=0)
+    cold = ~same
+
+    jci, tci, kt1 = previous['JCI'].copy(), previous['TCI'].copy(), previous['Avg_Wage'].copy()
+    reports = [None] * wages.shape[1]
+    for columns, values, label in ((changed, delta, 'revised'), (cold, wages, 'cold')):
+        if not columns.any():
+            continue
+        # Changes are only reflected, so their residuals are not monitored
+        result = solve_complexity(operator, values[:, columns], present[:, columns], max_iter=max_iter,
+                                  monitor=label == 'cold')
+        if label == 'revised':
+            jci[:, columns] += result[0]
+            tci[:, columns] += result[1]
+            kt1[:, columns] += result[2]
+        else:
+            jci[:, columns], tci[:, columns], kt1[:, columns] = result[:3]
+        for region, report in zip(np.flatnonzero(columns), result[3]):
+            reports[region] = dict(report, warm_start=label)
+    seconds = time.time() - start_time
+    for region in np.flatnonzero(same & ~changed):
+        reports[region] = {'solver': solver, 'iterations': 0, 'residuals': [], 'converged': False,
+                           'warm_start': 'unchanged'}
+    for report in reports:
+        report['seconds'] = seconds
+    return jci, tci, kt1, reports
+
+
+def _moved(current, previous, change_tol):
+    # Published indexes that changed by more than change_tol standard deviations of the
+    # region's previous index (columns of jobs or tasks x regions arrays); appearing or
+    # vanishing counts as moving
+    _, spread, _ = _column_stats(previous)
+    both_missing = np.isnan(current) & np.isnan(previous)
+    return ~both_missing & ~(np.abs(current - previous) <= change_tol * spread)
+
+
+def calculate_complexity(job_task, job_df, region_type='US', region_name='United States',
+                         solver='reflections', tol=None, max_iter=None, reports=None,
+                         warm_start=None, wage_delta=None, change_tol=CHANGE_TOL):
+    """
+    Calculate job complexity index (JCI) and task complexity index (TCI) using the method from the R script.
+
+    Parameters:
+    job_task: job-task relationships, as a DataFrame (O_NET_SOC_Code, DWA_ID, RCA),
+              a (matrix, job codes, task IDs) tuple (see job_task_csr) or a prebuilt
+              ComplexityOperator shared by all regions (see complexity_operator)
+    job_df: DataFrame with job information (O_NET_SOC_Code, wage, employment)
+    region_type: Type of region (US, State, Metro)
+    region_name: Name of the region
+    solver, tol, max_iter: see solve_complexity
+    reports: optional list the solver report of this region is appended to
+    warm_start: results of an earlier run to revise, e.g. after BLS revised some wages: the
+                (job_complexity_df, task_complexity_df) returned by calculate_complexity or
+                read by read_complexity_results (they may hold other regions too), computed
+                with the same solver and max_iter (ValueError otherwise). With the
+                reflections (tol=None only) the indexes are the previous ones plus the
+                reflections of the wage changes since the previous Wage column, which equals
+                a run from the wages; no reflections run when no wage changed, and a region
+                whose jobs changed is solved from the wages. The eigenvector solvers start
+                from the previous JCI.
+    wage_delta: optional wage changes added to job_df's wages (see apply_wage_delta)
+    change_tol: change of a job's JCI or a task's TCI, in standard deviations of the
+                region's previous index, beyond which it counts as moved since warm_start
+
+    Returns:
+    job_complexity_df: DataFrame with job complexity metrics
+    task_complexity_df: DataFrame with task complexity metrics
+    (with warm_start, both have the change of the published index since warm_start in
+    JCI_Change or TCI_Change and whether it moved in Moved, and the solver report lists
+    the codes of the moved jobs and tasks under moved_jobs and moved_tasks. Every
+    reflection averages over the jobs sharing a task, so a wage change shifts the index of
+    every job and task of the region, and a large one moves all of them. The solver
+    settings are kept in job_complexity_df.attrs['complexity_solver'] for later warm starts)
+    """
+    print(f"Calculating complexity for {region_type}: {region_name}")
+
+    # Operator of the job-task matrix and the jobs of job_df among its rows
+    operator, present = _region_operator(job_task, job_df['O_NET_SOC_Code'].unique())
+    tasks = operator.task_degrees(present) > 0
+
+    print(f"  Number of jobs after filtering: {present.sum()}")
+    print(f"  Number of tasks after filtering: {tasks.sum()}")
+
+    # Create wage vector
+    if wage_delta is not None:
+        job_df = apply_wage_delta(job_df, wage_delta)
+    wages = job_df.drop_duplicates('O_NET_SOC_Code').set_index('O_NET_SOC_Code')['A_MEAN']
+    wj = wages.reindex(operator.job_codes).to_numpy(dtype=np.float64)
+
+    settings = _solver_settings(solver, tol, max_iter)
+    previous = None if warm_start is None else _previous_indexes(operator, warm_start, settings, region_type,
+                                                                 [region_name])
+
+    # Stage 1 (average wage of each task's jobs) and Method 2: Iterative method for
+    # complexity calculation, started from the Stage 1 values (or revising the previous results)
+    jci, tci, kt1, (report,) = _solve_from_previous(operator, wj[:, None], present[:, None], previous,
+                                                    solver, tol, max_iter)
+    jci, tci, kt1 = jci[:, 0], tci[:, 0], kt1[:, 0]
+    _print_report(report)
+    if previous is not None:
+        moved_jobs = present & _moved(jci, previous['JCI'][:, 0], change_tol)
+        moved_tasks = tasks & _moved(tci, previous['TCI'][:, 0], change_tol)
+        report['moved_jobs'] = operator.job_codes[moved_jobs].tolist()
+        report['moved_tasks'] = operator.task_ids[moved_tasks].tolist()
+        print(f"  Warm start ({report['warm_start']}): {moved_jobs.sum()} jobs and {moved_tasks.sum()} tasks "
+              f"moved by more than {change_tol:g} standard deviations")
+    if reports is not None:
+        reports.append(dict(report, region_type=region_type, region=region_name))
+
+    # Create DataFrames with results
+    job_complexity_df = pd.DataFrame({
+        'O_NET_SOC_Code': operator.job_codes[present],
+        'JCI': jci[present],
+        'Wage': wj[present],
+        'Region_Type': region_type,
+        'Region': region_name
+    })
+
+    task_complexity_df = pd.DataFrame({
+        'DWA_ID': operator.task_ids[tasks],
+        'TCI': tci[tasks],
+        'Avg_Wage': kt1[tasks],
+        'Region_Type': region_type,
+        'Region': region_name
+    })
+    if previous is not None:
+        job_complexity_df['JCI_Change'] = (jci - previous['JCI'][:, 0])[present]
+        job_complexity_df['Moved'] = moved_jobs[present]
+        task_complexity_df['TCI_Change'] = (tci - previous['TCI'][:, 0])[tasks]
+        task_complexity_df['Moved'] = moved_tasks[tasks]
+    job_complexity_df.attrs['complexity_solver'] = settings
+    task_complexity_df.attrs['complexity_solver'] = settings
+
+    return job_complexity_df, task_complexity_df
+
+
+def calculate_complexity_batch(job_task, region_df, region_col, region_type,
+                               solver='reflections', tol=None, max_iter=None, reports=None,
+                               warm_start=None, change_tol=CHANGE_TOL):
+    """
+    Calculate JCI and TCI of every region in region_df at once: the regions' wage vectors
+    are stacked into a jobs x regions matrix and solved together (see solve_complexity),
+    each region on the jobs it reports. The results equal calculate_complexity called
+    region by region.
+
+    Parameters:
+    job_task: job-task relationships (see calculate_complexity)
+    region_df: DataFrame with job information of all regions (region_col, O_NET_SOC_Code, A_MEAN)
+    region_col: column of region_df naming the regions (e.g. State, Metro)
+    region_type: Type of region (State, Metro)
+    solver, tol, max_iter: see solve_complexity
+    reports: optional list the solver reports of the regions are appended to
+    warm_start, change_tol: results of an earlier run to revise region by region, and the
+                            change beyond which an index counts as moved (see calculate_complexity)
+
+    Returns:
+    job_complexity_df: DataFrame with job complexity metrics of all regions
+    task_complexity_df: DataFrame with task complexity metrics of all regions
+    (both with the columns of calculate_complexity plus region_col)
+    """
+    operator, jobs = _region_operator(job_task, region_df['O_NET_SOC_Code'].unique())
+    job_codes, task_ids = operator.job_codes, operator.task_ids
+    region_df = region_df.drop_duplicates([region_col, 'O_NET_SOC_Code'])
+    rows = operator.job_index.get_indexer(region_df['O_NET_SOC_Code'])
+    region_positions, regions = pd.factorize(region_df[region_col])
+    known = rows >= 0
+    known[known] = jobs[rows[known]]
+
+    # Jobs x regions wage matrix and the mask of each region's jobs
+    wages = np.full((len(job_codes), len(regions)), np.nan)
+    present = np.zeros(wages.shape, dtype=bool)
+    wages[rows[known], region_positions[known]] = region_df['A_MEAN'].to_numpy(dtype=np.float64)[known]
+    present[rows[known], region_positions[known]] = True
+    tasks = operator.task_degrees(present) > 0
+    print(f"Calculating complexity for {len(regions)} {region_type} regions "
+          f"({present.any(axis=1).sum()} jobs, {tasks.any(axis=1).sum()} tasks)")
+
+    settings = _solver_settings(solver, tol, max_iter)
+    previous = None if warm_start is None else _previous_indexes(operator, warm_start, settings, region_type, regions)
+    jci, tci, kt1, region_reports = _solve_from_previous(operator, wages, present, previous, solver, tol, max_iter)
+    iterations = [report['iterations'] for report in region_reports]
+    converged = sum(report['converged'] for report in region_reports)
+    if region_reports:
+        print(f"  Solver {solver}: {min(iterations)}-{max(iterations)} iterations, "
+              f"{converged}/{len(region_reports)} regions converged, {region_reports[0]['seconds']:.3f}s")
+    if previous is not None:
+        moved_jobs = present & _moved(jci, previous['JCI'], change_tol)
+        moved_tasks = tasks & _moved(tci, previous['TCI'], change_tol)
+        for region, report in enumerate(region_reports):
+            report['moved_jobs'] = job_codes[moved_jobs[:, region]].tolist()
+            report['moved_tasks'] = task_ids[moved_tasks[:, region]].tolist()
+        outcomes = pd.Series([report['warm_start'] for report in region_reports]).value_counts()
+        print("  Warm start: " + ', '.join(f"{count} regions {outcome}" for outcome, count in outcomes.items()) +
+              f"; {moved_jobs.sum()} jobs and {moved_tasks.sum()} tasks moved by more than "
+              f"{change_tol:g} standard deviations")
+    if reports is not None:
+        reports.extend(dict(report, region_type=region_type, region=region)
+                       for report, region in zip(region_reports, regions))
+
+    # Long DataFrames with results, region by region
+    region_index, job_index = np.nonzero(present.T)
+    job_complexity_df = pd.DataFrame({
+        'O_NET_SOC_Code': job_codes[job_index],
+        'JCI': jci[job_index, region_index],
+        'Wage': wages[job_index, region_index],
+        'Region_Type': region_type,
+        'Region': np.asarray(regions, dtype=object)[region_index],
+        region_col: np.asarray(regions, dtype=object)[region_index]
+    })
+    if previous is not None:
+        job_complexity_df['JCI_Change'] = (jci - previous['JCI'])[job_index, region_index]
+        job_complexity_df['Moved'] = moved_jobs[job_index, region_index]
+
+    region_index, task_index = np.nonzero(tasks.T)
+    task_complexity_df = pd.DataFrame({
+        'DWA_ID': task_ids[task_index],
+        'TCI': tci[task_index, region_index],
+        'Avg_Wage': kt1[task_index, region_index],
+        'Region_Type': region_type,
+        'Region': np.asarray(regions, dtype=object)[region_index],
+        region_col: np.asarray(regions, dtype=object)[region_index]
+    })
+    if previous is not None:
+        task_complexity_df['TCI_Change'] = (tci - previous['TCI'])[task_index, region_index]
+        task_complexity_df['Moved'] = moved_tasks[task_index, region_index]
+    job_complexity_df.attrs['complexity_solver'] = settings
+    task_complexity_df.attrs['complexity_solver'] = settings
+
+    return job_complexity_df, task_complexity_df
+
+
+def calculate_complexity_bands(job_task, job_df, region_type='US', region_name='United States',
+                               draws=DEFAULT_DRAWS, percentiles=DEFAULT_PERCENTILES, rse_col='MEAN_PRSE',
+                               seed=None, solver='reflections', tol=None, max_iter=None):
+    """
+    Monte Carlo uncertainty bands of JCI and TCI from the relative standard errors of the
+    BLS mean wages (OEWS MEAN_PRSE, datatype 05 'wage_rse'). Every draw perturbs each
+    wage by a normal error with the published RSE, and all draws are solved together as
+    the columns of one jobs x draws block (see solve_complexity).
+
+    Parameters:
+    job_task: job-task relationships (see calculate_complexity)
+    job_df: DataFrame with job information (O_NET_SOC_Code, A_MEAN and rse_col)
+    region_type: Type of region (US, State, Metro)
+    region_name: Name of the region
+    draws: number of wage draws
+    percentiles: percentiles of the bands
+    rse_col: column of job_df with the RSE of the mean wage in percent; jobs without one
+             keep their wage in every draw
+    seed: seed of the random draws
+    solver, tol, max_iter: see solve_complexity
+
+    Returns:
+    job_bands_df: DataFrame with the JCI of the published wages and a JCI_P<p> column per percentile
+    task_bands_df: DataFrame with the TCI of the published wages and a TCI_P<p> column per percentile
+    """
+    print(f"Calculating complexity bands for {region_type}: {region_name} ({draws} draws)")
+
+    operator, present = _region_operator(job_task, job_df['O_NET_SOC_Code'].unique())
+    tasks = operator.task_degrees(present) > 0
+    jobs = job_df.drop_duplicates('O_NET_SOC_Code').set_index('O_NET_SOC_Code')
+    wj = jobs['A_MEAN'].reindex(operator.job_codes).to_numpy(dtype=np.float64)
+    # BLS marks RSEs it does not publish with symbols, which count as no error
+    rse = pd.to_numeric(jobs[rse_col], errors='coerce').reindex(operator.job_codes).fillna(0).to_numpy() / 100
+
+    # Column 0 holds the published wages, the other columns the draws
+    rng = np.random.default_rng(seed)
+    wages = np.empty((len(wj), draws + 1))
+    wages[:, 0] = wj
+    wages[:, 1:] = wj[:, None] * (1 + rse[:, None] * rng.standard_normal((len(wj), draws)))
+    jci, tci, _, reports = solve_complexity(operator, wages, np.repeat(present[:, None], draws + 1, axis=1),
+                                            solver=solver, tol=tol, max_iter=max_iter, monitor=False)
+    print(f"  Solver {solver}: {draws + 1} wage vectors in {reports[0]['seconds']:.3f}s")
+
+    job_bands_df = pd.DataFrame({
+        'O_NET_SOC_Code': operator.job_codes[present],
+        'JCI': jci[present, 0],
+        'Wage': wj[present],
+        'Wage_RSE': rse[present] * 100
+    })
+    for percentile, band in zip(percentiles, np.percentile(jci[present, 1:], percentiles, axis=1)):
+        job_bands_df[f'JCI_P{percentile:g}'] = band
+    job_bands_df['Region_Type'] = region_type
+    job_bands_df['Region'] = region_name
+
+    task_bands_df = pd.DataFrame({
+        'DWA_ID': operator.task_ids[tasks],
+        'TCI': tci[tasks, 0]
+    })
+    for percentile, band in zip(percentiles, np.percentile(tci[tasks, 1:], percentiles, axis=1)):
+        task_bands_df[f'TCI_P{percentile:g}'] = band
+    task_bands_df['Region_Type'] = region_type
+    task_bands_df['Region'] = region_name
+
+    return job_bands_df, task_bands_df
+
+
+def solver_report_frame(reports):
+    """
+    Long table of solver reports (see calculate_complexity): one row per region and
+    iteration with the residual, plus the region's iteration count, convergence and time.
+    """
+    rows = []
+    for report in reports:
+        residuals = report['residuals'] or [np.nan]
+        rows.append(pd.DataFrame({
+            'Region_Type': report['region_type'],
+            'Region': report['region'],
+            'Solver': report['solver'],
+            'Iteration': np.arange(1, len(residuals) + 1),
+            'Residual': residuals,
+            'Iterations': report['iterations'],
+            'Converged': report['converged'],
+            'Seconds': report['seconds'],
+        }))
+    if not rows:
+        return pd.DataFrame(columns=['Region_Type', 'Region', 'Solver', 'Iteration', 'Residual',
+                                     'Iterations', 'Converged', 'Seconds'])
+    return pd.concat(rows, ignore_index=True)
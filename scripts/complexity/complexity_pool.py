@@ -0,0 +1,170 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# The worker pool context is shared with the data processing scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_processing'))
+from worker_pool import pool_context
+from complexity_engine import CHANGE_TOL, ComplexityOperator, calculate_complexity
+
+# Arrays of a ComplexityOperator placed in shared memory (see _share_operator)
+SHARED_ARRAYS = ('data', 'indices', 'indptr', 'data_t', 'indices_t', 'indptr_t', 'nj', 'nt')
+
+# Operator of the worker processes, attached to the shared memory block once per worker
+_worker_state = {}
+
+
+def _operator_arrays(operator):
+    return {'data': operator.matrix.data, 'indices': operator.matrix.indices, 'indptr': operator.matrix.indptr,
+            'data_t': operator.matrix_t.data, 'indices_t': operator.matrix_t.indices,
+            'indptr_t': operator.matrix_t.indptr, 'nj': operator.nj, 'nt': operator.nt}
+
+
+def _share_operator(operator):
+    # Copy the operator's arrays into one shared memory block, each at an 8-byte aligned
+    # offset; the layout lists (name, dtype, shape, offset) of every array
+    arrays = _operator_arrays(operator)
+    layout = []
+    size = 0
+    for name in SHARED_ARRAYS:
+        array = arrays[name]
+        size = -(-size // 8) * 8
+        layout.append((name, array.dtype.str, array.shape, size))
+        size += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for name, dtype, shape, offset in layout:
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)[...] = arrays[name]
+    return block, layout
+
+
+def _attach_operator(block_name, layout, shape, job_codes, task_ids):
+    # Worker initializer: rebuild the operator on views of the shared arrays (no copies)
+    block = shared_memory.SharedMemory(name=block_name)
+    arrays = {name: np.ndarray(array_shape, dtype=dtype, buffer=block.buf, offset=offset)
+              for name, dtype, array_shape, offset in layout}
+    matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape)
+    matrix_t = sparse.csr_matrix((arrays['data_t'], arrays['indices_t'], arrays['indptr_t']), shape=shape[::-1])
+    _worker_state['block'] = block
+    _worker_state['operator'] = ComplexityOperator(matrix, job_codes, task_ids, matrix_t, arrays['nj'], arrays['nt'])
+
+
+def _solve_region(operator, task):
+    region, job_df, job_task, options = task
+    reports = []
+    job_complexity, task_complexity = calculate_complexity(operator if job_task is None else job_task, job_df,
+                                                           region_name=region, reports=reports, **options)
+    return region, job_complexity, task_complexity, reports[0]
+
+
+def _region_complexity(task):
+    # Worker entry point: one region on the shared operator (or the region's own matrix)
+    return _solve_region(_worker_state['operator'], task)
+
+
+def iter_region_complexity(job_task, region_df, region_col, region_type, workers=1, region_job_task=None,
+                           solver='reflections', tol=None, max_iter=None, warm_start=None, change_tol=CHANGE_TOL):
+    """
+    Run calculate_complexity for every region of region_df across a process pool and
+    yield each region's results as soon as it finishes.
+
+    The arrays of the shared job-task operator are put in one shared memory block that
+    every worker attaches to once, so a task only carries its region's jobs (and, for
+    regions with their own matrix, that matrix).
+
+    Parameters:
+    job_task: ComplexityOperator, job-task table or (matrix, job codes, task IDs) tuple
+              shared by the regions (see calculate_complexity)
+    region_df: DataFrame with job information of all regions (region_col, O_NET_SOC_Code, A_MEAN)
+    region_col: column of region_df naming the regions (e.g. State, Metro)
+    region_type: Type of region (State, Metro)
+    workers: number of worker processes (1 solves the regions in this process)
+    region_job_task: optional dict of region -> job-task table or tuple for regions that
+                     need their own matrix (e.g. regional RCA or task sets)
+    solver, tol, max_iter: see solve_complexity
+    warm_start, change_tol: results of an earlier run to revise (see calculate_complexity);
+                            every task only carries its region's rows of them
+
+    Yields:
+    (region, job_complexity_df, task_complexity_df, report), in the order the regions
+    finish; the DataFrames carry region_col like calculate_complexity_batch's
+    """
+    operator = job_task if isinstance(job_task, ComplexityOperator) else ComplexityOperator.build(job_task)
+    region_job_task = region_job_task or {}
+    options = {'region_type': region_type, 'solver': solver, 'tol': tol, 'max_iter': max_iter,
+               'change_tol': change_tol}
+    tasks = [(region, jobs, region_job_task.get(region), options)
+             for region, jobs in region_df.groupby(region_col, sort=False)]
+    if warm_start is not None:
+        job_previous, task_previous = (frame[frame['Region_Type'] == region_type] for frame in warm_start)
+        job_previous = dict(list(job_previous.groupby('Region', sort=False)))
+        task_previous = dict(list(task_previous.groupby('Region', sort=False)))
+        empty = tuple(frame.iloc[:0] for frame in warm_start)
+        tasks = [(region, jobs, own_job_task, dict(region_options, warm_start=(job_previous.get(region, empty[0]),
+                                                                               task_previous.get(region, empty[1]))))
+                 for region, jobs, own_job_task, region_options in tasks]
+
+    def labelled(result):
+        region, job_complexity, task_complexity, report = result
+        job_complexity[region_col] = region
+        task_complexity[region_col] = region
+        return region, job_complexity, task_complexity, report
+
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield labelled(_solve_region(operator, task))
+        return
+
+    block, layout = _share_operator(operator)
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=pool_context(),
+                                 initializer=_attach_operator,
+                                 initargs=(block.name, layout, operator.shape, operator.job_codes,
+                                           operator.task_ids)) as pool:
+            futures = [pool.submit(_region_complexity, task) for task in tasks]
+            try:
+                for future in as_completed(futures):
+                    yield labelled(future.result())
+            finally:
+                # Regions not started yet are dropped when the caller stops early
+                for future in futures:
+                    future.cancel()
+    finally:
+        block.close()
+        block.unlink()
+
+
+def calculate_complexity_pool(job_task, region_df, region_col, region_type, workers=1, region_job_task=None,
+                              solver='reflections', tol=None, max_iter=None, reports=None,
+                              warm_start=None, change_tol=CHANGE_TOL):
+    """
+    Calculate JCI and TCI of every region in region_df, one region per task of a process
+    pool (see iter_region_complexity).
+
+    Parameters:
+    job_task, region_df, region_col, region_type, workers, region_job_task: see iter_region_complexity
+    solver, tol, max_iter: see solve_complexity
+    reports: optional list the solver reports of the regions are appended to
+    warm_start, change_tol: see calculate_complexity
+
+    Returns:
+    job_complexity_df, task_complexity_df: as calculate_complexity_batch, regions in the
+    order of region_df
+    """
+    results = {}
+    for region, job_complexity, task_complexity, report in iter_region_complexity(
+            job_task, region_df, region_col, region_type, workers, region_job_task,
+            solver=solver, tol=tol, max_iter=max_iter, warm_start=warm_start, change_tol=change_tol):
+        results[region] = (job_complexity, task_complexity, report)
+
+    regions = [region for region in pd.unique(region_df[region_col]) if region in results]
+    if reports is not None:
+        reports.extend(results[region][2] for region in regions)
+    if not regions:
+        return pd.DataFrame(), pd.DataFrame()
+    return (pd.concat([results[region][0] for region in regions], ignore_index=True),
+            pd.concat([results[region][1] for region in regions], ignore_index=True))
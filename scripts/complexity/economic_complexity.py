@@ -0,0 +1,249 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator, eigsh
+
+# RCA is computed the same way as for the job-task matrix of the data processing scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_processing'))
+from job_task_matrix import revealed_comparative_advantage
+
+# RCA from which a region counts as specialized in an occupation
+RCA_THRESHOLD = 1.0
+
+# Regions per block of the relatedness density product
+DEFAULT_BLOCK_SIZE = 64
+
+
+def region_occupation_matrix(df, region_col, occupation_col='O_NET_SOC_Code', value_col='TOT_EMP',
+                             regions=None, occupations=None):
+    """
+    Region x occupation sparse matrix of a long table (e.g. employment by area and occupation).
+
+    Parameters:
+    df: long DataFrame with one row per region and occupation (for repeated pairs the last row counts)
+    region_col, occupation_col: columns naming the regions and occupations
+    value_col: column with the values; missing values and BLS markers ('**', '#') are left out
+    regions, occupations: optional row and column labels to use (other rows are left out)
+
+    Returns:
+    (CSR matrix, region labels of the rows, occupation labels of the columns)
+    """
+    df = df.drop_duplicates([region_col, occupation_col], keep='last')
+    values = pd.to_numeric(df[value_col], errors='coerce').to_numpy(dtype=np.float64)
+    if regions is None:
+        region_positions, regions = pd.factorize(df[region_col])
+    else:
+        region_positions = pd.Index(regions).get_indexer(df[region_col])
+    if occupations is None:
+        occupation_positions, occupations = pd.factorize(df[occupation_col])
+    else:
+        occupation_positions = pd.Index(occupations).get_indexer(df[occupation_col])
+    keep = np.isfinite(values) & (region_positions >= 0) & (occupation_positions >= 0)
+    matrix = sparse.csr_matrix((values[keep], (region_positions[keep], occupation_positions[keep])),
+                               shape=(len(regions), len(occupations)))
+    matrix.eliminate_zeros()
+    return matrix, np.asarray(regions, dtype=object), np.asarray(occupations, dtype=object)
+
+
+def region_occupation_rca(df, region_col, occupation_col='O_NET_SOC_Code', employment_col='TOT_EMP', rca_col=None):
+    """
+    RCA of every region and occupation: the location quotient of the employment, or the
+    published location quotient where rca_col gives one.
+
+    Parameters:
+    df, region_col, occupation_col, employment_col, rca_col: see economic_complexity
+
+    Returns:
+    (CSR matrix of RCA values, region labels of the rows, occupation labels of the columns)
+    """
+    employment, regions, occupations = region_occupation_matrix(df, region_col, occupation_col, employment_col)
+    rca = revealed_comparative_advantage(employment)
+    if rca_col is not None and rca_col in df.columns:
+        quotients, _, _ = region_occupation_matrix(df, region_col, occupation_col, rca_col, regions, occupations)
+        published = quotients.copy()
+        published.data[:] = 1
+        rca = sparse.csr_matrix(rca - rca.multiply(published) + quotients)
+    return rca, regions, occupations
+
+
+def proximity_matrix(proximity_df, occupations, source_col='Job1', target_col='Job2', value_col='Proximity'):
+    """
+    Symmetric occupation x occupation proximity matrix of an edge list such as job_proximity.csv.
+
+    Parameters:
+    proximity_df: DataFrame with one row per pair of occupations
+    occupations: occupation labels of the rows and columns; pairs with other occupations are left out
+    source_col, target_col, value_col: columns with the two occupations and their proximity
+
+    Returns:
+    CSR matrix with the proximity of every listed pair in both directions (no diagonal)
+    """
+    index = pd.Index(occupations)
+    sources = index.get_indexer(proximity_df[source_col])
+    targets = index.get_indexer(proximity_df[target_col])
+    values = pd.to_numeric(proximity_df[value_col], errors='coerce').to_numpy(dtype=np.float64)
+    keep = (sources >= 0) & (targets >= 0) & (sources != targets) & np.isfinite(values) & (values > 0)
+    sources, targets, values = sources[keep], targets[keep], values[keep]
+    proximity = sparse.coo_matrix((values, (sources, targets)), shape=(len(index), len(index))).tocsr()
+    # Pairs listed in both directions keep their larger proximity
+    return proximity.maximum(proximity.T).tocsr()
+
+
+def iter_relatedness_density(presence, proximity, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Relatedness density of every region and occupation, block_size regions at a time.
+
+    The density of occupation o in region r is the share of o's proximity that falls on
+    occupations r is specialized in: sum_p M_rp phi_op / sum_p phi_op. Each block is the
+    sparse product of block_size rows of M with the row-normalized proximity matrix, so
+    memory stays bounded by the block however many regions there are.
+
+    Parameters:
+    presence: region x occupation presence matrix M (1 where RCA >= threshold)
+    proximity: occupation x occupation proximity matrix (see proximity_matrix)
+    block_size: regions per block
+
+    Yields:
+    (first row of the block, CSR matrix of the block's densities)
+    """
+    presence = sparse.csr_matrix(presence, dtype=np.float64)
+    totals = np.asarray(proximity.sum(axis=1)).ravel()
+    inverse_totals = np.divide(1, totals, out=np.zeros_like(totals), where=totals > 0)
+    weights_t = sparse.csr_matrix(sparse.diags(inverse_totals) @ proximity).T.tocsr()
+    for start in range(0, presence.shape[0], block_size):
+        yield start, sparse.csr_matrix(presence[start:start + block_size] @ weights_t)
+
+
+def _second_eigenvector(presence, diversity, ubiquity):
+    # Eigenvector of the second largest eigenvalue of diag(1/kr) M diag(1/ko) M', from the
+    # symmetric form diag(kr)^-1/2 M diag(1/ko) M' diag(kr)^-1/2 (eigenvector y -> diag(kr)^-1/2 y)
+    scale = 1 / np.sqrt(diversity)
+    presence_t = presence.T.tocsr()
+    inverse_ubiquity = 1 / ubiquity
+
+    def symmetric(y):
+        y = np.ravel(y)
+        return scale * (presence @ (inverse_ubiquity * (presence_t @ (scale * y))))
+
+    size = presence.shape[0]
+    if size > 2:
+        operator = LinearOperator((size, size), matvec=symmetric, dtype=np.float64)
+        # A fixed start vector keeps the result reproducible
+        start = np.random.default_rng(0).random(size)
+        values, vectors = eigsh(operator, k=2, which='LA', v0=start)
+    else:
+        values, vectors = np.linalg.eigh(np.column_stack([symmetric(e) for e in np.eye(size)]))
+    second = np.argsort(values)[::-1][min(1, len(values) - 1)]
+    return scale * vectors[:, second]
+
+
+def _z_scores(values):
+    spread = values.std()
+    return (values - values.mean()) / spread if spread > 0 else np.zeros(len(values))
+
+
+def economic_complexity(df, region_col, occupation_col='O_NET_SOC_Code', employment_col='TOT_EMP',
+                        rca_col=None, threshold=RCA_THRESHOLD):
+    """
+    Hidalgo-Hausmann complexity of regions (ECI) and occupations (OCI) from regional employment.
+
+    The RCA of every region and occupation (the location quotient of its employment) gives
+    the binary presence matrix M = [RCA >= threshold], with the diversity kr of the regions
+    and the ubiquity ko of the occupations as its row and column sums. ECI is the eigenvector
+    of the second largest eigenvalue of diag(1/kr) M diag(1/ko) M' and OCI = diag(1/ko) M' ECI;
+    both are standardized and oriented so that ECI increases with diversity.
+
+    Parameters:
+    df: long DataFrame with employment by region and occupation (e.g. state_job_data.csv)
+    region_col: column naming the regions (e.g. State, Metro)
+    occupation_col: column with the occupation codes
+    employment_col: column with the employment
+    rca_col: optional column with published location quotients (OEWS LOC_QUOTIENT, datatype
+             17 'location_quotient'), which replace the computed RCA where they are given;
+             ignored when df does not have it
+    threshold: RCA from which a region counts as specialized in an occupation
+
+    Returns:
+    region_df: DataFrame with region_col, ECI, Diversity and Employment for each region
+    occupation_df: DataFrame with occupation_col, OCI, Ubiquity and Employment for each occupation
+    (regions and occupations without any specialization get NaN indexes)
+    """
+    employment, regions, occupations = region_occupation_matrix(df, region_col, occupation_col, employment_col)
+    rca, _, _ = region_occupation_rca(df, region_col, occupation_col, employment_col, rca_col)
+    presence = sparse.csr_matrix(rca >= threshold, dtype=np.float64)
+    diversity = np.asarray(presence.sum(axis=1)).ravel()
+    ubiquity = np.asarray(presence.sum(axis=0)).ravel()
+    rows = np.flatnonzero(diversity > 0)
+    columns = np.flatnonzero(ubiquity > 0)
+
+    eci = np.full(len(regions), np.nan)
+    oci = np.full(len(occupations), np.nan)
+    if len(rows) and len(columns):
+        block = presence[rows][:, columns]
+        region_values = _second_eigenvector(block, diversity[rows], ubiquity[columns])
+        if np.dot(region_values - region_values.mean(), diversity[rows] - diversity[rows].mean()) < 0:
+            region_values = -region_values
+        occupation_values = (block.T @ region_values) / ubiquity[columns]
+        eci[rows] = _z_scores(region_values)
+        oci[columns] = _z_scores(occupation_values)
+
+    region_df = pd.DataFrame({
+        region_col: regions,
+        'ECI': eci,
+        'Diversity': diversity.astype(int),
+        'Employment': np.asarray(employment.sum(axis=1)).ravel()
+    })
+    occupation_df = pd.DataFrame({
+        occupation_col: occupations,
+        'OCI': oci,
+        'Ubiquity': ubiquity.astype(int),
+        'Employment': np.asarray(employment.sum(axis=0)).ravel()
+    })
+    return region_df, occupation_df
+
+
+def relatedness_density(df, region_col, proximity_df, occupation_col='O_NET_SOC_Code', employment_col='TOT_EMP',
+                        rca_col=None, threshold=RCA_THRESHOLD, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Relatedness density of every region and occupation, with the growth opportunities of
+    each region ranked by density.
+
+    Parameters:
+    df, region_col, occupation_col, employment_col, rca_col, threshold: see economic_complexity
+    proximity_df: occupation proximity edge list (job_proximity.csv: Job1, Job2, Proximity)
+    block_size: regions per block of the density product (see iter_relatedness_density)
+
+    Returns:
+    DataFrame with region_col, occupation_col, Density, RCA, Present and Opportunity_Rank
+    for every region and occupation the region is specialized in or has a nonzero density
+    for; Opportunity_Rank ranks the occupations a region is not specialized in (1 = densest)
+    """
+    rca, regions, occupations = region_occupation_rca(df, region_col, occupation_col, employment_col, rca_col)
+    presence = sparse.csr_matrix(rca >= threshold, dtype=np.float64)
+    proximity = proximity_matrix(proximity_df, occupations)
+
+    blocks = []
+    for start, density in iter_relatedness_density(presence, proximity, block_size):
+        stop = start + density.shape[0]
+        # A block is small enough to read densely: block_size x occupations
+        density = density.toarray()
+        present = presence[start:stop].toarray() > 0
+        rows, columns = np.nonzero((density > 0) | present)
+        blocks.append(pd.DataFrame({
+            region_col: regions[start + rows],
+            occupation_col: occupations[columns],
+            'Density': density[rows, columns],
+            'RCA': rca[start:stop].toarray()[rows, columns],
+            'Present': present[rows, columns]
+        }))
+    if not blocks:
+        return pd.DataFrame(columns=[region_col, occupation_col, 'Density', 'RCA', 'Present', 'Opportunity_Rank'])
+
+    result = pd.concat(blocks, ignore_index=True)
+    opportunities = ~result['Present']
+    result['Opportunity_Rank'] = (result.loc[opportunities].groupby(region_col, sort=False)['Density']
+                                  .rank(ascending=False, method='first'))
+    return result
@@ -0,0 +1,29 @@
+import argparse
+import time
+
+from onet_cache import DEFAULT_CACHE_ROOT, build_onet_cache, latest_onet_cache
+from job_task_matrix import DEFAULT_MATRIX_PATH, DEFAULT_SCALE, build_job_task_matrix, save_job_task_matrix
+
+parser = argparse.ArgumentParser(description="Build the job-task RCA matrix from O*NET Task Ratings and Tasks to DWAs")
+parser.add_argument('--release', default=None,
+                    help="O*NET release directory or .zip to convert first (default: newest release in the cache)")
+parser.add_argument('--cache', default=DEFAULT_CACHE_ROOT,
+                    help="Root directory of the O*NET cache")
+parser.add_argument('--output', default=DEFAULT_MATRIX_PATH,
+                    help="Path of the compressed sparse matrix (.npz)")
+parser.add_argument('--scale', default=DEFAULT_SCALE,
+                    help="Scale ID of the task ratings weighting each occupation's tasks")
+parser.add_argument('--soc', action='store_true',
+                    help="Roll O*NET-SOC occupations up to BLS SOC codes before computing RCA")
+args = parser.parse_args()
+
+start_time = time.time()
+cache_dir = build_onet_cache(args.release, args.cache) if args.release else latest_onet_cache(args.cache)
+if cache_dir is None:
+    raise SystemExit(f"No O*NET release cached in {args.cache}; pass --release")
+
+print(f"Building the job-task RCA matrix from {cache_dir}...")
+matrix, job_codes, task_ids = build_job_task_matrix(cache_dir, scale=args.scale, soc_level=args.soc)
+save_job_task_matrix(args.output, matrix, job_codes, task_ids)
+print(f"Saved {len(job_codes)} jobs x {len(task_ids)} tasks ({matrix.nnz} nonzeros) to {args.output} "
+      f"in {time.time() - start_time:.1f}s")
@@ -0,0 +1,34 @@
+import argparse
+import os
+import time
+
+from oews_panel import build_panel
+
+parser = argparse.ArgumentParser(description="Build the multi-year OEWS panel (yearly_job_data.csv) from yearly releases")
+parser.add_argument('--releases', default='data/raw/bls/releases',
+                    help="Directory with the yearly releases (oesm[YY]nat/st/ma.zip or the extracted *_M[YYYY]_dl.xlsx files)")
+parser.add_argument('--output', default='data/processed/yearly_job_data.csv',
+                    help="Path of the panel CSV")
+parser.add_argument('--work-dir', default='data/processed/panel',
+                    help="Directory of the per-year Parquet parts; unchanged years are not read again")
+parser.add_argument('--workers', type=int, default=1,
+                    help="Number of worker processes, each reading one release year (each holds a whole year's "
+                         "workbooks in memory)")
+parser.add_argument('--soc-crosswalk', default='data/raw/bls/soc_2010_to_2018_crosswalk.xlsx',
+                    help="SOC 2010 to SOC 2018 crosswalk used to harmonize older years")
+parser.add_argument('--complexity', default='data/processed/complexity/job_complexity.csv',
+                    help="Job complexity table providing the complexity_score column (soc_code/job_complexity "
+                         "or O_NET_SOC_Code/JCI, as written by the processing and complexity scripts)")
+args = parser.parse_args()
+
+if not os.path.exists(args.soc_crosswalk):
+    print(f"Warning: {args.soc_crosswalk} not found, occupation codes are left in their release's SOC vintage")
+
+print(f"Building the OEWS panel from {args.releases}...")
+start_time = time.time()
+result = build_panel(args.releases, args.output, args.work_dir, workers=args.workers,
+                     crosswalk_path=args.soc_crosswalk, complexity_path=args.complexity)
+
+print(f"Years in the panel: {', '.join(str(year) for year in result['years'])}")
+print(f"Years read in this run: {', '.join(str(year) for year in result['ingested']) or 'none (all unchanged)'}")
+print(f"Saved {result['rows']} rows to {args.output} in {time.time() - start_time:.1f}s")
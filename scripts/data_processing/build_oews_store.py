@@ -0,0 +1,25 @@
+import argparse
+import time
+
+from oews_reader import DEFAULT_BLOCK_BYTES
+from oews_store import build_alldata_store
+
+parser = argparse.ArgumentParser(description="Convert the BLS AllData file into a partitioned Parquet store")
+parser.add_argument('--input', default='/home/ubuntu/upload/oe.data.1.AllData.txt',
+                    help="Path of the BLS oe.data.1.AllData.txt file (.zip, .gz and .xz are read without extracting)")
+parser.add_argument('--store', default='data/processed/bls_store',
+                    help="Directory of the store (partitioned by areatype and datatype)")
+parser.add_argument('--workers', type=int, default=1,
+                    help="Number of worker processes converting byte ranges of the input in parallel")
+args = parser.parse_args()
+
+print(f"Converting {args.input} into {args.store}...")
+start_time = time.time()
+manifest = build_alldata_store(args.input, args.store, workers=args.workers, block_bytes=DEFAULT_BLOCK_BYTES)
+
+print(f"Stored {manifest['rows']} rows in {time.time() - start_time:.1f}s")
+print(f"Unique area codes: {len(manifest['area_codes'])}")
+print(f"Unique occupation codes: {len(manifest['occupation_codes'])}")
+print("Rows per data type:")
+for datatype, count in manifest['datatype_counts'].items():
+    print(f"  {datatype}: {count}")
@@ -0,0 +1,22 @@
+import argparse
+import time
+
+from onet_cache import DEFAULT_CACHE_ROOT, build_onet_cache, load_onet_manifest
+
+parser = argparse.ArgumentParser(description="Convert an O*NET Excel release into a versioned Parquet cache")
+parser.add_argument('--release', default='data/onet/db_29_3_excel',
+                    help="O*NET release directory with the .xlsx workbooks (or the release .zip)")
+parser.add_argument('--cache', default=DEFAULT_CACHE_ROOT,
+                    help="Root directory of the cache; every release gets its own subdirectory")
+parser.add_argument('--workers', type=int, default=1,
+                    help="Number of worker processes converting workbooks in parallel")
+args = parser.parse_args()
+
+print(f"Converting {args.release} into {args.cache}...")
+start_time = time.time()
+cache_dir = build_onet_cache(args.release, args.cache, workers=args.workers)
+manifest = load_onet_manifest(cache_dir)
+
+print(f"Cached release {manifest['release']} in {cache_dir} ({time.time() - start_time:.1f}s)")
+for table, entry in manifest['tables'].items():
+    print(f"  {table}: {entry['rows']} rows, {len(entry['columns'])} columns")
@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from onet_cache import load_onet_table
+from onet_crosswalk import ONET_CODE_COLUMN, onet_crosswalk
+
+DEFAULT_MATRIX_PATH = 'data/processed/job_task_matrix.npz'
+
+# Task ratings scale weighting the tasks of an occupation (IM: importance, 1-5)
+DEFAULT_SCALE = 'IM'
+
+
+def occupation_task_weights(cache_dir, scale=DEFAULT_SCALE):
+    """
+    Occupation x DWA weights of an O*NET release: the ratings (on `scale`) of each
+    occupation's tasks summed over the detailed work activities (DWAs) they are linked to.
+
+    Parameters:
+    cache_dir: cache directory of the release (see onet_cache.build_onet_cache)
+    scale: Scale ID of the Task Ratings used as weights
+
+    Returns:
+    (CSR matrix of weights, O*NET-SOC codes of the rows, DWA IDs of the columns)
+    """
+    ratings = load_onet_table(cache_dir, 'Task Ratings',
+                              columns=[ONET_CODE_COLUMN, 'Task ID', 'Scale ID', 'Data Value', 'Recommend Suppress'],
+                              filters=[('Scale ID', '==', scale)])
+    ratings = ratings[ratings['Recommend Suppress'].astype(str) != 'Y']
+    links = load_onet_table(cache_dir, 'Tasks to DWAs', columns=[ONET_CODE_COLUMN, 'Task ID', 'DWA ID'])
+
+    # Categorical columns of different tables do not share categories, so join on plain values
+    ratings = pd.DataFrame({'code': ratings[ONET_CODE_COLUMN].astype(str).to_numpy(),
+                            'task': pd.to_numeric(ratings['Task ID']).to_numpy(),
+                            'weight': pd.to_numeric(ratings['Data Value'], errors='coerce').to_numpy()})
+    links = pd.DataFrame({'code': links[ONET_CODE_COLUMN].astype(str).to_numpy(),
+                          'task': pd.to_numeric(links['Task ID']).to_numpy(),
+                          'dwa': links['DWA ID'].astype(str).to_numpy()})
+    rated = links.merge(ratings.dropna(subset=['weight']), on=['code', 'task'], how='inner')
+
+    job_positions, job_codes = pd.factorize(rated['code'], sort=True)
+    task_positions, task_ids = pd.factorize(rated['dwa'], sort=True)
+    weights = sparse.csr_matrix((rated['weight'].to_numpy(dtype=float), (job_positions, task_positions)),
+                                shape=(len(job_codes), len(task_ids)))
+    weights.sum_duplicates()
+    return weights, np.asarray(job_codes, dtype=object), np.asarray(task_ids, dtype=object)
+
+
+def revealed_comparative_advantage(weights):
+    """
+    RCA of every nonzero entry of a job x task weight matrix:
+    (x_jt / sum_t x_jt) / (sum_j x_jt / sum_jt x_jt).
+
+    Only the stored entries are touched; the result has the sparsity pattern of `weights`.
+    """
+    weights = sparse.csr_matrix(weights, dtype=np.float64)
+    weights.eliminate_zeros()
+    row_totals = np.asarray(weights.sum(axis=1)).ravel()
+    column_totals = np.asarray(weights.sum(axis=0)).ravel()
+    rows = np.repeat(np.arange(weights.shape[0]), np.diff(weights.indptr))
+    rca = weights.copy()
+    rca.data = weights.data * weights.data.sum() / (row_totals[rows] * column_totals[weights.indices])
+    return rca
+
+
+def build_job_task_matrix(cache_dir, scale=DEFAULT_SCALE, soc_level=False):
+    """
+    Job x task (DWA) RCA matrix of an O*NET release.
+
+    Parameters:
+    cache_dir: cache directory of the release
+    scale: Scale ID of the Task Ratings used as weights
+    soc_level: roll the O*NET-SOC occupations up to BLS SOC codes (with the release's
+               crosswalk) before computing RCA
+
+    Returns:
+    (CSR matrix of RCA values, job codes of the rows, DWA IDs of the columns)
+    """
+    weights, job_codes, task_ids = occupation_task_weights(cache_dir, scale)
+    if soc_level:
+        crosswalk = onet_crosswalk(cache_dir)
+        columns = crosswalk.onet_index.get_indexer(job_codes)
+        known = columns >= 0
+        selection = sparse.csr_matrix((np.ones(known.sum()), (columns[known], np.flatnonzero(known))),
+                                      shape=(len(crosswalk.onet_codes), len(job_codes)))
+        weights = crosswalk.matrix @ selection @ weights
+        job_codes = crosswalk.soc_codes
+    return revealed_comparative_advantage(weights), job_codes, task_ids
+
+
+def save_job_task_matrix(path, matrix, job_codes, task_ids):
+    """
+    Save a job x task matrix with its code index arrays as a compressed .npz file.
+    """
+    matrix = sparse.csr_matrix(matrix)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.savez_compressed(path, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                        shape=np.array(matrix.shape), job_codes=np.asarray(job_codes).astype(str),
+                        task_ids=np.asarray(task_ids).astype(str))
+
+
+def load_job_task_matrix(path=DEFAULT_MATRIX_PATH):
+    """
+    Load a matrix saved with save_job_task_matrix.
+
+    Returns:
+    (CSR matrix, job codes of the rows, task IDs of the columns)
+    """
+    with np.load(path) as arrays:
+        matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                   shape=tuple(arrays['shape']))
+        return matrix, arrays['job_codes'].astype(object), arrays['task_ids'].astype(object)
+
@@ -0,0 +1,217 @@
+import hashlib
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from oews_series import factorize_codes
+from oews_rows import CompactRows, ROW_FIELDS
+
+# The log starts with the identity of the raw file it belongs to:
+#   magic, file size, modification time (ns), md5 of its first SOURCE_BLOCK bytes, path length
+# followed by the path; a log is only resumed for the same file
+SOURCE_MAGIC = b'OECS'
+SOURCE_HEADER = struct.Struct('<4sQQ16sI')
+SOURCE_BLOCK = 1 << 20
+
+# Every record is a fixed header followed by its payload:
+#   magic, crc32 of the payload, start and stop byte offsets of the chunk in the raw file,
+#   rows in the chunk, number of value rows, byte lengths of the new area/occupation/datatype codes
+RECORD_MAGIC = b'OECK'
+RECORD_HEADER = struct.Struct('<4sIQQQIIII')
+
+# One value row: the series id fields kept for the value, the value and its flags
+VALUE_DTYPE = np.dtype([
+    ('areatype', 'S1'),
+    ('area_code', 'S7'),
+    ('occupation_code', 'S6'),
+    ('datatype', 'S2'),
+    ('value', '<f8'),
+    ('flags', 'u1'),
+])
+
+CODE_SETS = ['area_codes', 'occupation_codes', 'datatypes']
+
+
+def _encode_codes(codes):
+    return '\n'.join(sorted(codes)).encode('ascii')
+
+
+def _decode_codes(blob):
+    return set(blob.decode('ascii').split('\n')) if blob else set()
+
+
+def source_identity(source):
+    """
+    Identity of a raw input file: its absolute path, size, modification time and the md5
+    of its first block.
+    """
+    stat = os.stat(source)
+    with open(source, 'rb') as f:
+        digest = hashlib.md5(f.read(SOURCE_BLOCK)).digest()
+    return {'path': os.path.abspath(source), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'md5': digest}
+
+
+def _same_source(identity, other):
+    # The path is informative only: a file is the same when its size, time and first block are
+    return other is not None and all(identity[key] == other[key] for key in ('size', 'mtime_ns', 'md5'))
+
+
+def _read_source(f):
+    # Source identity at the start of a log (None for a missing or torn one)
+    header = f.read(SOURCE_HEADER.size)
+    if len(header) < SOURCE_HEADER.size:
+        return None
+    magic, size, mtime_ns, digest, path_length = SOURCE_HEADER.unpack(header)
+    path = f.read(path_length)
+    if magic != SOURCE_MAGIC or len(path) < path_length:
+        return None
+    return {'path': path.decode('utf-8', 'replace'), 'size': size, 'mtime_ns': mtime_ns, 'md5': digest}
+
+
+def checkpoint_source(path):
+    """
+    Identity of the raw file a checkpoint log belongs to (see source_identity), or None
+    when there is no log or it does not start with one.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return _read_source(f)
+
+
+def checkpoint_matches(path, source):
+    """
+    Whether the checkpoint log at path was written for the raw file source.
+    """
+    return _same_source(source_identity(source), checkpoint_source(path))
+
+
+def append_checkpoint(f, start, stop, summary, recorded=None):
+    """
+    Append one chunk summary (see oews_ingest.summarize_batch) to a checkpoint log.
+
+    Only the codes not in `recorded` are written, and `recorded` is updated in place,
+    so every record holds the delta of its chunk. The record is flushed and synced
+    before returning, which commits the chunk up to byte offset `stop`.
+
+    Parameters:
+    f: checkpoint log opened in binary append mode
+    start, stop: byte range of the raw file the summary covers
+    summary: chunk summary with rows, code sets and the long value table
+    recorded: optional dict of code sets already in the log
+    """
+    recorded = recorded if recorded is not None else {name: set() for name in CODE_SETS}
+    blobs = []
+    for name in CODE_SETS:
+        new_codes = summary[name] - recorded[name]
+        recorded[name] |= new_codes
+        blobs.append(_encode_codes(new_codes))
+
+    values = summary['values']
+    rows = np.empty(len(values), dtype=VALUE_DTYPE)
+    for field in ROW_FIELDS:
+        # Labels are looked up once per code, not once per row
+        rows[field] = np.array(values.labels(field), dtype=VALUE_DTYPE[field])[values.codes(field)]
+    rows['value'] = values.values
+    rows['flags'] = values.flags
+
+    payload = rows.tobytes() + b''.join(blobs)
+    f.write(RECORD_HEADER.pack(RECORD_MAGIC, zlib.crc32(payload), start, stop, summary['rows'], len(rows),
+                               *(len(blob) for blob in blobs)))
+    f.write(payload)
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def read_checkpoints(path):
+    """
+    Read the complete records of a checkpoint log.
+
+    A record cut short by a crash (or failing its checksum) ends the log; a log without
+    its source identity (see source_identity) has no records.
+
+    Returns:
+    records: list of (start, stop, summary) in the order they were written
+    valid_bytes: length of the log up to the end of the last complete record
+    """
+    records = []
+    valid_bytes = 0
+    if not os.path.exists(path):
+        return records, valid_bytes
+
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if _read_source(f) is None:
+            return records, valid_bytes
+        valid_bytes = f.tell()
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            magic, crc, start, stop, rows, n_values, *blob_lengths = RECORD_HEADER.unpack(header)
+            payload_size = n_values * VALUE_DTYPE.itemsize + sum(blob_lengths)
+            # A torn header can claim any length, so it is checked before reading the payload
+            if magic != RECORD_MAGIC or f.tell() + payload_size > size:
+                break
+            payload = f.read(payload_size)
+            if zlib.crc32(payload) != crc:
+                break
+
+            value_bytes = n_values * VALUE_DTYPE.itemsize
+            value_rows = np.frombuffer(payload[:value_bytes], dtype=VALUE_DTYPE)
+            values = CompactRows()
+            codes = {}
+            for field in ROW_FIELDS:
+                field_codes, labels = factorize_codes(np.ascontiguousarray(value_rows[field]))
+                codes[field] = values.codebooks[field].encode(labels.tolist())[field_codes]
+            values.append_codes(codes, value_rows['value'].copy(), value_rows['flags'].copy())
+
+            summary = {'rows': rows, 'values': values}
+            offset = value_bytes
+            for name, length in zip(CODE_SETS, blob_lengths):
+                summary[name] = _decode_codes(payload[offset:offset + length])
+                offset += length
+
+            records.append((start, stop, summary))
+            valid_bytes = f.tell()
+    return records, valid_bytes
+
+
+def open_checkpoint_log(path, source, resume=False):
+    """
+    Open the checkpoint log of a raw input file for appending.
+
+    With resume=True the complete records already in the log are returned, and a torn
+    record at the end is cut off. The log is started over when not resuming, and when it
+    was written for another file (or the file changed since; see checkpoint_matches).
+
+    Parameters:
+    path: path of the checkpoint log
+    source: raw file the log's byte offsets refer to
+    resume: continue from the records already in the log
+
+    Returns:
+    f: the log opened in binary append mode
+    records: list of (start, stop, summary) already committed (empty unless resuming)
+    """
+    identity = source_identity(source)
+    records = []
+    if resume and _same_source(identity, checkpoint_source(path)):
+        records, valid_bytes = read_checkpoints(path)
+        if os.path.getsize(path) > valid_bytes:
+            with open(path, 'r+b') as f:
+                f.truncate(valid_bytes)
+        return open(path, 'ab'), records
+
+    if os.path.exists(path):
+        os.remove(path)
+    f = open(path, 'ab')
+    encoded_path = identity['path'].encode('utf-8')
+    f.write(SOURCE_HEADER.pack(SOURCE_MAGIC, identity['size'], identity['mtime_ns'], identity['md5'],
+                               len(encoded_path)))
+    f.write(encoded_path)
+    f.flush()
+    os.fsync(f.fileno())
+    return f, records
@@ -0,0 +1,574 @@
+import hashlib
+import json
+import os
+import posixpath
+import shutil
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from worker_pool import pool_context
+
+# Namespaces of the spreadsheet parts of an .xlsx package
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# Rows per batch yielded by iter_xlsx_batches
+DEFAULT_BATCH_ROWS = 50000
+
+# Bumped whenever the conversion or the cache layout changes, so old entries are not reused
+CACHE_VERSION = 2
+
+# Parquet column holding the numeric cells of a column that mixes numbers and text
+# (BLS puts markers such as '*' and '#' into otherwise numeric columns)
+NUMBER_PART = '__number__{}'
+
+# Rows converted to XML at a time by write_xlsx
+DEFAULT_WRITE_BLOCK_ROWS = 20000
+
+# Rows per worksheet allowed by Excel (header included); longer tables continue on
+# further sheets named '<name> (2)', '<name> (3)', ...
+MAX_SHEET_ROWS = 1048576
+MAX_SHEET_NAME = 31
+
+# Sheet parts are deflated at a low level, which keeps the zip step from dominating the export
+EXPORT_COMPRESSLEVEL = 1
+
+# Characters XML 1.0 does not allow in text
+ILLEGAL_XML_CHARS = r'[\x00-\x08\x0b\x0c\x0e-\x1f]'
+
+CONTENT_TYPES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                 '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                 '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                 '<Default Extension="xml" ContentType="application/xml"/>'
+                 '<Override PartName="/xl/workbook.xml" '
+                 'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                 '<Override PartName="/xl/styles.xml" '
+                 'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                 '{sheets}</Types>')
+SHEET_CONTENT_TYPE = ('<Override PartName="/xl/worksheets/sheet{0}.xml" '
+                      'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>')
+PACKAGE_RELS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+                'Target="xl/workbook.xml"/></Relationships>')
+WORKBOOK = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>{sheets}</sheets></workbook>')
+WORKBOOK_RELS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                 '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{rels}'
+                 '<Relationship Id="rIdStyles" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+                 'Target="styles.xml"/></Relationships>')
+SHEET_REL = ('<Relationship Id="rId{0}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+             'Target="worksheets/sheet{0}.xml"/>')
+# Style 1 is the bold header font
+STYLES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+          '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+          '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+          '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+          '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+          '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+          '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+          '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+          '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+          '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles></styleSheet>')
+SHEET_HEAD = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+              '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+SHEET_TAIL = '</sheetData></worksheet>'
+
+# Sheets handed to forked export workers (see write_xlsx)
+_EXPORT_SHEETS = []
+
+
+def _column_index(ref):
+    # 'AB12' -> 27
+    index = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        index = index * 26 + ord(ch.upper()) - ord('A') + 1
+    return index - 1
+
+
+def _number(text):
+    # Integral numbers come back as int, like pandas.read_excel does
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+
+def _item_text(element):
+    # Text of a shared or inline string, concatenating the runs of rich text
+    return ''.join(t.text or '' for t in element.iter(f'{SHEET_NS}t'))
+
+
+def _read_shared_strings(archive):
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    with archive.open('xl/sharedStrings.xml') as f:
+        for _, element in ET.iterparse(f):
+            if element.tag == f'{SHEET_NS}si':
+                strings.append(_item_text(element))
+                element.clear()
+    return strings
+
+
+def _sheet_path(archive, sheet=None):
+    # Resolve a sheet name or position (default: the first sheet) to its part in the package
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    sheets = [(s.get('name'), s.get(f'{REL_NS}id')) for s in workbook.iter(f'{SHEET_NS}sheet')]
+    if sheet is None:
+        sheet = 0
+    if isinstance(sheet, int):
+        name, rel_id = sheets[sheet]
+    else:
+        matches = [rel_id for name, rel_id in sheets if name == sheet]
+        if not matches:
+            raise ValueError(f"Worksheet named '{sheet}' not found")
+        rel_id = matches[0]
+
+    rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels.iter(f'{PACKAGE_REL_NS}Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+    raise ValueError(f"Worksheet part of '{sheet}' not found")
+
+
+def _cell_value(cell, shared_strings):
+    kind = cell.get('t', 'n')
+    if kind == 'inlineStr':
+        inline = cell.find(f'{SHEET_NS}is')
+        return _item_text(inline) if inline is not None else None
+    value = cell.find(f'{SHEET_NS}v')
+    if value is None or value.text is None:
+        return None
+    if kind == 's':
+        return shared_strings[int(value.text)]
+    if kind == 'n':
+        return _number(value.text)
+    if kind == 'b':
+        return value.text == '1'
+    if kind == 'e':
+        # Error cells (#N/A, #DIV/0!, ...) are missing values
+        return None
+    return value.text
+
+
+def _iter_sheet_rows(source, sheet=None):
+    # Yields every non-empty row of a sheet as a list of cell values, parsing the sheet XML
+    # incrementally instead of building a cell object per value
+    with zipfile.ZipFile(source) as archive:
+        shared_strings = _read_shared_strings(archive)
+        with archive.open(_sheet_path(archive, sheet)) as f:
+            for _, element in ET.iterparse(f):
+                if element.tag != f'{SHEET_NS}row':
+                    continue
+                row = []
+                for position, cell in enumerate(element.iter(f'{SHEET_NS}c')):
+                    ref = cell.get('r')
+                    index = _column_index(ref) if ref else position
+                    if index >= len(row):
+                        row.extend([None] * (index - len(row) + 1))
+                    row[index] = _cell_value(cell, shared_strings)
+                element.clear()
+                while row and row[-1] is None:
+                    row.pop()
+                if row:
+                    yield row
+
+
+def _header_names(cells):
+    names = []
+    seen = {}
+    for i, cell in enumerate(cells):
+        name = f'Unnamed: {i}' if cell is None else str(cell)
+        # Repeated names are numbered the way pandas does ('X', 'X.1', ...)
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _typed_column(values):
+    # Numbers-only columns become int64/float64 (float64 once a cell is missing), anything
+    # else an object column with NaN for missing cells, as pandas.read_excel produces
+    column = pd.Series(values, dtype=object)
+    present = column.notna()
+    if not present.any():
+        return pd.Series(np.nan, index=column.index, dtype=np.float64)
+    kinds = {type(value) for value in column[present]}
+    if kinds <= {int}:
+        return column.astype(np.int64) if present.all() else column.astype(np.float64)
+    if kinds <= {bool} and present.all():
+        return column.astype(bool)
+    if kinds <= {int, float, bool}:
+        return column.astype(np.float64)
+    return column.where(present, np.nan)
+
+
+def iter_xlsx_batches(source, sheet=None, batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    Stream a worksheet of an .xlsx workbook as typed DataFrame batches.
+
+    The first row holds the column names. Cells are typed the way pandas.read_excel types
+    them (date-formatted cells are returned as serial numbers), and empty rows are skipped.
+
+    Parameters:
+    source: path or binary file object of the workbook (see oews_reader.read_input_bytes)
+    sheet: sheet name or position (default: the first sheet)
+    batch_rows: number of rows per batch
+
+    Yields:
+    DataFrames with the same columns, in sheet order
+    """
+    rows = _iter_sheet_rows(source, sheet)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = _header_names(header)
+
+    def to_frame(batch):
+        return pd.DataFrame({name: _typed_column([row[i] if i < len(row) else None for row in batch])
+                             for i, name in enumerate(columns)})
+
+    batch = []
+    empty = True
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_rows:
+            yield to_frame(batch)
+            batch, empty = [], False
+    if batch or empty:
+        # A sheet with only a header still yields one (empty) batch carrying the columns
+        yield to_frame(batch)
+
+
+def _restore_integers(column):
+    # Object column with integral floats turned back into ints (Series.map would re-infer a float dtype)
+    values = [int(value) if isinstance(value, float) and value.is_integer() else value for value in column]
+    return pd.Series(values, index=column.index, dtype=object)
+
+
+def concat_xlsx_batches(batches):
+    """
+    Concatenate batches from iter_xlsx_batches into one frame.
+
+    A column that is numeric in some batches and mixed in others ends up as an object
+    column holding ints, floats and strings, like a single pandas.read_excel call would give.
+    """
+    batches = list(batches)
+    if not batches:
+        return pd.DataFrame()
+    frame = {}
+    for name in batches[0].columns:
+        parts = [batch[name] for batch in batches]
+        if all(part.dtype != object for part in parts):
+            frame[name] = pd.concat(parts, ignore_index=True)
+        else:
+            frame[name] = _restore_integers(pd.concat([part.astype(object) for part in parts], ignore_index=True))
+    return pd.DataFrame(frame)
+
+
+def read_xlsx(source, sheet=None, batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    Read a worksheet into a DataFrame (streaming drop-in for pandas.read_excel(source, sheet)).
+    """
+    return concat_xlsx_batches(iter_xlsx_batches(source, sheet, batch_rows))
+
+
+def content_digest(source):
+    """
+    SHA-256 of a file's content, given a path or a binary file object.
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    else:
+        position = source.tell()
+        source.seek(0)
+        for chunk in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(chunk)
+        source.seek(position)
+    return digest.hexdigest()
+
+
+def _write_cache(frame, table_path):
+    # Parquet needs one type per column, so mixed columns are split into a text part and
+    # a numeric part that are put back together on load
+    columns = {}
+    mixed = []
+    for name in frame.columns:
+        column = frame[name]
+        if column.dtype == object:
+            is_text = column.map(lambda value: isinstance(value, str))
+            columns[name] = column.where(is_text, None)
+            numbers = pd.to_numeric(column.where(~is_text & column.notna(), np.nan), errors='coerce')
+            if numbers.notna().any():
+                columns[NUMBER_PART.format(name)] = numbers.astype(np.float64)
+                mixed.append(name)
+        else:
+            columns[name] = column
+    table = pa.Table.from_pandas(pd.DataFrame(columns), preserve_index=False)
+    pq.write_table(table, table_path)
+    return mixed
+
+
+def _read_cache(table_path, columns, mixed):
+    stored = pq.read_table(table_path).to_pandas()
+    frame = {}
+    for name in columns:
+        column = stored[name]
+        if name in mixed:
+            numbers = _restore_integers(stored[NUMBER_PART.format(name)].astype(object))
+            column = pd.Series(np.where(column.notna(), column.astype(object), numbers), dtype=object)
+        if column.dtype == object:
+            column = column.where(column.notna(), np.nan)
+        frame[name] = column
+    return pd.DataFrame(frame)
+
+
+def load_xlsx_cached(source, cache_dir, sheet=None, detect_columns=None):
+    """
+    Read a worksheet through a cache keyed on the workbook's content hash.
+
+    On the first read of a workbook the sheet is streamed with iter_xlsx_batches and stored
+    as Parquet in cache_dir, together with the column mapping returned by detect_columns;
+    later reads of the same content load both from the cache.
+
+    Parameters:
+    source: path or binary file object of the workbook
+    cache_dir: directory of the cache (created if needed)
+    sheet: sheet name or position (default: the first sheet)
+    detect_columns: optional function of the DataFrame returning a JSON-serializable mapping
+
+    Returns:
+    (frame, column_mapping, from_cache)
+    """
+    key = hashlib.sha256(f'{content_digest(source)}:{sheet}:{CACHE_VERSION}'.encode()).hexdigest()[:32]
+    table_path = os.path.join(cache_dir, f'{key}.parquet')
+    meta_path = os.path.join(cache_dir, f'{key}.json')
+
+    if os.path.exists(table_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        return _read_cache(table_path, meta['columns'], meta['mixed_columns']), meta['column_mapping'], True
+
+    if not isinstance(source, (str, os.PathLike)):
+        source.seek(0)
+    frame = read_xlsx(source, sheet)
+    column_mapping = detect_columns(frame) if detect_columns is not None else None
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # The metadata is written last, so an interrupted write is never picked up as a cache hit
+    mixed = _write_cache(frame, table_path)
+    meta = {
+        'source': source if isinstance(source, str) else None,
+        'sheet': sheet,
+        'rows': len(frame),
+        'columns': list(frame.columns),
+        'mixed_columns': mixed,
+        'column_mapping': column_mapping,
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    return frame, column_mapping, False
+
+
+def _column_letters(count):
+    letters = []
+    for index in range(count):
+        name = ''
+        index += 1
+        while index:
+            index, remainder = divmod(index - 1, 26)
+            name = chr(ord('A') + remainder) + name
+        letters.append(name)
+    return letters
+
+
+def _escape_text(values):
+    text = pd.Series(values, dtype=object).astype(str)
+    text = text.str.replace(ILLEGAL_XML_CHARS, '', regex=True)
+    for char, entity in (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;')):
+        text = text.str.replace(char, entity, regex=False)
+    return text.to_numpy(dtype=object)
+
+
+def _cells_xml(column, refs):
+    # One XML fragment per row for a column; missing cells are left out
+    cells = np.full(len(column), '', dtype=object)
+    missing = column.isna().to_numpy()
+    if pd.api.types.is_bool_dtype(column.dtype):
+        present = ~missing
+        cells[present] = refs[present] + '" t="b"><v>' + column[present].astype(int).astype(str).to_numpy(dtype=object) + '</v></c>'
+        return cells
+    if pd.api.types.is_numeric_dtype(column.dtype):
+        present = np.isfinite(column.to_numpy(dtype=np.float64, na_value=np.nan))
+        cells[present] = refs[present] + '"><v>' + column[present].astype(str).to_numpy(dtype=object) + '</v></c>'
+        return cells
+
+    # Text columns, where BLS-style tables may also hold numbers next to markers
+    values = column.to_numpy(dtype=object)
+    numeric = np.array([isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+                        for value in values], dtype=bool)
+    numeric &= ~missing
+    if numeric.any():
+        numbers = values[numeric].astype(np.float64)
+        finite = np.isfinite(numbers)
+        positions = np.flatnonzero(numeric)[finite]
+        cells[positions] = refs[positions] + '"><v>' + np.array([str(value) for value in values[positions]], dtype=object) + '</v></c>'
+        missing = missing | (numeric & ~np.isin(np.arange(len(values)), positions))
+    text = ~missing & ~numeric
+    if text.any():
+        cells[text] = (refs[text] + '" t="inlineStr"><is><t xml:space="preserve">'
+                       + _escape_text(values[text]) + '</t></is></c>')
+    return cells
+
+
+def _rows_xml(block, first_row, letters):
+    numbers = np.arange(first_row, first_row + len(block)).astype(str).astype(object)
+    rows = '<row r="' + numbers + '">'
+    for letter, name in zip(letters, block.columns):
+        rows = rows + _cells_xml(block[name], '<c r="' + letter + numbers)
+    rows = rows + '</row>'
+    return ''.join(rows)
+
+
+def _header_xml(columns, letters):
+    cells = ''.join(f'<c r="{letter}1" s="1" t="inlineStr"><is><t xml:space="preserve">{escape(str(name))}</t></is></c>'
+                    for letter, name in zip(letters, columns))
+    return f'<row r="1">{cells}</row>'
+
+
+def _iter_blocks(frames, block_rows):
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    for frame in frames:
+        for position in range(0, len(frame), block_rows):
+            yield frame.iloc[position:position + block_rows]
+
+
+def _write_sheet_parts(name, frames, part_dir, block_rows):
+    # Write one table as sheet XML parts of at most MAX_SHEET_ROWS rows each
+    parts = []
+    f = None
+    columns = letters = None
+    rows = 0
+
+    def start_part():
+        suffix = f' ({len(parts) + 1})' if parts else ''
+        sheet_name = name[:MAX_SHEET_NAME - len(suffix)] + suffix
+        fd, part_path = tempfile.mkstemp(suffix='.xml', dir=part_dir)
+        parts.append((sheet_name, part_path))
+        part = open(fd, 'w', encoding='utf-8')
+        part.write(SHEET_HEAD + _header_xml(columns, letters))
+        return part
+
+    try:
+        for block in _iter_blocks(frames, block_rows):
+            if columns is None:
+                columns = list(block.columns)
+                letters = _column_letters(len(columns))
+            position = 0
+            while position < len(block):
+                if f is None or rows == MAX_SHEET_ROWS - 1:
+                    if f is not None:
+                        f.write(SHEET_TAIL)
+                        f.close()
+                    f = start_part()
+                    rows = 0
+                take = min(len(block) - position, MAX_SHEET_ROWS - 1 - rows)
+                f.write(_rows_xml(block.iloc[position:position + take], rows + 2, letters))
+                rows += take
+                position += take
+        if f is None:
+            # An empty table still gets a sheet with its header
+            if columns is None:
+                columns = list(frames.columns) if isinstance(frames, pd.DataFrame) else []
+                letters = _column_letters(len(columns))
+            f = start_part()
+        f.write(SHEET_TAIL)
+    finally:
+        if f is not None:
+            f.close()
+    return parts
+
+
+def _write_sheet_task(task):
+    # Worker entry point: the sheets were inherited from the parent when the worker was forked
+    index, part_dir, block_rows = task
+    name, frames = _EXPORT_SHEETS[index]
+    return _write_sheet_parts(name, frames, part_dir, block_rows)
+
+
+def write_xlsx(path, sheets, workers=1, block_rows=DEFAULT_WRITE_BLOCK_ROWS):
+    """
+    Write tables to an .xlsx workbook block by block, without building cell objects.
+
+    Each sheet is written as XML with inline strings to a temporary part next to the
+    output, `block_rows` rows at a time, and the parts are then zipped into the workbook.
+    Tables longer than Excel's row limit continue on sheets named '<name> (2)', ...
+
+    Parameters:
+    path: path of the workbook; it is replaced only once the new one is complete
+    sheets: list of (sheet name, DataFrame or iterable of DataFrames with the same columns)
+    workers: number of worker processes writing DataFrame sheets in parallel
+    block_rows: number of rows converted at a time
+
+    Returns:
+    list of the sheet names written
+    """
+    global _EXPORT_SHEETS
+    out_dir = os.path.dirname(os.path.abspath(path))
+    os.makedirs(out_dir, exist_ok=True)
+    part_dir = tempfile.mkdtemp(prefix='.xlsx-parts-', dir=out_dir)
+    try:
+        parts = [None] * len(sheets)
+        # Iterators cannot be handed to other processes, so they are written here
+        parallel = [i for i, (_, frames) in enumerate(sheets) if isinstance(frames, pd.DataFrame)]
+        if workers > 1 and len(parallel) > 1:
+            _EXPORT_SHEETS = list(sheets)
+            try:
+                with ProcessPoolExecutor(max_workers=min(workers, len(parallel)), mp_context=pool_context()) as pool:
+                    tasks = [(i, part_dir, block_rows) for i in parallel]
+                    for i, sheet_parts in zip(parallel, pool.map(_write_sheet_task, tasks)):
+                        parts[i] = sheet_parts
+            finally:
+                _EXPORT_SHEETS = []
+        for i, (name, frames) in enumerate(sheets):
+            if parts[i] is None:
+                parts[i] = _write_sheet_parts(name, frames, part_dir, block_rows)
+        parts = [part for sheet_parts in parts for part in sheet_parts]
+
+        tmp_path = os.path.join(part_dir, 'workbook.xlsx')
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=EXPORT_COMPRESSLEVEL) as archive:
+            numbers = range(1, len(parts) + 1)
+            archive.writestr('[Content_Types].xml', CONTENT_TYPES.format(
+                sheets=''.join(SHEET_CONTENT_TYPE.format(k) for k in numbers)))
+            archive.writestr('_rels/.rels', PACKAGE_RELS)
+            archive.writestr('xl/workbook.xml', WORKBOOK.format(sheets=''.join(
+                f'<sheet name={quoteattr(name)} sheetId="{k}" r:id="rId{k}"/>' for k, (name, _) in zip(numbers, parts))))
+            archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS.format(
+                rels=''.join(SHEET_REL.format(k) for k in numbers)))
+            archive.writestr('xl/styles.xml', STYLES)
+            for k, (_, part_path) in zip(numbers, parts):
+                # Streamed from disk, so the sheet XML is never held in memory as a whole
+                archive.write(part_path, f'xl/worksheets/sheet{k}.xml')
+        os.replace(tmp_path, path)
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+    return [name for name, _ in parts]
@@ -0,0 +1,240 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from oews_series import ALL_INDUSTRIES_CODE, DATATYPE_NAMES, default_area_name, to_soc_codes
+from oews_reader import iter_alldata_blocks, split_byte_ranges, is_compressed, DEFAULT_BLOCK_BYTES
+from oews_rows import CompactRows
+from worker_pool import pool_context
+
+# Columns of the long value table collected from each batch
+VALUE_COLUMNS = ['areatype', 'area_code', 'occupation_code', 'datatype', 'value']
+
+# Area types in the order their wide tables are written (national, state, metro/nonmetro)
+AREATYPES = ['N', 'S', 'M']
+
+# Byte ranges handed out per worker, so a slow range does not leave cores idle
+RANGES_PER_WORKER = 4
+
+
+def summarize_batch(batch, area_codes=None):
+    """
+    Reduce a parsed batch to what the pipeline keeps from it.
+
+    Parameters:
+    batch: DataFrame from oews_reader.parse_alldata_block
+    area_codes: optional collection of area codes to keep values for (default: all areas)
+
+    Returns:
+    dict with the row count, the distinct area, occupation and data type codes seen,
+    and the cross-industry values for the selected areas as oews_rows.CompactRows
+    """
+    keep = batch['industry_code'] == ALL_INDUSTRIES_CODE
+    if area_codes is not None:
+        keep &= batch['area_code'].isin(area_codes)
+    columns = VALUE_COLUMNS + (['footnote_codes'] if 'footnote_codes' in batch.columns else [])
+
+    return {
+        'rows': len(batch),
+        'area_codes': set(batch['area_code'].unique().tolist()),
+        'occupation_codes': set(batch['occupation_code'].unique().tolist()),
+        'datatypes': set(batch['datatype'].unique().tolist()),
+        # Dictionary-encoded rows, so summaries stay small in memory and when sent between processes
+        'values': CompactRows.from_frame(batch.loc[keep, columns]),
+    }
+
+
+def merge_summaries(summaries):
+    """
+    Merge batch summaries in file order; later values win over earlier ones downstream.
+    """
+    summaries = list(summaries)
+    return {
+        'rows': sum(summary['rows'] for summary in summaries),
+        'area_codes': set().union(*(summary['area_codes'] for summary in summaries)),
+        'occupation_codes': set().union(*(summary['occupation_codes'] for summary in summaries)),
+        'datatypes': set().union(*(summary['datatypes'] for summary in summaries)),
+        'values': CompactRows.concat(summary['values'] for summary in summaries),
+    }
+
+
+def _summarize_range(task):
+    # Worker entry point: parse one byte range and merge its batch summaries
+    path, start, stop, block_bytes, area_codes = task
+    summaries = [summarize_batch(batch, area_codes)
+                 for _, _, batch in iter_alldata_blocks(path, block_bytes, start=start, stop=stop)]
+    return start, stop, merge_summaries(summaries)
+
+
+def iter_alldata_summaries(path, workers=1, block_bytes=DEFAULT_BLOCK_BYTES, area_codes=None, start=0):
+    """
+    Parse an AllData file and yield batch summaries (see summarize_batch) in file order.
+
+    With workers > 1 the file is split into newline-aligned byte ranges that are
+    parsed in a process pool; each yielded summary then covers a whole range.
+    Because summaries are always yielded in file order, merging them gives the
+    same result for any number of workers. Parsing begins at byte offset `start`,
+    e.g. the last offset committed to a checkpoint log. Compressed inputs cannot be
+    split into byte ranges, so they are parsed in this process while a background
+    thread decompresses ahead of the parser.
+
+    Yields:
+    (start, stop, summary) with the byte offsets covered by the summary
+    """
+    if workers <= 1 or is_compressed(path):
+        for block_start, block_stop, batch in iter_alldata_blocks(path, block_bytes, start=start):
+            yield block_start, block_stop, summarize_batch(batch, area_codes)
+        return
+
+    ranges = split_byte_ranges(path, workers * RANGES_PER_WORKER, start=start)
+    tasks = [(path, range_start, range_stop, block_bytes, area_codes) for range_start, range_stop in ranges]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as pool:
+        # map returns results in submission order, which keeps the merge deterministic
+        yield from pool.map(_summarize_range, tasks)
+
+
+def pivot_area_values(values, area_names=None):
+    """
+    Turn long value rows into one wide row per area and occupation.
+
+    Every area is handled in the same vectorized pivot on the integer codes of the
+    rows, so national, state and metro tables come out of a single scan of the file.
+    As in the per-row dictionaries this replaces, a later value for the same area,
+    occupation and data type wins.
+
+    Parameters:
+    values: oews_rows.CompactRows (e.g. merge_summaries(...)['values']) or a DataFrame
+            with VALUE_COLUMNS
+    area_names: optional dict of area code to name (see oews_reader.load_area_names)
+
+    Returns:
+    DataFrame with areatype, area_code, area_name, occupation_code, soc_code and one
+    column per data type name, sorted by area type, area and occupation
+    """
+    if not isinstance(values, CompactRows):
+        values = CompactRows.from_frame(values)
+    keys = ['areatype', 'area_code', 'occupation_code']
+    sizes = [max(len(values.labels(field)), 1) for field in keys]
+
+    # One integer per (areatype, area, occupation) row of the wide table
+    key = np.zeros(len(values), dtype=np.int64)
+    for field, size in zip(keys, sizes):
+        key = key * size + values.codes(field)
+    row_keys, rows = np.unique(key, return_inverse=True)
+    type_codes, cols = np.unique(values.codes('datatype'), return_inverse=True)
+
+    # Keep only the last value per cell
+    cells = rows * len(type_codes) + cols
+    _, last = np.unique(cells[::-1], return_index=True)
+    last = len(cells) - 1 - last
+    table = np.full((len(row_keys), len(type_codes)), np.nan)
+    table[rows[last], cols[last]] = values.values[last]
+
+    wide = {}
+    for field, size in reversed(list(zip(keys, sizes))):
+        row_keys, field_codes = np.divmod(row_keys, size)
+        wide[field] = np.asarray(values.labels(field), dtype=object)[field_codes] if len(field_codes) else []
+    wide = pd.DataFrame({field: wide[field] for field in keys})
+
+    datatypes = [values.labels('datatype')[code] for code in type_codes]
+    for i in sorted(range(len(datatypes)), key=lambda i: datatypes[i]):
+        wide[DATATYPE_NAMES.get(datatypes[i], f"unknown_{datatypes[i]}")] = table[:, i]
+
+    order = {areatype: i for i, areatype in enumerate(AREATYPES)}
+    wide['area_order'] = wide['areatype'].map(order).fillna(len(order))
+    wide = wide.sort_values(['area_order', 'area_code', 'occupation_code'], kind='stable', ignore_index=True)
+    wide = wide.drop(columns='area_order')
+
+    area_names = area_names or {}
+    areas = wide[['areatype', 'area_code']].drop_duplicates()
+    names = {area_code: area_names.get(area_code) or default_area_name(areatype, area_code)
+             for areatype, area_code in zip(areas['areatype'], areas['area_code'])}
+    wide.insert(2, 'area_name', wide['area_code'].map(names))
+    wide.insert(4, 'soc_code', to_soc_codes(wide['occupation_code'].to_numpy(dtype=str)) if len(wide) else [])
+    return wide
+
+
+class WideTableBuilder:
+    """
+    Build a key x data type wide table incrementally while batches stream in.
+
+    Values are written into a preallocated float array whose rows are the keys (e.g.
+    SOC codes) in order of first appearance and whose columns are data type codes, so
+    the wide table is complete as soon as the last batch has been added. A later value
+    for the same key and data type overwrites an earlier one.
+    """
+
+    def __init__(self, datatypes=None, capacity=1024, dtype=np.float64):
+        self.datatypes = list(datatypes or DATATYPE_NAMES)
+        self.column_index = {code: i for i, code in enumerate(self.datatypes)}
+        self.keys = []
+        self.row_index = {}
+        self.values = np.full((capacity, len(self.datatypes)), np.nan, dtype=dtype)
+        # Tracks which cells were written, so columns that only ever held NaN still appear
+        self.present = np.zeros(self.values.shape, dtype=bool)
+
+    @staticmethod
+    def _lookup(codes, uniques, index, labels):
+        # Dictionary lookups only run on the distinct values of the batch
+        positions = np.empty(len(uniques), dtype=np.intp)
+        for i, value in enumerate(uniques):
+            position = index.get(value)
+            if position is None:
+                position = index[value] = len(labels)
+                labels.append(value)
+            positions[i] = position
+        return positions[codes]
+
+    def _reserve(self, rows, columns):
+        # Grow the arrays (doubling the rows) when new keys or data types show up
+        old_rows, old_columns = self.values.shape
+        if rows <= old_rows and columns <= old_columns:
+            return
+        shape = (max(rows, 2 * old_rows) if rows > old_rows else old_rows, max(columns, old_columns))
+        values = np.full(shape, np.nan, dtype=self.values.dtype)
+        present = np.zeros(shape, dtype=bool)
+        values[:old_rows, :old_columns] = self.values
+        present[:old_rows, :old_columns] = self.present
+        self.values, self.present = values, present
+
+    def add(self, keys, datatypes, values):
+        """
+        Write one batch of (key, data type code, value) triples into the table.
+        """
+        values = np.asarray(values, dtype=self.values.dtype)
+        if not len(values):
+            return
+        key_codes, key_uniques = pd.factorize(keys)
+        type_codes, type_uniques = pd.factorize(datatypes)
+        rows = self._lookup(key_codes, np.asarray(key_uniques).tolist(), self.row_index, self.keys)
+        cols = self._lookup(type_codes, np.asarray(type_uniques).tolist(), self.column_index, self.datatypes)
+        self._reserve(len(self.keys), len(self.datatypes))
+
+        # Keep only the last value per cell, since fancy assignment order is not guaranteed
+        cells = rows * self.values.shape[1] + cols
+        _, last = np.unique(cells[::-1], return_index=True)
+        last = len(cells) - 1 - last
+        self.values[rows[last], cols[last]] = values[last]
+        self.present[rows[last], cols[last]] = True
+
+    def value_counts(self):
+        """
+        Return the number of keys that received a value, per data type code.
+        """
+        counts = self.present[:len(self.keys)].sum(axis=0)
+        return {code: int(counts[i]) for i, code in enumerate(self.datatypes) if counts[i]}
+
+    def to_frame(self, key_name='key'):
+        """
+        Return the wide table with one column per data type name that received a value,
+        in data type code order.
+        """
+        n = len(self.keys)
+        columns = sorted((i for i in range(len(self.datatypes)) if self.present[:n, i].any()),
+                         key=lambda i: self.datatypes[i])
+        wide = {key_name: self.keys}
+        for i in columns:
+            code = self.datatypes[i]
+            wide[DATATYPE_NAMES.get(code, f"unknown_{code}")] = self.values[:n, i]
+        return pd.DataFrame(wide)
@@ -0,0 +1,330 @@
+import json
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from oews_excel import read_xlsx
+from oews_reader import read_input_bytes
+from worker_pool import pool_context
+from soc_taxonomy import normalize_soc
+
+# Columns of data/processed/yearly_job_data.csv
+PANEL_COLUMNS = ['year', 'region_type', 'region', 'soc_code', 'occupation_title', 'major_group_name',
+                 'employment', 'annual_mean_wage', 'gdp', 'complexity_score']
+
+# Release tables by the prefix of their workbook name (national_M2024_dl.xlsx, state_..., MSA_...)
+REGION_TYPES = {'national': 'National', 'state': 'State', 'msa': 'Metropolitan'}
+REGION_TYPE_ORDER = ['National', 'State', 'Metropolitan']
+
+# Release archives (oesm24nat.zip, oesm24st.zip, oesm24ma.zip) and the workbooks inside them
+RELEASE_ARCHIVE = re.compile(r'^oesm(\d{2})(nat|st|ma)\.zip$', re.IGNORECASE)
+RELEASE_WORKBOOK = re.compile(r'^(national|state|msa)_m(\d{4})_dl\.xlsx$', re.IGNORECASE)
+
+# OEWS estimates use SOC 2010 codes up to the May 2018 release, a hybrid of SOC 2010 and
+# SOC 2018 in May 2019 and May 2020, and SOC 2018 from May 2021 on
+LAST_SOC_2010_YEAR = 2018
+HYBRID_SOC_YEARS = (2019, 2020)
+
+# Ownership code of the all-ownerships estimates
+ALL_OWNERSHIPS = '1235'
+
+MANIFEST_FILE = '_panel_manifest.json'
+
+# Occupation code and job complexity columns of the job complexity tables the pipeline writes:
+# process_bls_onet_data_final.py (soc_code, job_complexity), calculate_complexity*.py
+# (O_NET_SOC_Code, JCI) and the published data/processed/complexity tables (job_complexity_index)
+COMPLEXITY_CODE_COLUMNS = ('soc_code', 'O_NET_SOC_Code')
+COMPLEXITY_SCORE_COLUMNS = ('job_complexity', 'JCI', 'job_complexity_index')
+
+
+def find_release_files(release_dir):
+    """
+    Find the OEWS Excel releases under a directory, extracted or still zipped.
+
+    Returns:
+    dict mapping year -> {region_type: (path, member)}, where member is the workbook
+    inside a release archive (None for an extracted workbook, which is preferred)
+    """
+    releases = {}
+    for root, _, files in os.walk(release_dir):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            workbook = RELEASE_WORKBOOK.match(name)
+            if workbook:
+                year, region_type = int(workbook.group(2)), REGION_TYPES[workbook.group(1).lower()]
+                releases.setdefault(year, {})[region_type] = (path, None)
+                continue
+            if not RELEASE_ARCHIVE.match(name):
+                continue
+            with zipfile.ZipFile(path) as archive:
+                for member in archive.namelist():
+                    workbook = RELEASE_WORKBOOK.match(os.path.basename(member))
+                    if workbook:
+                        year, region_type = int(workbook.group(2)), REGION_TYPES[workbook.group(1).lower()]
+                        releases.setdefault(year, {}).setdefault(region_type, (path, member))
+    return releases
+
+
+def _fingerprint(files):
+    fingerprint = {}
+    for region_type, (path, member) in sorted(files.items()):
+        source = os.stat(path)
+        fingerprint[region_type] = {'path': os.path.abspath(path), 'member': member,
+                                    'size': source.st_size, 'mtime': source.st_mtime}
+    return fingerprint
+
+
+def _numeric(column):
+    # BLS markers ('*', '**', '#') become NaN
+    return pd.to_numeric(column, errors='coerce')
+
+
+def release_rows(frame, year, region_type):
+    """
+    Turn one release workbook into panel rows of its detailed, cross-industry estimates.
+
+    Returns:
+    DataFrame with year, region_type, region, soc_code, occupation_title, major_group_name,
+    employment and annual_mean_wage
+    """
+    frame = frame.rename(columns=lambda col: str(col).strip().upper())
+    keep = pd.Series(True, index=frame.index)
+    if 'I_GROUP' in frame.columns:
+        keep &= frame['I_GROUP'].astype(str).str.strip().str.lower() == 'cross-industry'
+    if 'OWN_CODE' in frame.columns and (frame['OWN_CODE'].astype(str) == ALL_OWNERSHIPS).any():
+        keep &= frame['OWN_CODE'].astype(str) == ALL_OWNERSHIPS
+    frame = frame[keep]
+
+    codes = frame['OCC_CODE'].astype(str).str.strip()
+    # Older releases call the occupation level column OCC_GROUP
+    group_col = 'O_GROUP' if 'O_GROUP' in frame.columns else 'OCC_GROUP' if 'OCC_GROUP' in frame.columns else None
+    if group_col:
+        groups = frame[group_col].astype(str).str.strip().str.lower()
+        detailed, major = groups == 'detailed', groups == 'major'
+    else:
+        detailed = ~codes.str.endswith('0000')
+        major = codes.str.endswith('0000') & (codes != '00-0000')
+
+    # Major group names come from the release's own major group rows
+    major_titles = (frame.loc[major, 'OCC_TITLE'].astype(str).str.strip()
+                    .str.replace(r' Occupations$', '', regex=True))
+    major_names = dict(zip(codes[major].str[:2], major_titles))
+
+    if region_type == 'National':
+        region = pd.Series('United States', index=frame.index)
+    else:
+        region = frame['AREA_TITLE' if 'AREA_TITLE' in frame.columns else 'AREA_NAME'].astype(str).str.strip()
+
+    rows = pd.DataFrame({
+        'year': year,
+        'region_type': region_type,
+        'region': region[detailed].to_numpy(),
+        'soc_code': codes[detailed].to_numpy(),
+        'occupation_title': frame.loc[detailed, 'OCC_TITLE'].astype(str).str.strip().to_numpy(),
+        'employment': _numeric(frame.loc[detailed, 'TOT_EMP']).to_numpy(dtype=np.float64),
+        'annual_mean_wage': _numeric(frame.loc[detailed, 'A_MEAN']).to_numpy(dtype=np.float64),
+    })
+    rows.insert(5, 'major_group_name', rows['soc_code'].str[:2].map(major_names))
+    return rows
+
+
+def _ingest_year(task):
+    # Worker entry point: read every workbook of one release year into one Parquet part
+    year, files, part_path = task
+    parts = []
+    for region_type, (path, member) in files.items():
+        source = path if member is None else read_input_bytes(path, member)
+        parts.append(release_rows(read_xlsx(source), year, region_type))
+    rows = pd.concat(parts, ignore_index=True)
+    rows.to_parquet(part_path, index=False)
+    return year, len(rows)
+
+
+def load_soc_crosswalk(path):
+    """
+    Load a SOC code crosswalk, e.g. the BLS soc_2010_to_2018_crosswalk.xlsx.
+
+    The file may be a CSV or a workbook; the source and target columns are the ones whose
+    header names the 2010 and 2018 SOC codes (or source_code and target_code).
+
+    Returns:
+    DataFrame with source_code and target_code (empty if the file is missing)
+    """
+    if not path or not os.path.exists(path):
+        return pd.DataFrame({'source_code': [], 'target_code': []}, dtype=str)
+    if path.lower().endswith('.csv'):
+        raw = pd.read_csv(path, dtype=str, header=None)
+    else:
+        raw = pd.read_excel(path, dtype=str, header=None)
+
+    # The BLS workbook has a few title lines above the header
+    for header_row in range(len(raw)):
+        labels = [str(value).strip().lower() for value in raw.iloc[header_row]]
+        source = [i for i, label in enumerate(labels) if label == 'source_code' or ('2010' in label and 'code' in label)]
+        target = [i for i, label in enumerate(labels) if label == 'target_code' or ('2018' in label and 'code' in label)]
+        if source and target:
+            break
+    else:
+        raise ValueError(f"{path} has no 2010/2018 SOC code columns")
+
+    crosswalk = pd.DataFrame({
+        'source_code': raw.iloc[header_row + 1:, source[0]].str.strip(),
+        'target_code': raw.iloc[header_row + 1:, target[0]].str.strip(),
+    }).dropna()
+    return crosswalk.drop_duplicates().reset_index(drop=True)
+
+
+def harmonize_soc(panel, crosswalk, base_year=None):
+    """
+    Map the occupation codes of every year to SOC 2018.
+
+    SOC 2010 years are mapped through the crosswalk, hybrid years only for codes that are
+    not SOC 2018 codes. When a code splits into several SOC 2018 occupations, its
+    employment is divided by the targets' employment shares in the same region in the
+    base year (default: the latest year), falling back to national and then equal shares;
+    the wage carries over. Codes merging into one occupation are summed, with an
+    employment-weighted mean wage.
+    """
+    if crosswalk.empty or panel.empty:
+        return panel
+    base_year = panel['year'].max() if base_year is None else base_year
+    soc_2018 = set(panel.loc[panel['year'] > HYBRID_SOC_YEARS[-1], 'soc_code']) | set(crosswalk['target_code'])
+    sources = set(crosswalk['source_code'])
+
+    remap = panel['soc_code'].isin(sources) & (
+        (panel['year'] <= LAST_SOC_2010_YEAR)
+        | (panel['year'].isin(HYBRID_SOC_YEARS) & ~panel['soc_code'].isin(soc_2018)))
+    if not remap.any():
+        return panel
+
+    mapped = panel[remap].rename(columns={'soc_code': 'source_code'}).merge(crosswalk, on='source_code')
+    base = panel[panel['year'] == base_year]
+    regional = base.groupby(['region_type', 'region', 'soc_code'])['employment'].sum()
+    national = base[base['region_type'] == 'National'].groupby('soc_code')['employment'].sum()
+
+    # Split shares: regional base-year employment, else national, else equal
+    keys = pd.MultiIndex.from_arrays([mapped['region_type'], mapped['region'], mapped['target_code']])
+    weight = pd.Series(regional.reindex(keys).to_numpy(), index=mapped.index)
+    weight = weight.fillna(mapped['target_code'].map(national)).fillna(0)
+    split = mapped.groupby(['year', 'region_type', 'region', 'source_code'])
+    total = weight.groupby([mapped['year'], mapped['region_type'], mapped['region'], mapped['source_code']]).transform('sum')
+    share = (weight / total).where(total > 0, 1 / split['target_code'].transform('size'))
+    mapped['employment'] = mapped['employment'] * share
+    mapped = mapped.drop(columns='source_code').rename(columns={'target_code': 'soc_code'})
+
+    # Targets get their SOC 2018 titles; the major group is unchanged by the mapping of detailed codes
+    titles = panel.loc[~remap].drop_duplicates('soc_code', keep='last').set_index('soc_code')
+    majors = panel.loc[~remap].dropna(subset=['major_group_name']).drop_duplicates(
+        'soc_code', keep='last').set_index('soc_code')['major_group_name']
+    mapped['occupation_title'] = mapped['soc_code'].map(titles['occupation_title']).fillna(mapped['occupation_title'])
+    mapped['major_group_name'] = mapped['soc_code'].str[:2].map(
+        majors.groupby(majors.index.str[:2]).last()).fillna(mapped['major_group_name'])
+
+    combined = pd.concat([panel[~remap], mapped[panel.columns]], ignore_index=True)
+    keys = ['year', 'region_type', 'region', 'soc_code']
+    merged = combined.duplicated(keys, keep=False)
+    if merged.any():
+        rows = combined[merged].copy()
+        wage_known = rows['annual_mean_wage'].notna() & rows['employment'].notna()
+        rows['wage_bill'] = (rows['annual_mean_wage'] * rows['employment']).where(wage_known, 0)
+        rows['wage_weight'] = rows['employment'].where(wage_known, 0)
+        grouped = rows.groupby(keys, sort=False)
+        collapsed = grouped.agg(occupation_title=('occupation_title', 'first'),
+                                major_group_name=('major_group_name', 'first'),
+                                employment=('employment', lambda emp: emp.sum(min_count=1)),
+                                wage_bill=('wage_bill', 'sum'), wage_weight=('wage_weight', 'sum')).reset_index()
+        collapsed['annual_mean_wage'] = (collapsed['wage_bill'] / collapsed['wage_weight']).where(collapsed['wage_weight'] > 0)
+        combined = pd.concat([combined[~merged], collapsed[panel.columns]], ignore_index=True)
+    return combined
+
+
+def load_complexity_scores(path):
+    """
+    Load the job complexity score of every SOC occupation from a job complexity table.
+
+    The code and score columns are the first of COMPLEXITY_CODE_COLUMNS and
+    COMPLEXITY_SCORE_COLUMNS the table has; tables with a Region_Type column (the output of
+    calculate_complexity*.py) contribute their US rows. O*NET-SOC codes are averaged to SOC.
+
+    Returns:
+    Series of complexity scores indexed by SOC code (empty if the file is missing)
+    """
+    if not path or not os.path.exists(path):
+        return pd.Series(dtype=np.float64)
+    complexity = pd.read_csv(path, dtype=str)
+    code_col = next((col for col in COMPLEXITY_CODE_COLUMNS if col in complexity.columns), None)
+    score_col = next((col for col in COMPLEXITY_SCORE_COLUMNS if col in complexity.columns), None)
+    if code_col is None or score_col is None:
+        raise ValueError(f"{path} has no occupation code column ({', '.join(COMPLEXITY_CODE_COLUMNS)}) "
+                         f"or no job complexity column ({', '.join(COMPLEXITY_SCORE_COLUMNS)}); "
+                         f"its columns are {', '.join(complexity.columns)}")
+    if 'Region_Type' in complexity.columns:
+        complexity = complexity[complexity['Region_Type'] == 'US']
+    scores = pd.to_numeric(complexity[score_col], errors='coerce')
+    return scores.groupby(normalize_soc(complexity[code_col], style='soc')).mean()
+
+
+def _load_manifest(work_dir):
+    manifest_path = os.path.join(work_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def build_panel(release_dir, output_path, work_dir, workers=1, crosswalk_path=None, complexity_path=None):
+    """
+    Build the year x region x occupation panel from a directory of yearly OEWS releases.
+
+    Each release year is read in its own worker into a Parquet part under work_dir; years
+    whose release files are unchanged since the last build are not read again. The parts
+    are then harmonized to SOC 2018 (see harmonize_soc) and written to output_path.
+
+    Returns:
+    dict with the panel years, the years ingested in this run and the number of rows
+    """
+    releases = find_release_files(release_dir)
+    if not releases:
+        raise FileNotFoundError(f"No OEWS release workbooks found under {release_dir}")
+    # Read before any year is ingested, so an unusable table fails the build up front
+    complexity_scores = load_complexity_scores(complexity_path)
+    os.makedirs(work_dir, exist_ok=True)
+
+    manifest = _load_manifest(work_dir)
+    tasks = []
+    for year, files in sorted(releases.items()):
+        part_path = os.path.join(work_dir, f'oews_{year}.parquet')
+        fingerprint = _fingerprint(files)
+        if manifest.get(str(year)) != fingerprint or not os.path.exists(part_path):
+            tasks.append((year, files, part_path))
+
+    if workers <= 1 or len(tasks) <= 1:
+        results = [_ingest_year(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=pool_context()) as pool:
+            results = list(pool.map(_ingest_year, tasks))
+
+    # Only years that are still in the release directory stay in the manifest
+    manifest = {str(year): _fingerprint(files) for year, files in sorted(releases.items())}
+    with open(os.path.join(work_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    panel = pd.concat([pd.read_parquet(os.path.join(work_dir, f'oews_{year}.parquet')) for year in sorted(releases)],
+                      ignore_index=True)
+    panel = harmonize_soc(panel, load_soc_crosswalk(crosswalk_path))
+
+    # Split employment is fractional; the panel keeps whole workers and dollars like the releases
+    for col in ('employment', 'annual_mean_wage'):
+        panel[col] = panel[col].round().astype('Int64')
+    panel['gdp'] = panel['employment'] * panel['annual_mean_wage']
+    panel['complexity_score'] = panel['soc_code'].map(complexity_scores).astype(np.float64)
+
+    panel['region_type'] = pd.Categorical(panel['region_type'], categories=REGION_TYPE_ORDER, ordered=True)
+    panel = panel.sort_values(['year', 'region_type', 'region', 'soc_code'], ascending=[False, True, True, True])
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    panel[PANEL_COLUMNS].to_csv(output_path, index=False)
+    return {'years': sorted(releases), 'ingested': [year for year, _ in results], 'rows': len(panel)}
@@ -0,0 +1,297 @@
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from oews_series import SERIES_ID_WIDTH, series_id_columns
+
+# Columns of the tab-separated oe.data.*.AllData.txt files
+ALLDATA_COLUMNS = ['series_id', 'year', 'period', 'value', 'footnote_codes']
+
+# Series id fields kept in every parsed batch
+BATCH_SERIES_FIELDS = ['areatype', 'area_code', 'industry_code', 'occupation_code', 'datatype']
+
+# Markers BLS puts in the value column instead of a number
+# (not available, estimate not released, wage above the top-coding threshold)
+VALUE_MARKERS = ['-', '*', '**', '#', '~']
+
+# Bytes read from the file per parsed batch (~600k rows of AllData)
+DEFAULT_BLOCK_BYTES = 32 * 1024 * 1024
+
+# Compressed inputs are decompressed on the fly instead of being extracted to disk
+COMPRESSED_SUFFIXES = ('.zip', '.gz', '.xz')
+
+# Decompressed bytes handed over per read of the decompression thread, and reads kept in flight
+PREFETCH_BYTES = 4 * 1024 * 1024
+PREFETCH_DEPTH = 8
+
+
+class _PrefetchStream(io.RawIOBase):
+    # Reads a (decompressing) stream on a background thread, so decompression overlaps with
+    # parsing; zlib and lzma release the GIL while they work
+    def __init__(self, raw, chunk_bytes=PREFETCH_BYTES, depth=PREFETCH_DEPTH):
+        super().__init__()
+        self._raw = raw
+        self._chunks = queue.Queue(maxsize=depth)
+        self._buffer = b''
+        self._offset = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._fill, args=(chunk_bytes,), daemon=True)
+        self._thread.start()
+
+    def _fill(self, chunk_bytes):
+        try:
+            while not self._stopped.is_set():
+                chunk = self._raw.read(chunk_bytes)
+                self._chunks.put(chunk)
+                if not chunk:
+                    return
+        except Exception as e:
+            self._chunks.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._offset >= len(self._buffer):
+            chunk = self._chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if not chunk:
+                # Keep reporting the end of the stream to later reads
+                self._chunks.put(chunk)
+                return 0
+            self._buffer, self._offset = chunk, 0
+        n = min(len(b), len(self._buffer) - self._offset)
+        b[:n] = self._buffer[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            # Unblock the thread if it waits for room in the queue
+            while self._thread.is_alive():
+                try:
+                    self._chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self._raw.close()
+        super().close()
+
+
+def is_compressed(path):
+    """
+    Check whether a path names a .zip, .gz or .xz input.
+    """
+    return isinstance(path, (str, os.PathLike)) and str(path).lower().endswith(COMPRESSED_SUFFIXES)
+
+
+def _open_zip_member(path, member=None):
+    # The member stream keeps the archive file open after the ZipFile itself is closed
+    with zipfile.ZipFile(path) as archive:
+        files = [info for info in archive.infolist() if not info.is_dir()]
+        if member is None:
+            # Releases hold one large data file next to small readme/footnote files
+            return archive.open(max(files, key=lambda info: info.file_size))
+        for info in files:
+            if info.filename == member or os.path.basename(info.filename) == member:
+                return archive.open(info)
+    raise FileNotFoundError(f"{member} not found in {path}")
+
+
+def open_input(path, member=None, prefetch=True):
+    """
+    Open a data file for binary streaming reads, decompressing .zip, .gz and .xz inputs on the fly.
+
+    Parameters:
+    path: path of a plain or compressed file
+    member: file inside a .zip archive, by name or base name (default: the largest file)
+    prefetch: decompress on a background thread, overlapped with the caller's work
+
+    Returns:
+    a binary file object; compressed inputs are not seekable
+    """
+    lower = str(path).lower()
+    if lower.endswith('.zip'):
+        raw = _open_zip_member(path, member)
+    elif lower.endswith('.gz'):
+        raw = gzip.open(path, 'rb')
+    elif lower.endswith('.xz'):
+        raw = lzma.open(path, 'rb')
+    else:
+        return open(path, 'rb')
+    if not prefetch:
+        return raw
+    return io.BufferedReader(_PrefetchStream(raw), buffer_size=PREFETCH_BYTES)
+
+
+def read_input_bytes(path, member=None):
+    """
+    Read a whole (possibly zipped) file into memory as a seekable buffer, e.g. an .xlsx
+    workbook inside a BLS release archive, without extracting it to disk.
+    """
+    with open_input(path, member, prefetch=False) as f:
+        return io.BytesIO(f.read())
+
+
+def parse_alldata_block(data):
+    """
+    Parse a block of complete AllData lines into a typed columnar batch.
+
+    Parameters:
+    data: bytes holding whole lines (the last line must end with a newline)
+
+    Returns:
+    DataFrame with categorical series id fields (areatype, area_code, industry_code,
+    occupation_code, soc_code, datatype, data_type), int16 year, categorical period,
+    float64 value (NaN where BLS published a marker) and categorical footnote_codes
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    line_ends = np.flatnonzero(buf == ord('\n'))
+    line_starts = np.empty_like(line_ends)
+    line_starts[:1] = 0
+    line_starts[1:] = line_ends[:-1] + 1
+    # read_csv skips blank lines, so they are dropped here as well
+    line_starts = line_starts[line_ends - line_starts > 1]
+    if len(line_starts) and line_starts[-1] + SERIES_ID_WIDTH > len(buf):
+        raise ValueError("Malformed AllData block: truncated series id on the last line")
+
+    # Every line starts with the series id, so it is cut straight out of the buffer
+    # instead of being materialized as one Python string per row
+    windows = np.lib.stride_tricks.sliding_window_view(buf, SERIES_ID_WIDTH)
+    series_ids = np.ascontiguousarray(windows[line_starts]).view(f'S{SERIES_ID_WIDTH}').ravel()
+    columns = series_id_columns(series_ids, BATCH_SERIES_FIELDS)
+
+    rest = pd.read_csv(
+        io.BytesIO(data),
+        sep='\t',
+        header=None,
+        names=ALLDATA_COLUMNS,
+        usecols=ALLDATA_COLUMNS[1:],
+        dtype={'year': np.int16, 'period': 'category', 'value': np.float64, 'footnote_codes': 'category'},
+        na_values=VALUE_MARKERS,
+        keep_default_na=False,
+        skipinitialspace=True,
+    )
+    if len(rest) != len(series_ids):
+        raise ValueError(f"Malformed AllData block: {len(series_ids)} series ids but {len(rest)} rows")
+
+    for col in ALLDATA_COLUMNS[1:]:
+        columns[col] = rest[col].array
+    return pd.DataFrame(columns, copy=False)
+
+
+def iter_alldata_blocks(path, block_bytes=DEFAULT_BLOCK_BYTES, start=0, stop=None):
+    """
+    Stream an AllData file as parsed batches of whole lines, using constant memory.
+
+    Parameters:
+    path: path of the AllData text file, optionally .zip/.gz/.xz compressed (or an open binary file object)
+    block_bytes: number of bytes read per batch
+    start: byte offset of the first line to parse (must be the start of a line); offsets
+           of compressed inputs count decompressed bytes
+    stop: byte offset where parsing ends (default: end of file)
+
+    Yields:
+    (block_start, block_end, batch) where block_end is the byte offset just past
+    the last line in the batch, so a later run can resume from it
+    """
+    f = open_input(path) if isinstance(path, (str, bytes)) or hasattr(path, '__fspath__') else path
+    try:
+        if start and f.seekable():
+            f.seek(start)
+        elif start:
+            # Streams can only be skipped forward by reading
+            remaining = start
+            while remaining:
+                skipped = len(f.read(min(remaining, block_bytes)))
+                if not skipped:
+                    break
+                remaining -= skipped
+        offset = start
+        pending = b''
+        while True:
+            to_read = block_bytes if stop is None else min(block_bytes, stop - offset - len(pending))
+            data = f.read(to_read) if to_read > 0 else b''
+            at_end = len(data) < to_read or to_read <= 0
+
+            data = pending + data
+            cut = len(data) if at_end else data.rfind(b'\n') + 1
+            if cut == 0 and not at_end:
+                # A single line longer than the block, keep reading
+                pending = data
+                continue
+            block, pending = data[:cut], data[cut:]
+
+            block_start = offset
+            offset += len(block)
+            if block_start == 0 and block.startswith(b'series_id'):
+                # Skip the header line
+                header_end = block.find(b'\n') + 1 or len(block)
+                block = block[header_end:]
+            if block.strip():
+                if not block.endswith(b'\n'):
+                    block += b'\n'
+                yield block_start, offset, parse_alldata_block(block)
+
+            if at_end:
+                break
+    finally:
+        if f is not path:
+            f.close()
+
+
+def iter_alldata_batches(path, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Stream an AllData file as typed columnar batches (see parse_alldata_block).
+    """
+    for _, _, batch in iter_alldata_blocks(path, block_bytes=block_bytes):
+        yield batch
+
+
+def split_byte_ranges(path, parts, start=0):
+    """
+    Split an AllData file into newline-aligned byte ranges of roughly equal size.
+
+    Parameters:
+    start: byte offset where the first range begins (must be the start of a line)
+
+    Returns:
+    list of (start, stop) offsets covering the file from `start` to the end; every range
+    starts at the beginning of a line, so it can be parsed on its own with iter_alldata_blocks
+    """
+    size = os.path.getsize(path)
+    bounds = [start]
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            target = max(start + (size - start) * i // parts, bounds[-1])
+            f.seek(target)
+            # Move forward to the start of the next line
+            f.readline()
+            position = min(f.tell(), size)
+            if position > bounds[-1]:
+                bounds.append(position)
+    if bounds[-1] < size:
+        bounds.append(size)
+    return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def load_area_names(path):
+    """
+    Load area names from the BLS oe.area file.
+
+    Returns:
+    dict mapping the 7-character area code to the area name (empty if the file is missing)
+    """
+    if not os.path.exists(path):
+        return {}
+    areas = pd.read_csv(path, sep='\t', dtype=str, skipinitialspace=True)
+    areas.columns = areas.columns.str.strip()
+    return dict(zip(areas['area_code'].str.strip(), areas['area_name'].str.strip()))
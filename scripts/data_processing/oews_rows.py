@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+
+# Series id fields kept for every value row
+ROW_FIELDS = ['areatype', 'area_code', 'occupation_code', 'datatype']
+
+# Bits of the per-row flags array
+SUPPRESSED = 1  # BLS published a marker ('-', '*', '**', '#', '~') instead of a number
+FOOTNOTE = 2    # the row carries footnote codes
+
+
+def _has_footnote(footnotes):
+    # Rows with footnote codes; the AllData reader keeps empty fields as '' (not NaN), so
+    # blank codes count as none. Categoricals are tested once per category.
+    if isinstance(footnotes.dtype, pd.CategoricalDtype):
+        marked = footnotes.cat.categories.astype(str).str.strip() != ''
+        return np.append(marked, False)[footnotes.cat.codes.to_numpy()]
+    return (footnotes.notna() & footnotes.astype(str).str.strip().ne('')).to_numpy()
+
+
+class CodeBook:
+    """
+    Lookup table between the distinct labels of a field and small integer codes.
+
+    Codebooks only grow, so codes handed out once stay valid and several row
+    containers can share one codebook.
+    """
+
+    def __init__(self, labels=()):
+        self.labels = []
+        self.index = {}
+        self.encode(labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def encode(self, labels):
+        """
+        Return the codes of `labels` (adding new labels to the codebook) as an int array.
+        """
+        codes = np.empty(len(labels), dtype=np.int32)
+        for i, label in enumerate(labels):
+            code = self.index.get(label)
+            if code is None:
+                code = self.index[label] = len(self.labels)
+                self.labels.append(label)
+            codes[i] = code
+        return codes
+
+    @property
+    def code_dtype(self):
+        # Areas and occupations number in the hundreds to low thousands, so int16 usually fits
+        return np.int16 if len(self.labels) < np.iinfo(np.int16).max else np.int32
+
+
+class CompactRows:
+    """
+    Compact container of OEWS value rows.
+
+    Each field is stored as small-integer codes into a shared CodeBook, values as a
+    float array and suppression/footnote information as a separate uint8 flags array,
+    instead of one Python string per row and field. Rows are appended in batches and
+    concatenated lazily.
+    """
+
+    def __init__(self, fields=ROW_FIELDS, codebooks=None, value_dtype=np.float64):
+        self.fields = list(fields)
+        self.codebooks = codebooks if codebooks is not None else {field: CodeBook() for field in self.fields}
+        self.value_dtype = np.dtype(value_dtype)
+        self._parts = []
+
+    @classmethod
+    def from_frame(cls, frame, fields=ROW_FIELDS, codebooks=None, value_dtype=np.float64):
+        """
+        Build a container from a DataFrame with the fields, a value column and
+        optionally footnote_codes (e.g. a batch from oews_reader.parse_alldata_block).
+        """
+        rows = cls(fields, codebooks, value_dtype)
+        rows.append_frame(frame)
+        return rows
+
+    @classmethod
+    def concat(cls, containers, fields=ROW_FIELDS, value_dtype=np.float64):
+        """
+        Concatenate containers in order into a new one with its own codebooks.
+        """
+        rows = cls(fields, value_dtype=value_dtype)
+        for other in containers:
+            rows.extend(other)
+        return rows
+
+    def _encode_column(self, field, column):
+        codebook = self.codebooks[field]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            # Only the categories go through the codebook
+            mapping = codebook.encode(column.cat.categories.astype(str).tolist())
+            codes = column.cat.codes.to_numpy()
+        else:
+            codes, uniques = pd.factorize(column)
+            mapping = codebook.encode(np.asarray(uniques).astype(str).tolist())
+        return mapping.astype(codebook.code_dtype)[codes]
+
+    def append_codes(self, codes, values, flags=None):
+        """
+        Append rows given as codes of this container's codebooks.
+        """
+        values = np.asarray(values, dtype=self.value_dtype)
+        if flags is None:
+            flags = np.where(np.isnan(values), SUPPRESSED, 0).astype(np.uint8)
+        part = {field: np.asarray(codes[field]) for field in self.fields}
+        part['value'] = values
+        part['flags'] = np.asarray(flags, dtype=np.uint8)
+        self._parts.append(part)
+
+    def append_frame(self, frame):
+        """
+        Append the rows of a DataFrame (see from_frame).
+        """
+        codes = {field: self._encode_column(field, frame[field]) for field in self.fields}
+        values = frame['value'].to_numpy(dtype=self.value_dtype)
+        flags = np.where(np.isnan(values), SUPPRESSED, 0).astype(np.uint8)
+        if 'footnote_codes' in frame.columns:
+            flags |= np.where(_has_footnote(frame['footnote_codes']), FOOTNOTE, 0).astype(np.uint8)
+        self.append_codes(codes, values, flags)
+
+    def extend(self, other):
+        """
+        Append the rows of another container, translating its codes into this one's codebooks.
+        """
+        if other.codebooks is self.codebooks:
+            self._parts.extend(other._parts)
+            return
+        codes = {}
+        for field in self.fields:
+            mapping = self.codebooks[field].encode(other.codebooks[field].labels)
+            codes[field] = mapping.astype(self.codebooks[field].code_dtype)[other.codes(field)]
+        self.append_codes(codes, other.values, other.flags)
+
+    def _consolidate(self):
+        if len(self._parts) == 1:
+            return self._parts[0]
+        columns = self.fields + ['value', 'flags']
+        if not self._parts:
+            part = {field: np.empty(0, dtype=self.codebooks[field].code_dtype) for field in self.fields}
+            part['value'] = np.empty(0, dtype=self.value_dtype)
+            part['flags'] = np.empty(0, dtype=np.uint8)
+        else:
+            part = {col: np.concatenate([p[col] for p in self._parts]) for col in columns}
+        self._parts = [part]
+        return part
+
+    def __len__(self):
+        return sum(len(part['value']) for part in self._parts)
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for part in self._parts for arr in part.values())
+
+    @property
+    def values(self):
+        return self._consolidate()['value']
+
+    @property
+    def flags(self):
+        return self._consolidate()['flags']
+
+    def codes(self, field):
+        return self._consolidate()[field]
+
+    def labels(self, field):
+        return self.codebooks[field].labels
+
+    def code_of(self, field, label):
+        """
+        Return the code of a label, or -1 when it never occurred.
+        """
+        return self.codebooks[field].index.get(label, -1)
+
+    def column(self, field):
+        """
+        Return a field as a pandas Categorical (no per-row strings are created).
+        """
+        return pd.Categorical.from_codes(self.codes(field), categories=self.labels(field))
+
+    def decoded(self, field):
+        """
+        Return a field as a numpy array of labels.
+        """
+        return np.asarray(self.labels(field), dtype=object)[self.codes(field)]
+
+    def take(self, selection):
+        """
+        Return the rows selected by a boolean mask or index array, sharing the codebooks.
+        """
+        part = self._consolidate()
+        rows = CompactRows(self.fields, self.codebooks, self.value_dtype)
+        rows.append_codes({field: part[field][selection] for field in self.fields},
+                          part['value'][selection], part['flags'][selection])
+        return rows
+
+    def to_frame(self):
+        """
+        Return the rows as a DataFrame with categorical fields, value and flags.
+        """
+        frame = {field: self.column(field) for field in self.fields}
+        frame['value'] = self.values
+        frame['flags'] = self.flags
+        return pd.DataFrame(frame, copy=False)
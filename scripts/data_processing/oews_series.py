@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+
+# Layout of an OEWS series_id as documented in the BLS oe.series file
+# Example: OEUM001018000000000000001
+#   OE       survey abbreviation
+#   U        seasonal code
+#   M        area type (N = national, S = state, M = metropolitan/nonmetropolitan)
+#   0010180  area code (7 characters)
+#   000000   industry code
+#   000000   occupation code
+#   01       data type
+SERIES_ID_WIDTH = 25
+SERIES_ID_FIELDS = {
+    'survey': (0, 2),
+    'seasonal': (2, 3),
+    'areatype': (3, 4),
+    'area_code': (4, 11),
+    'industry_code': (11, 17),
+    'occupation_code': (17, 23),
+    'datatype': (23, 25),
+}
+
+NATIONAL_AREA_CODE = '0000000'
+ALL_INDUSTRIES_CODE = '000000'
+ALL_OCCUPATIONS_CODE = '000000'
+
+# Data type codes from the BLS oe.datatype file
+DATATYPE_NAMES = {
+    '01': 'employment',
+    '02': 'employment_rse',
+    '03': 'hourly_mean_wage',
+    '04': 'annual_mean_wage',
+    '05': 'wage_rse',
+    '06': 'hourly_10pct_wage',
+    '07': 'hourly_25pct_wage',
+    '08': 'hourly_median_wage',
+    '09': 'hourly_75pct_wage',
+    '10': 'hourly_90pct_wage',
+    '11': 'annual_10pct_wage',
+    '12': 'annual_25pct_wage',
+    '13': 'annual_median_wage',
+    '14': 'annual_75pct_wage',
+    '15': 'annual_90pct_wage',
+    '16': 'employment_per_1000',
+    '17': 'location_quotient',
+}
+
+# State area codes are the 2-digit FIPS code followed by '00000' (areatype S)
+STATE_NAMES = {
+    '01': 'Alabama', '02': 'Alaska', '04': 'Arizona', '05': 'Arkansas', '06': 'California',
+    '08': 'Colorado', '09': 'Connecticut', '10': 'Delaware', '11': 'District of Columbia',
+    '12': 'Florida', '13': 'Georgia', '15': 'Hawaii', '16': 'Idaho', '17': 'Illinois',
+    '18': 'Indiana', '19': 'Iowa', '20': 'Kansas', '21': 'Kentucky', '22': 'Louisiana',
+    '23': 'Maine', '24': 'Maryland', '25': 'Massachusetts', '26': 'Michigan', '27': 'Minnesota',
+    '28': 'Mississippi', '29': 'Missouri', '30': 'Montana', '31': 'Nebraska', '32': 'Nevada',
+    '33': 'New Hampshire', '34': 'New Jersey', '35': 'New Mexico', '36': 'New York',
+    '37': 'North Carolina', '38': 'North Dakota', '39': 'Ohio', '40': 'Oklahoma', '41': 'Oregon',
+    '42': 'Pennsylvania', '44': 'Rhode Island', '45': 'South Carolina', '46': 'South Dakota',
+    '47': 'Tennessee', '48': 'Texas', '49': 'Utah', '50': 'Vermont', '51': 'Virginia',
+    '53': 'Washington', '54': 'West Virginia', '55': 'Wisconsin', '56': 'Wyoming',
+    '66': 'Guam', '72': 'Puerto Rico', '78': 'Virgin Islands',
+}
+
+
+def default_area_name(areatype, area_code):
+    """
+    Name an area without the BLS oe.area file: 'National', the state name, or 'Area <code>'.
+    """
+    if area_code == NATIONAL_AREA_CODE:
+        return 'National'
+    if areatype == 'S' and area_code[:2] in STATE_NAMES:
+        return STATE_NAMES[area_code[:2]]
+    return f"Area {area_code}"
+
+
+def _as_bytes(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'S':
+        return values
+    return np.char.encode(values.astype('U'), 'ascii')
+
+
+def _as_series_id_bytes(series_ids):
+    # Convert any array-like of series ids to a fixed-width bytes array
+    if isinstance(series_ids, pd.Series):
+        series_ids = series_ids.to_numpy()
+    ids = np.asarray(series_ids)
+    if ids.dtype.kind == 'S' and ids.dtype.itemsize == SERIES_ID_WIDTH:
+        return ids
+    if ids.dtype.kind != 'S':
+        ids = ids.astype('S')
+    # Padded ids ("OEUM...01     ") are cut back to the fixed width here
+    width = ids.dtype.itemsize
+    raw = ids.view(np.uint8).reshape(-1, width)
+    if width < SERIES_ID_WIDTH:
+        raw = np.pad(raw, ((0, 0), (0, SERIES_ID_WIDTH - width)))
+    return np.ascontiguousarray(raw[:, :SERIES_ID_WIDTH]).view(f'S{SERIES_ID_WIDTH}').ravel()
+
+
+def factorize_codes(values):
+    """
+    Factorize a fixed-width bytes array (up to 8 characters) by hashing it as integers.
+
+    Returns:
+    codes: int array of category codes
+    uniques: numpy array of the distinct values as str
+    """
+    values = _as_bytes(values)
+    width = values.dtype.itemsize
+    if width > 8:
+        codes, uniques = pd.factorize(values)
+        return codes, np.char.decode(uniques.astype(values.dtype), 'ascii')
+    padded = np.zeros((len(values), 8), dtype=np.uint8)
+    padded[:, :width] = values.view(np.uint8).reshape(-1, width)
+    codes, uniques = pd.factorize(padded.view(np.uint64).ravel())
+    uniques = np.ascontiguousarray(uniques.astype(np.uint64)).view(np.uint8).reshape(-1, 8)[:, :width]
+    return codes, np.char.decode(np.ascontiguousarray(uniques).view(f'S{width}').ravel(), 'ascii')
+
+
+def decode_series_ids(series_ids, fields=None):
+    """
+    Decode a whole column of series ids into its fixed-width fields at once.
+
+    Parameters:
+    series_ids: array-like of series ids (str, bytes or a pandas Series)
+    fields: optional list of field names to return (default: all fields)
+
+    Returns:
+    dict mapping field name to a fixed-width bytes array (dtype 'S<n>')
+    """
+    ids = _as_series_id_bytes(series_ids)
+    raw = ids.view(np.uint8).reshape(-1, SERIES_ID_WIDTH)
+
+    decoded = {}
+    for name in fields or SERIES_ID_FIELDS:
+        start, stop = SERIES_ID_FIELDS[name]
+        decoded[name] = np.ascontiguousarray(raw[:, start:stop]).view(f'S{stop - start}').ravel()
+    return decoded
+
+
+def encode_series_ids(area_code, occupation_code, datatype, areatype='N',
+                      industry_code=ALL_INDUSTRIES_CODE, seasonal='U', survey='OE'):
+    """
+    Build series ids from their fields; scalars are broadcast against arrays.
+
+    Returns:
+    numpy array of series ids (dtype 'S25')
+    """
+    parts = {
+        'survey': survey,
+        'seasonal': seasonal,
+        'areatype': areatype,
+        'area_code': area_code,
+        'industry_code': industry_code,
+        'occupation_code': occupation_code,
+        'datatype': datatype,
+    }
+    arrays = {name: _as_bytes(value) for name, value in parts.items()}
+    n = max(arr.size for arr in arrays.values())
+
+    raw = np.empty((n, SERIES_ID_WIDTH), dtype=np.uint8)
+    for name, (start, stop) in SERIES_ID_FIELDS.items():
+        width = stop - start
+        field = np.broadcast_to(arrays[name].astype(f'S{width}').ravel(), (n,))
+        field_bytes = np.ascontiguousarray(field).view(np.uint8).reshape(n, width)
+        if (field_bytes == 0).any():
+            raise ValueError(f"Field '{name}' must be exactly {width} characters wide")
+        raw[:, start:stop] = field_bytes
+    return raw.view(f'S{SERIES_ID_WIDTH}').ravel()
+
+
+def to_soc_codes(occupation_codes):
+    """
+    Format 6-digit occupation codes as SOC codes (XX-XXXX) without a per-row loop.
+    """
+    codes = _as_bytes(occupation_codes)
+    raw = codes.astype('S6').view(np.uint8).reshape(-1, 6)
+
+    soc = np.empty((len(raw), 7), dtype=np.uint8)
+    soc[:, :2] = raw[:, :2]
+    soc[:, 2] = ord('-')
+    soc[:, 3:] = raw[:, 2:]
+    return np.char.decode(soc.view('S7').ravel(), 'ascii')
+
+
+def datatype_names(datatypes):
+    """
+    Map 2-digit data type codes to their names; unknown codes become 'unknown_<code>'.
+    """
+    codes, uniques = factorize_codes(datatypes)
+    # Only the handful of distinct codes go through the dictionary lookup
+    names = [DATATYPE_NAMES.get(code, f"unknown_{code}") for code in uniques]
+    return pd.Categorical.from_codes(codes, categories=names)
+
+
+def series_id_columns(series_ids, fields=None):
+    """
+    Decode series ids into categorical columns plus soc_code and data_type.
+
+    Only the distinct values of each field are turned into Python strings, so the
+    cost per row stays in numpy.
+
+    Parameters:
+    series_ids: array-like of series ids (str, bytes or a pandas Series)
+    fields: optional list of series id fields to decode (default: all fields)
+
+    Returns:
+    dict mapping column name to a pandas Categorical
+    """
+    columns = {}
+    for name, values in decode_series_ids(series_ids, fields).items():
+        codes, uniques = factorize_codes(values)
+        columns[name] = pd.Categorical.from_codes(codes, categories=uniques)
+        if name == 'occupation_code':
+            columns['soc_code'] = pd.Categorical.from_codes(codes, categories=to_soc_codes(uniques))
+        elif name == 'datatype':
+            names = [DATATYPE_NAMES.get(code, f"unknown_{code}") for code in uniques]
+            columns['data_type'] = pd.Categorical.from_codes(codes, categories=names)
+    return columns
+
+
+def series_id_frame(series_ids, fields=None):
+    """
+    Decode series ids into a DataFrame (see series_id_columns), keeping the index
+    of a pandas Series input.
+    """
+    index = series_ids.index if isinstance(series_ids, pd.Series) else None
+    return pd.DataFrame(series_id_columns(series_ids, fields), index=index)
@@ -0,0 +1,190 @@
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from oews_series import DATATYPE_NAMES, ALL_INDUSTRIES_CODE, to_soc_codes
+from oews_reader import iter_alldata_blocks, split_byte_ranges, is_compressed, DEFAULT_BLOCK_BYTES
+from oews_ingest import summarize_batch, merge_summaries, VALUE_COLUMNS
+from worker_pool import pool_context
+from oews_rows import CompactRows
+
+# Hive-style partition columns of the store (e.g. areatype=N/datatype=01/part-0.parquet)
+PARTITION_COLUMNS = ['areatype', 'datatype']
+
+# Partition values are codes, so they must not be inferred as integers on read
+PARTITIONING = ds.partitioning(pa.schema([('areatype', pa.string()), ('datatype', pa.string())]), flavor='hive')
+
+STORED_COLUMNS = ['areatype', 'area_code', 'industry_code', 'occupation_code', 'datatype',
+                  'year', 'period', 'value', 'footnote_codes']
+
+MANIFEST_FILE = '_manifest.json'
+
+
+def _write_batch(batch, store_dir, name):
+    # Sorting by area code keeps area filters cheap through the row group statistics
+    batch = batch[STORED_COLUMNS].sort_values(['area_code', 'occupation_code'], kind='stable')
+    table = pa.Table.from_pandas(batch, preserve_index=False)
+    pq.write_to_dataset(table, store_dir, partition_cols=PARTITION_COLUMNS,
+                        basename_template=f'{name}-{{i}}.parquet')
+
+
+def _manifest_entry(batch):
+    summary = summarize_batch(batch, area_codes=())
+    summary['datatype_counts'] = batch['datatype'].value_counts().to_dict()
+    return summary
+
+
+def _write_range(task):
+    # Worker entry point: convert one byte range of the raw file into store partitions
+    path, store_dir, start, stop, block_bytes = task
+    entries = []
+    for block_start, _, batch in iter_alldata_blocks(path, block_bytes, start=start, stop=stop):
+        _write_batch(batch, store_dir, f'part-{block_start:012d}')
+        entries.append(_manifest_entry(batch))
+    return entries
+
+
+def build_alldata_store(path, store_dir, workers=1, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Convert a raw AllData file into a partitioned Parquet store (one-time step per release).
+
+    Parameters:
+    path: path of the oe.data.1.AllData.txt file (optionally .zip/.gz/.xz compressed)
+    store_dir: directory of the store; an existing store there is replaced
+    workers: number of worker processes converting byte ranges in parallel
+
+    Returns:
+    the manifest dict that is also written to <store_dir>/_manifest.json
+    """
+    if os.path.exists(os.path.join(store_dir, MANIFEST_FILE)):
+        shutil.rmtree(store_dir)
+    elif os.path.exists(store_dir) and os.listdir(store_dir):
+        raise ValueError(f"{store_dir} exists and is not an OEWS store, refusing to overwrite it")
+    os.makedirs(store_dir, exist_ok=True)
+
+    # A compressed file is streamed through one decompressor, so it is converted as one range
+    ranges = [(0, None)] if is_compressed(path) else split_byte_ranges(path, max(workers, 1))
+    tasks = [(path, store_dir, start, stop, block_bytes) for start, stop in ranges]
+    if workers <= 1 or len(tasks) == 1:
+        entries = [entry for task in tasks for entry in _write_range(task)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as pool:
+            entries = [entry for range_entries in pool.map(_write_range, tasks) for entry in range_entries]
+
+    summary = merge_summaries(entries)
+    datatype_counts = {}
+    for entry in entries:
+        for datatype, count in entry['datatype_counts'].items():
+            datatype_counts[datatype] = datatype_counts.get(datatype, 0) + int(count)
+
+    source = os.stat(path)
+    manifest = {
+        'source': os.path.abspath(path),
+        'source_size': source.st_size,
+        'source_mtime': source.st_mtime,
+        'rows': summary['rows'],
+        'area_codes': sorted(summary['area_codes']),
+        'occupation_codes': sorted(summary['occupation_codes']),
+        'datatype_counts': dict(sorted(datatype_counts.items())),
+    }
+    with open(os.path.join(store_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_store_manifest(store_dir):
+    """
+    Load the manifest of a store, or None when store_dir does not hold a complete store.
+    """
+    manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def store_is_current(store_dir, path, store_only=False):
+    """
+    Check that the store was built from the raw file as it is on disk now.
+
+    Parameters:
+    store_dir: directory of the store
+    path: raw AllData file the store should have been built from
+    store_only: use the store as it is, without checking it against the raw file (which
+                then does not need to exist)
+
+    Returns:
+    True when the store should be read instead of the raw file; a missing raw file raises
+    FileNotFoundError unless store_only is set, and store_only without a store does too
+    """
+    manifest = load_store_manifest(store_dir)
+    if store_only:
+        if manifest is None:
+            raise FileNotFoundError(f"No complete store in {store_dir}")
+        return True
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} does not exist" + (
+            f"; to use the store in {store_dir} without checking it against its source, pass --store-only"
+            if manifest is not None else ""))
+    if manifest is None:
+        return False
+    source = os.stat(path)
+    return manifest['source_size'] == source.st_size and manifest['source_mtime'] == source.st_mtime
+
+
+def read_alldata_store(store_dir, areatypes=None, area_codes=None, datatypes=None,
+                       industry_codes=None, columns=None):
+    """
+    Read rows of the store, scanning only the partitions and row groups needed.
+
+    Parameters:
+    areatypes / datatypes: partition values to read (default: all)
+    area_codes / industry_codes: row filters pushed down to the Parquet reader
+    columns: stored columns to return (default: all)
+
+    Returns:
+    DataFrame in the same layout as oews_reader.parse_alldata_block batches
+    """
+    dataset = ds.dataset(store_dir, format='parquet', partitioning=PARTITIONING)
+
+    expression = None
+    for column, values in (('areatype', areatypes), ('datatype', datatypes),
+                           ('area_code', area_codes), ('industry_code', industry_codes)):
+        if values is not None:
+            condition = ds.field(column).isin(list(values))
+            expression = condition if expression is None else expression & condition
+
+    batch = dataset.to_table(columns=columns or STORED_COLUMNS, filter=expression).to_pandas()
+    for column in ('areatype', 'area_code', 'industry_code', 'occupation_code', 'datatype'):
+        if column in batch.columns:
+            batch[column] = batch[column].astype('category')
+
+    # Derived columns, computed once per distinct code
+    if 'occupation_code' in batch.columns:
+        occupation = batch['occupation_code'].cat
+        batch['soc_code'] = occupation.rename_categories(to_soc_codes(occupation.categories.to_numpy(dtype=str)))
+    if 'datatype' in batch.columns:
+        batch['data_type'] = batch['datatype'].cat.rename_categories(
+            lambda code: DATATYPE_NAMES.get(code, f"unknown_{code}"))
+    return batch
+
+
+def store_summary(store_dir, area_codes=None, areatypes=None):
+    """
+    Build the same summary as oews_ingest.summarize_batch for the whole file from the store.
+    """
+    manifest = load_store_manifest(store_dir)
+    values = read_alldata_store(store_dir, areatypes=areatypes, area_codes=area_codes,
+                                industry_codes=[ALL_INDUSTRIES_CODE], columns=VALUE_COLUMNS + ['footnote_codes'])
+    return {
+        'rows': manifest['rows'],
+        'area_codes': set(manifest['area_codes']),
+        'occupation_codes': set(manifest['occupation_codes']),
+        'datatypes': set(manifest['datatype_counts']),
+        'values': CompactRows.from_frame(values),
+    }
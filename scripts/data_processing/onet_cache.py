@@ -0,0 +1,182 @@
+import json
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from oews_excel import read_xlsx
+from oews_reader import read_input_bytes
+from worker_pool import pool_context
+
+DEFAULT_CACHE_ROOT = 'data/processed/onet'
+
+MANIFEST_FILE = 'manifest.json'
+
+# Text columns stored dictionary-encoded (read back as pandas categoricals): identifiers
+# such as 'O*NET-SOC Code', 'Element ID', 'Scale ID', 'DWA ID', and flag/source columns
+CODE_COLUMN = re.compile(r'(Code|ID)$|^(Domain Source|Recommend Suppress|Not Relevant|Category|Date)$')
+
+# Other text columns are dictionary-encoded as well when they repeat this much
+DICTIONARY_MAX_UNIQUE_SHARE = 0.5
+
+
+def release_name(release_path):
+    """
+    Version name of an O*NET release, e.g. 'db_29_3' for data/onet/db_29_3_excel(.zip).
+    """
+    name = os.path.basename(os.path.normpath(release_path))
+    return re.sub(r'(_excel)?(\.zip)?$', '', name, flags=re.IGNORECASE)
+
+
+def table_file(table):
+    """
+    File name of a table in the cache ('Task Ratings' -> 'task_ratings.parquet').
+    """
+    return re.sub(r'[^0-9a-z]+', '_', table.lower()).strip('_') + '.parquet'
+
+
+def _release_workbooks(release_path):
+    # {table name: (path, member)} for every workbook of an extracted or zipped release
+    workbooks = {}
+    if release_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(release_path) as archive:
+            for member in archive.namelist():
+                if member.lower().endswith('.xlsx') and not os.path.basename(member).startswith('~$'):
+                    workbooks[os.path.splitext(os.path.basename(member))[0]] = (release_path, member)
+    else:
+        for name in sorted(os.listdir(release_path)):
+            if name.lower().endswith('.xlsx') and not name.startswith('~$'):
+                workbooks[os.path.splitext(name)[0]] = (os.path.join(release_path, name), None)
+    return workbooks
+
+
+def _source_entry(path, member):
+    source = os.stat(path)
+    return {'path': os.path.abspath(path), 'member': member, 'size': source.st_size, 'mtime': source.st_mtime}
+
+
+def _typed_table(frame):
+    columns = {}
+    for name in frame.columns:
+        column = frame[name]
+        if pd.api.types.is_numeric_dtype(column.dtype) or pd.api.types.is_bool_dtype(column.dtype):
+            columns[name] = column
+            continue
+        # Text, or text mixed with numbers: stored as text
+        text = column.where(column.isna(), column.astype(str))
+        repeats = text.nunique() <= DICTIONARY_MAX_UNIQUE_SHARE * max(len(text), 1)
+        columns[name] = text.astype('category') if CODE_COLUMN.search(name) or repeats else text.astype(object)
+    return pa.Table.from_pandas(pd.DataFrame(columns), preserve_index=False)
+
+
+def _convert_workbook(task):
+    # Worker entry point: convert one workbook into one Parquet file of the cache
+    table, path, member, cache_dir = task
+    source = path if member is None else read_input_bytes(path, member)
+    arrow_table = _typed_table(read_xlsx(source))
+    pq.write_table(arrow_table, os.path.join(cache_dir, table_file(table)))
+    return table, arrow_table.num_rows, {field.name: str(field.type) for field in arrow_table.schema}
+
+
+def load_onet_manifest(cache_dir):
+    """
+    Load the manifest of a release cache, or None when there is no cache in cache_dir.
+    """
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def build_onet_cache(release_path, cache_root=DEFAULT_CACHE_ROOT, workers=1):
+    """
+    Convert every workbook of an O*NET release into a versioned Parquet cache.
+
+    The cache of release db_29_3 lives in <cache_root>/db_29_3, one file per workbook,
+    with a manifest listing every table's file, rows, columns and source. Workbooks whose
+    source file is unchanged since the last conversion are not converted again.
+
+    Parameters:
+    release_path: release directory (e.g. data/onet/db_29_3_excel) or its .zip
+    workers: number of worker processes converting workbooks in parallel
+
+    Returns:
+    the cache directory of the release
+    """
+    cache_dir = os.path.join(cache_root, release_name(release_path))
+    os.makedirs(cache_dir, exist_ok=True)
+    workbooks = _release_workbooks(release_path)
+    if not workbooks:
+        raise FileNotFoundError(f"No O*NET workbooks found in {release_path}")
+
+    manifest = load_onet_manifest(cache_dir) or {'release': release_name(release_path), 'tables': {}}
+    tables = manifest['tables']
+    tasks = []
+    for table, (path, member) in workbooks.items():
+        entry = tables.get(table)
+        if (entry is None or entry['source'] != _source_entry(path, member)
+                or not os.path.exists(os.path.join(cache_dir, entry['file']))):
+            tasks.append((table, path, member, cache_dir))
+
+    if workers <= 1 or len(tasks) <= 1:
+        results = [_convert_workbook(task) for task in tasks]
+    else:
+        # The largest workbooks are submitted first so they do not end up last on one worker
+        tasks.sort(key=lambda task: -os.path.getsize(task[1]) if task[2] is None else 0)
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=pool_context()) as pool:
+            results = list(pool.map(_convert_workbook, tasks))
+
+    for table, rows, columns in results:
+        path, member = workbooks[table]
+        tables[table] = {'file': table_file(table), 'rows': rows, 'columns': columns,
+                         'source': _source_entry(path, member)}
+    manifest['tables'] = {table: tables[table] for table in sorted(tables) if table in workbooks}
+    with open(os.path.join(cache_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return cache_dir
+
+
+def _version_key(name):
+    return tuple(int(part) for part in re.findall(r'\d+', name))
+
+
+def latest_onet_cache(cache_root=DEFAULT_CACHE_ROOT):
+    """
+    Cache directory of the newest release converted under cache_root, or None.
+    """
+    if not os.path.isdir(cache_root):
+        return None
+    releases = [name for name in os.listdir(cache_root)
+                if os.path.exists(os.path.join(cache_root, name, MANIFEST_FILE))]
+    if not releases:
+        return None
+    return os.path.join(cache_root, max(releases, key=_version_key))
+
+
+def load_onet_table(cache_dir, table, columns=None, filters=None):
+    """
+    Load one O*NET table from a release cache, reading only the columns asked for.
+
+    Parameters:
+    cache_dir: cache directory of a release (see build_onet_cache / latest_onet_cache)
+    table: workbook name ('Task Ratings') or its file stem ('task_ratings')
+    columns: columns to read (default: all)
+    filters: optional pyarrow filters, e.g. [('Scale ID', '==', 'IM')]
+
+    Returns:
+    DataFrame with code columns as categoricals
+    """
+    manifest = load_onet_manifest(cache_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No O*NET cache in {cache_dir}")
+    entries = manifest['tables']
+    entry = entries.get(table) or next((entry for entry in entries.values()
+                                        if entry['file'] == table_file(table)), None)
+    if entry is None:
+        raise KeyError(f"O*NET table '{table}' is not in {cache_dir}")
+    return pq.read_table(os.path.join(cache_dir, entry['file']), columns=columns, filters=filters).to_pandas()
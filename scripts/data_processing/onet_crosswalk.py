@@ -0,0 +1,226 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from onet_cache import load_onet_table
+from soc_taxonomy import broad_group, minor_group, normalize_soc
+
+ONET_CODE_COLUMN = 'O*NET-SOC Code'
+
+
+class OnetCrosswalk:
+    """
+    Sparse weight matrix from O*NET-SOC occupations (e.g. 15-1252.00, 15-1252.01)
+    to BLS SOC occupations (15-1252).
+
+    Row i of `matrix` holds the weights of the O*NET occupations rolled up into
+    soc_codes[i]; every non-empty row sums to 1. Any table at the O*NET-SOC level
+    is rolled up to BLS SOC with one sparse product.
+    """
+
+    def __init__(self, onet_codes, soc_codes, matrix):
+        self.onet_codes = np.asarray(onet_codes, dtype=object)
+        self.soc_codes = np.asarray(soc_codes, dtype=object)
+        self.matrix = sparse.csr_matrix(matrix)
+        self.onet_index = pd.Index(self.onet_codes)
+        self.soc_index = pd.Index(self.soc_codes)
+
+    @classmethod
+    def build(cls, onet_codes, bls_codes=None, employment=None):
+        """
+        Build the crosswalk of a list of O*NET-SOC codes.
+
+        Parameters:
+        onet_codes: O*NET-SOC codes of the release (e.g. the 'Occupation Data' table)
+        bls_codes: SOC codes published by BLS; O*NET occupations whose detailed SOC code
+                   is not among them roll up into their broad or minor group when BLS
+                   publishes that instead, and are left out otherwise (default: keep the
+                   detailed SOC codes)
+        employment: optional Series of employment indexed by O*NET-SOC or SOC code; an
+                    O*NET occupation gets the employment of its own code, or an equal share
+                    of its SOC code's. Occupations without employment get the mean weight
+                    of their BLS occupation, and BLS occupations without any employment
+                    weight their O*NET occupations equally.
+
+        Returns:
+        OnetCrosswalk
+        """
+        onet_codes = pd.unique(normalize_soc(pd.Series(onet_codes).dropna(), style='onet'))
+        onet_codes = np.sort(onet_codes.astype(str)).astype(object)
+        detailed = normalize_soc(onet_codes)
+        target = detailed
+        if bls_codes is not None:
+            published = pd.Index(pd.unique(normalize_soc(pd.Series(bls_codes).dropna())))
+            for fallback in (broad_group(onet_codes), minor_group(onet_codes)):
+                missing = ~pd.Index(target).isin(published)
+                target = np.where(missing & pd.Index(fallback).isin(published), fallback, target)
+            keep = pd.Index(target).isin(published)
+            onet_codes, detailed, target = onet_codes[keep], detailed[keep], target[keep]
+
+        # O*NET occupations sharing a detailed SOC code split its employment equally
+        shares = 1.0 / pd.Series(detailed).map(pd.Series(detailed).value_counts()).to_numpy(dtype=float)
+        weights = pd.Series(np.nan, index=range(len(onet_codes)))
+        if employment is not None:
+            employment = pd.to_numeric(pd.Series(employment), errors='coerce')
+            employment = employment[employment > 0]
+            labels = pd.Series(employment.index.astype(str))
+            is_onet = labels.str.contains('.', regex=False).to_numpy()
+            own = pd.Series(employment.to_numpy()[is_onet], index=normalize_soc(labels[is_onet], style='onet'))
+            by_soc = pd.Series(employment.to_numpy()[~is_onet], index=normalize_soc(labels[~is_onet]))
+            own = own[~own.index.duplicated()]
+            by_soc = by_soc[~by_soc.index.duplicated()]
+            weights = pd.Series(own.reindex(onet_codes).to_numpy(), dtype=float)
+            weights = weights.fillna(pd.Series(by_soc.reindex(detailed).to_numpy() * shares, dtype=float))
+        groups = pd.Series(target)
+        weights = weights.fillna(weights.groupby(groups).transform('mean'))
+        weights = weights.fillna(pd.Series(shares)).to_numpy()
+        weights = weights / pd.Series(weights).groupby(groups).transform('sum').to_numpy()
+
+        soc_positions, soc_codes = pd.factorize(target, sort=True)
+        matrix = sparse.csr_matrix((weights, (soc_positions, np.arange(len(onet_codes)))),
+                                   shape=(len(soc_codes), len(onet_codes)))
+        return cls(onet_codes, np.asarray(soc_codes, dtype=object), matrix)
+
+    def __len__(self):
+        return len(self.soc_codes)
+
+    def soc_of(self, onet_codes):
+        """
+        BLS SOC code each O*NET-SOC code rolls up into (NaN for codes outside the crosswalk).
+        """
+        columns = self.onet_index.get_indexer(normalize_soc(pd.Series(onet_codes), style='onet'))
+        rows = np.full(len(self.onet_codes), -1)
+        rows[self.matrix.tocoo().col] = self.matrix.tocoo().row
+        soc = np.append(self.soc_codes, np.nan).astype(object)
+        return soc[np.where(columns < 0, -1, rows[columns])]
+
+    def primary_onet_codes(self):
+        """
+        O*NET-SOC code with the largest weight in each BLS SOC occupation (the first
+        code, usually XX-XXXX.00, on ties), e.g. to pick one title per SOC code.
+        """
+        return self.onet_codes[np.asarray(self.matrix.argmax(axis=1)).ravel()]
+
+    def aggregate(self, values):
+        """
+        Roll values at the O*NET-SOC level up to BLS SOC.
+
+        Parameters:
+        values: Series or DataFrame indexed by O*NET-SOC code (numeric columns), or an
+                array with one row per code in `onet_codes`; missing values are left out
+                and the weights of the remaining O*NET occupations renormalized
+
+        Returns:
+        weighted averages indexed by `soc_codes` (an array for array input);
+        NaN where no O*NET occupation of a SOC code has a value
+        """
+        if isinstance(values, (pd.Series, pd.DataFrame)):
+            aligned = values.copy()
+            aligned.index = normalize_soc(aligned.index.to_series(), style='onet').to_numpy()
+            aligned = aligned[~aligned.index.duplicated()].reindex(self.onet_codes)
+            result = self.aggregate(aligned.to_numpy(dtype=float))
+            if isinstance(values, pd.Series):
+                return pd.Series(result, index=self.soc_index, name=values.name)
+            return pd.DataFrame(result, index=self.soc_index, columns=values.columns)
+
+        values = np.asarray(values, dtype=float)
+        present = ~np.isnan(values)
+        totals = self.matrix @ np.where(present, values, 0.0)
+        coverage = self.matrix @ present.astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(coverage > 0, totals / coverage, np.nan)
+
+    def roll_up(self, table, value_col='Data Value', key_cols=('Element ID', 'Scale ID'),
+                code_col=ONET_CODE_COLUMN):
+        """
+        Roll a long O*NET table (one row per occupation and key, e.g. Task Ratings or
+        Skills) up to BLS SOC with one sparse product.
+
+        Parameters:
+        table: DataFrame with code_col, key_cols and value_col
+        key_cols: columns identifying the rated item (element, task, scale, ...)
+
+        Returns:
+        DataFrame with soc_code, the key columns and the weighted average value_col,
+        one row per SOC code and key rated for at least one of its O*NET occupations
+        """
+        key_cols = list(key_cols)
+        columns = self.onet_index.get_indexer(normalize_soc(table[code_col], style='onet'))
+        values = pd.to_numeric(table[value_col], errors='coerce').to_numpy(dtype=float)
+        usable = (columns >= 0) & ~np.isnan(values)
+        keys = table.loc[usable, key_cols].reset_index(drop=True)
+        key_positions, key_index = pd.MultiIndex.from_frame(keys).factorize()
+        columns, values = columns[usable], values[usable]
+
+        shape = (len(self.onet_codes), len(key_index))
+        rated = sparse.csr_matrix((values, (columns, key_positions)), shape=shape)
+        present = sparse.csr_matrix((np.ones(len(values)), (columns, key_positions)), shape=shape)
+        # Duplicate (occupation, key) rows are averaged
+        rated.sum_duplicates()
+        present.sum_duplicates()
+        rated.data /= present.data
+        present.data[:] = 1.0
+
+        # Zero ratings drop out of the totals' sparsity pattern, so results follow the coverage's
+        coverage = (self.matrix @ present).tocoo()
+        totals = (self.matrix @ rated).tocsr()
+        total_values = np.asarray(totals[coverage.row, coverage.col]).ravel()
+        result = key_index.set_names(key_cols).to_frame(index=False).take(coverage.col).reset_index(drop=True)
+        result.insert(0, 'soc_code', self.soc_codes[coverage.row])
+        result[value_col] = total_values / coverage.data
+        return result.sort_values(['soc_code'] + key_cols, ignore_index=True)
+
+    def save(self, path):
+        """
+        Save the crosswalk as a compressed .npz file.
+        """
+        matrix = self.matrix
+        np.savez_compressed(path, onet_codes=self.onet_codes.astype(str), soc_codes=self.soc_codes.astype(str),
+                            data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                            shape=np.array(matrix.shape))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a crosswalk saved with save().
+        """
+        with np.load(path) as arrays:
+            matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                       shape=tuple(arrays['shape']))
+            return cls(arrays['onet_codes'].astype(object), arrays['soc_codes'].astype(object), matrix)
+
+
+def _crosswalk_key(bls_codes, employment):
+    digest = hashlib.md5()
+    if bls_codes is not None:
+        digest.update('\n'.join(sorted(normalize_soc(pd.Series(bls_codes).dropna()).astype(str))).encode())
+    digest.update(b'|')
+    if employment is not None:
+        employment = pd.Series(employment).dropna().sort_index()
+        digest.update(pd.util.hash_pandas_object(employment.astype(float)).to_numpy().tobytes())
+        digest.update('\n'.join(employment.index.astype(str)).encode())
+    return digest.hexdigest()
+
+
+def onet_crosswalk(cache_dir, bls_codes=None, employment=None):
+    """
+    Crosswalk of an O*NET release from O*NET-SOC to BLS SOC, built once from the
+    release's 'Occupation Data' table and kept in its cache directory.
+
+    Parameters:
+    cache_dir: cache directory of the release (see onet_cache.build_onet_cache)
+    bls_codes, employment: see OnetCrosswalk.build
+
+    Returns:
+    OnetCrosswalk
+    """
+    path = os.path.join(cache_dir, f"soc_crosswalk_{_crosswalk_key(bls_codes, employment)}.npz")
+    if os.path.exists(path):
+        return OnetCrosswalk.load(path)
+    occupations = load_onet_table(cache_dir, 'Occupation Data', columns=[ONET_CODE_COLUMN])
+    crosswalk = OnetCrosswalk.build(occupations[ONET_CODE_COLUMN].astype(str), bls_codes, employment)
+    crosswalk.save(path)
+    return crosswalk
@@ -3,115 +3,63 @@ import numpy as np
 import os
 import re
 import gc
+import argparse
+
+from oews_series import NATIONAL_AREA_CODE, ALL_INDUSTRIES_CODE, ALL_OCCUPATIONS_CODE, DATATYPE_NAMES, to_soc_codes
+from oews_reader import iter_alldata_batches, load_area_names, ALLDATA_COLUMNS
+from oews_ingest import pivot_area_values, WideTableBuilder
+from oews_rows import CompactRows
+from oews_store import store_is_current, load_store_manifest, read_alldata_store
+
+parser = argparse.ArgumentParser(description="Parse national data from the BLS AllData file")
+parser.add_argument('--input', default='/home/ubuntu/upload/oe.data.1.AllData.txt',
+                    help="Path of the BLS oe.data.1.AllData.txt file (.zip, .gz and .xz are read without extracting)")
+parser.add_argument('--store', default='data/processed/bls_store',
+                    help="Parquet store built by build_oews_store.py, used instead of the raw file when current")
+parser.add_argument('--store-only', action='store_true',
+                    help="Read the store without checking it against --input (which need not exist)")
+parser.add_argument('--areas', default='/home/ubuntu/upload/oe.area',
+                    help="BLS oe.area file with area names (state names are built in when it is missing)")
+args = parser.parse_args()
 
 # Create output directories
 os.makedirs('data/bls', exist_ok=True)
 
 print("Parsing BLS wage data file with improved SOC code extraction...")
 # Load the BLS data file with proper column handling
-bls_data_file = '/home/ubuntu/upload/oe.data.1.AllData.txt'
+bls_data_file = args.input
 
-# First, read the file to get the header line
-with open(bls_data_file, 'r') as f:
-    header_line = f.readline().strip()
+print(f"Column names: {ALLDATA_COLUMNS}")
 
-# Split the header by tabs and clean column names
-column_names = [col.strip() for col in header_line.split('\t')]
-print(f"Original column names: {column_names}")
-
-# Process the file in chunks to avoid memory issues
-chunk_size = 100000  # Adjust based on available memory
-chunks = pd.read_csv(bls_data_file, sep='\t', skiprows=1, names=column_names, chunksize=chunk_size)
+# Stream the file in typed columnar chunks to avoid memory issues
+chunk_bytes = 32 * 1024 * 1024  # Adjust based on available memory
+use_store = store_is_current(args.store, bls_data_file, store_only=args.store_only)
+if use_store:
+    # Only cross-industry rows are read; file-wide counts come from the store manifest
+    print(f"Reading cross-industry data from the store in {args.store}")
+    chunks = [read_alldata_store(args.store, industry_codes=[ALL_INDUSTRIES_CODE])]
+else:
+    chunks = iter_alldata_batches(bls_data_file, block_bytes=chunk_bytes)
 
 # Initialize containers for processed data
 all_national_data = []
+national_pivot = WideTableBuilder()  # SOC code x data type wide table, filled as chunks stream in
+all_area_values = []
 unique_soc_codes = set()
 data_type_counts = {}
 unknown_data_types = set()
 
-# Function to extract SOC code from series_id
-def extract_soc_code(series_id):
-    try:
-        # The occupation code starts at position 10 and is 8 characters long
-        occ_code = series_id[10:18]
-        
-        # Check if this is a valid occupation code
-        if occ_code == '00000000':
-            return 'all'  # This is aggregate data for all occupations
-        
-        # Format as standard SOC code (XX-XXXX)
-        # First two digits are the major group
-        major_group = occ_code[:2]
-        
-        # Next four digits are the detailed occupation
-        detailed = occ_code[2:6]
-        
-        # Format with hyphen
-        if detailed == '0000':
-            # This is a major group
-            return f"{major_group}-0000"
-        else:
-            return f"{major_group}-{detailed}"
-    except:
-        return 'unknown'
-
-# Function to extract data type from series_id
-def extract_data_type(series_id):
-    try:
-        # The data type is the last 6 digits
-        data_type = series_id[-6:]
-        
-        # Map data types to meaningful names based on BLS documentation
-        # Expanded mapping based on observed patterns
-        data_type_map = {
-            # Standard OES data types
-            '000001': 'employment',
-            '000002': 'employment_pct',
-            '000003': 'hourly_mean_wage',
-            '000004': 'annual_mean_wage',
-            '000005': 'wage_pct',
-            '000006': 'hourly_10pct_wage',
-            '000007': 'hourly_25pct_wage',
-            '000008': 'hourly_median_wage',
-            '000009': 'hourly_75pct_wage',
-            '000010': 'hourly_90pct_wage',
-            '000011': 'annual_10pct_wage',
-            '000012': 'annual_25pct_wage',
-            '000013': 'annual_median_wage',
-            '000014': 'annual_75pct_wage',
-            '000015': 'annual_90pct_wage',
-            '000016': 'employment_per_1000',
-            '000017': 'location_quotient',
-        }
-        
-        result = data_type_map.get(data_type, f"unknown_{data_type}")
-        if result.startswith("unknown_"):
-            unknown_data_types.add(data_type)
-        return result
-    except:
-        return 'unknown'
-
-# Function to extract area code from series_id
-def extract_area_code(series_id):
-    try:
-        # The area code is positions 4-9
-        return series_id[4:10]
-    except:
-        return 'unknown'
-
 # Process each chunk
 chunk_count = 0
 for chunk in chunks:
     chunk_count += 1
     print(f"\nProcessing chunk {chunk_count}...")
     
-    # Clean the series_id column to remove trailing whitespace
-    chunk['series_id'] = chunk['series_id'].str.strip()
-    
-    # Extract SOC codes, data types, and area codes
-    chunk['soc_code'] = chunk['series_id'].apply(extract_soc_code)
-    chunk['data_type'] = chunk['series_id'].apply(extract_data_type)
-    chunk['area_code'] = chunk['series_id'].apply(extract_area_code)
+    # SOC codes, data types, and area codes arrive already decoded
+    chunk['soc_code'] = chunk['soc_code'].cat.add_categories(['all']).where(
+        chunk['occupation_code'] != ALL_OCCUPATIONS_CODE, 'all'  # Aggregate data for all occupations
+    )
+    unknown_data_types.update(chunk.loc[chunk['data_type'].str.startswith('unknown_'), 'datatype'].unique())
     
     # Update data type counts
     for data_type, count in chunk['data_type'].value_counts().items():
@@ -126,15 +74,15 @@ for chunk in chunks:
     # Update unique SOC codes
     unique_soc_codes.update(chunk_filtered['soc_code'].unique())
     
-    # Extract national data (area_code = '001018')
-    national_chunk = chunk_filtered[chunk_filtered['area_code'] == '001018'].copy()
+    # Extract national cross-industry data (area_code = '0000000')
+    national_chunk = chunk_filtered[(chunk_filtered['area_code'] == NATIONAL_AREA_CODE) &
+                                    (chunk_filtered['industry_code'] == ALL_INDUSTRIES_CODE)].copy()
     
-    # Clean the value column
-    national_chunk['value'] = national_chunk['value'].astype(str).str.strip()
-    national_chunk['value'] = pd.to_numeric(national_chunk['value'], errors='coerce')
+    # Write the chunk into the wide table
+    national_pivot.add(national_chunk['soc_code'], national_chunk['datatype'], national_chunk['value'])
     
-    # Add area name
-    national_chunk['area_name'] = 'National'
+    # Add area name (one category instead of one string per row)
+    national_chunk['area_name'] = pd.Categorical.from_codes(np.zeros(len(national_chunk), dtype=np.int8), ['National'])
     
     # Keep only necessary columns to save memory
     national_chunk = national_chunk[['soc_code', 'area_code', 'area_name', 'year', 'period', 'data_type', 'value']]
@@ -142,18 +90,28 @@ for chunk in chunks:
     # Append to national data list
     all_national_data.append(national_chunk)
     
+    # Route state and metro cross-industry data to their areas in the same pass
+    area_chunk = chunk_filtered[(chunk_filtered['areatype'] != 'N') &
+                                (chunk_filtered['industry_code'] == ALL_INDUSTRIES_CODE)]
+    all_area_values.append(CompactRows.from_frame(area_chunk))
+    
     # Save a sample of the first chunk for debugging
     if chunk_count == 1:
         chunk.head(1000).to_csv('data/bls/raw_bls_sample.csv', index=False)
         print("Sample of raw BLS data saved to data/bls/raw_bls_sample.csv")
     
     # Free memory
-    del chunk, chunk_filtered, national_chunk
+    del chunk, chunk_filtered, national_chunk, area_chunk
     gc.collect()
-    
-    # For testing, limit to 10 chunks
-    if chunk_count >= 60:
-        break
+
+if use_store:
+    # Counts over the whole file instead of the national rows read above
+    manifest = load_store_manifest(args.store)
+    data_type_counts = {DATATYPE_NAMES.get(code, f"unknown_{code}"): count
+                        for code, count in manifest['datatype_counts'].items()}
+    unknown_data_types = {code for code in manifest['datatype_counts'] if code not in DATATYPE_NAMES}
+    occupation_codes = [code for code in manifest['occupation_codes'] if code != ALL_OCCUPATIONS_CODE]
+    unique_soc_codes = set(to_soc_codes(occupation_codes).tolist()) if occupation_codes else set()
 
 # Print unknown data types for further investigation
 print("\nUnknown data types found:")
@@ -184,39 +142,15 @@ if all_national_data:
     national_data.to_csv('data/bls/national_bls_data_unpivoted.csv', index=False)
     print("Unpivoted national data saved to data/bls/national_bls_data_unpivoted.csv")
     
-    # Create a wide format dataset for each SOC code
+    # The wide format dataset was built while the chunks were read
     print("\nCreating wide format dataset for each SOC code...")
-    
-    # Get unique SOC codes in national data
-    unique_national_socs = national_data['soc_code'].unique()
-    print(f"Number of unique SOC codes in national data: {len(unique_national_socs)}")
-    
-    # Create a list to store processed SOC data
-    processed_socs = []
-    
-    # Process each SOC code separately to avoid memory issues
-    for soc_code in unique_national_socs:
-        soc_data = national_data[national_data['soc_code'] == soc_code]
-        
-        # Create a dictionary for this SOC code
-        soc_dict = {
-            'soc_code': soc_code,
-            'area_name': 'National',
-            'year': 2024,
-            'period': 'A01'
-        }
-        
-        # Add each data type as a column
-        for _, row in soc_data.iterrows():
-            data_type = row['data_type']
-            value = row['value']
-            soc_dict[data_type] = value
-        
-        # Add to processed list
-        processed_socs.append(soc_dict)
+    print(f"Number of unique SOC codes in national data: {len(national_pivot.keys)}")
     
     # Convert to DataFrame
-    wide_data = pd.DataFrame(processed_socs)
+    wide_data = national_pivot.to_frame('soc_code')
+    wide_data.insert(1, 'area_name', 'National')
+    wide_data.insert(2, 'year', 2024)
+    wide_data.insert(3, 'period', 'A01')
     print(f"Wide data shape: {wide_data.shape}")
     print(f"Wide data columns: {wide_data.columns.tolist()}")
     
@@ -230,6 +164,17 @@ if all_national_data:
 else:
     print("No national data found in any chunk!")
 
+# Create wide format datasets for state and metro areas
+print("\nCreating wide format datasets for state and metro areas...")
+area_values = CompactRows.concat(all_area_values)
+area_wide = pivot_area_values(area_values, load_area_names(args.areas))
+for areatype, label in [('S', 'state'), ('M', 'metro')]:
+    area_type_wide = area_wide[area_wide['areatype'] == areatype]
+    area_type_wide.to_csv(f'data/bls/{label}_bls_data_wide.csv', index=False)
+    print(f"Wide format {label} BLS data for {area_type_wide['area_code'].nunique()} areas saved to "
+          f"data/bls/{label}_bls_data_wide.csv")
+del all_area_values, area_values
+
 # Print summary of unique SOC codes
 print(f"\nTotal unique SOC codes found: {len(unique_soc_codes)}")
 print(f"Sample SOC codes: {sorted(list(unique_soc_codes)[:20])}")
@@ -3,8 +3,20 @@ import numpy as np
 import os
 import re
 import json
+import argparse
 from collections import defaultdict
 
+from oews_reader import read_input_bytes
+from oews_excel import load_xlsx_cached, write_xlsx
+from soc_taxonomy import add_taxonomy_columns, normalize_soc
+
+parser = argparse.ArgumentParser(description="Standardize the BLS national and state Excel releases")
+parser.add_argument('--workers', type=int, default=1,
+                    help="Number of worker processes writing the Excel sheets in parallel")
+parser.add_argument('--skip-excel', action='store_true',
+                    help="Do not write bls_labor_market_data.xlsx (e.g. in CI runs)")
+args = parser.parse_args()
+
 # Create output directories
 os.makedirs('/home/ubuntu/research_project/data/processed/national', exist_ok=True)
 os.makedirs('/home/ubuntu/research_project/data/processed/states', exist_ok=True)
@@ -16,73 +28,70 @@ print("Processing BLS Excel data files...")
 national_file = '/home/ubuntu/research_project/data/raw/bls/national/oesm24nat/national_M2024_dl.xlsx'
 state_file = '/home/ubuntu/research_project/data/raw/bls/states/oesm24st/state_M2024_dl.xlsx'
 
-# Function to convert occupation code to SOC format
-def to_soc_format(occ_code):
-    # Check if already in SOC format (XX-XXXX)
-    if isinstance(occ_code, str) and '-' in occ_code:
-        return occ_code
-    
-    # Convert to string if numeric
-    if not isinstance(occ_code, str):
-        occ_code = str(int(occ_code)).zfill(6)
-    
-    # Convert to SOC format (XX-XXXX)
-    if len(occ_code) == 6:
-        return f"{occ_code[:2]}-{occ_code[2:6]}"
-    
-    return occ_code
+# Release archives the Excel files come in; used directly when they have not been extracted
+national_zip = '/home/ubuntu/research_project/data/raw/bls/national/oesm24nat.zip'
+state_zip = '/home/ubuntu/research_project/data/raw/bls/states/oesm24st.zip'
 
-# Define major group names based on SOC classification
-major_group_names = {
-    '11': 'Management',
-    '13': 'Business & Financial Operations',
-    '15': 'Computer & Mathematical',
-    '17': 'Architecture & Engineering',
-    '19': 'Life, Physical, & Social Science',
-    '21': 'Community & Social Service',
-    '23': 'Legal',
-    '25': 'Educational Instruction & Library',
-    '27': 'Arts, Design, Entertainment, Sports, & Media',
-    '29': 'Healthcare Practitioners & Technical',
-    '31': 'Healthcare Support',
-    '33': 'Protective Service',
-    '35': 'Food Preparation & Serving Related',
-    '37': 'Building & Grounds Cleaning & Maintenance',
-    '39': 'Personal Care & Service',
-    '41': 'Sales & Related',
-    '43': 'Office & Administrative Support',
-    '45': 'Farming, Fishing, & Forestry',
-    '47': 'Construction & Extraction',
-    '49': 'Installation, Maintenance, & Repair',
-    '51': 'Production',
-    '53': 'Transportation & Material Moving',
-    '55': 'Military Specific',
-}
+# Converted workbooks and their detected columns, keyed on the workbook content
+excel_cache_dir = '/home/ubuntu/research_project/data/processed/cache/excel'
 
-# Create uber categories (broader groupings)
-uber_categories = {
-    'Management & Business': ['11', '13'],
-    'STEM': ['15', '17', '19'],
-    'Education & Social Services': ['21', '23', '25', '27'],
-    'Healthcare': ['29', '31'],
-    'Service': ['33', '35', '37', '39'],
-    'Sales & Office': ['41', '43'],
-    'Natural Resources & Construction': ['45', '47'],
-    'Production & Transportation': ['49', '51', '53'],
-    'Military': ['55']
-}
+# Function to locate an Excel file, reading it from its release archive if needed
+def excel_source(path, release_zip):
+    if not os.path.exists(path) and os.path.exists(release_zip):
+        print(f"Reading {os.path.basename(path)} from {release_zip}")
+        return read_input_bytes(release_zip, member=os.path.basename(path))
+    return path
 
-# Create reverse mapping from major group to uber category
-major_to_uber = {}
-for uber, majors in uber_categories.items():
-    for major in majors:
-        major_to_uber[major] = uber
+# Function to detect the occupation code, title, employment and wage columns of a BLS table
+def detect_columns(df, find_state=False):
+    columns = {'state': None, 'occupation_code': None, 'title': None, 'employment': None, 'wages': [],
+               'employment_rse': None, 'wage_rse': None}
+    
+    for col in df.columns:
+        col_lower = col.lower()
+        if find_state and 'state' in col_lower:
+            columns['state'] = col
+        if 'occ' in col_lower and 'code' in col_lower and columns['occupation_code'] is None:
+            columns['occupation_code'] = col
+    
+    if not columns['occupation_code']:
+        # Try to identify by looking at values
+        for col in df.columns:
+            if df[col].dtype == object:
+                sample_vals = df[col].dropna().head(10).tolist()
+                if any('-' in str(val) for val in sample_vals):
+                    columns['occupation_code'] = col
+                    print(f"Identified occupation code column: {col}")
+                    break
+    
+    for col in df.columns:
+        col_lower = col.lower()
+        if 'prse' in col_lower:
+            # Relative standard errors of employment and the mean wage (EMP_PRSE, MEAN_PRSE)
+            if 'emp' in col_lower:
+                columns['employment_rse'] = col
+            elif 'mean' in col_lower:
+                columns['wage_rse'] = col
+        elif 'employment' in col_lower or 'emp' in col_lower:
+            columns['employment'] = col
+        if 'wage' in col_lower or 'salary' in col_lower or 'earn' in col_lower:
+            columns['wages'].append(col)
+    
+    for col in df.columns:
+        if 'title' in col.lower() or 'name' in col.lower() or 'occupation' in col.lower():
+            columns['title'] = col
+            break
+    
+    return columns
 
 # Process national data
 print("\nProcessing national BLS data...")
 try:
-    # Read the Excel file
-    national_df = pd.read_excel(national_file)
+    # Read the Excel file (from the cache when the workbook has not changed)
+    national_df, national_columns, from_cache = load_xlsx_cached(
+        excel_source(national_file, national_zip), excel_cache_dir, detect_columns=detect_columns)
+    if from_cache:
+        print("Loaded national data and its column mapping from the cache")
     print(f"National data shape: {national_df.shape}")
     print(f"National data columns: {national_df.columns.tolist()}")
     
@@ -91,21 +100,7 @@ try:
     print(national_df.head())
     
     # Check for occupation code column
-    occ_code_col = None
-    for col in national_df.columns:
-        if 'occ' in col.lower() and 'code' in col.lower():
-            occ_code_col = col
-            break
-    
-    if not occ_code_col:
-        # Try to identify by looking at values
-        for col in national_df.columns:
-            if national_df[col].dtype == object:
-                sample_vals = national_df[col].dropna().head(10).tolist()
-                if any('-' in str(val) for val in sample_vals):
-                    occ_code_col = col
-                    print(f"Identified occupation code column: {occ_code_col}")
-                    break
+    occ_code_col = national_columns['occupation_code']
     
     if occ_code_col:
         print(f"Using occupation code column: {occ_code_col}")
@@ -114,15 +109,8 @@ try:
         occ_code_col = national_df.columns[0]
     
     # Check for employment and wage columns
-    emp_col = None
-    wage_cols = []
-    
-    for col in national_df.columns:
-        col_lower = col.lower()
-        if 'employment' in col_lower or 'emp' in col_lower:
-            emp_col = col
-        if 'wage' in col_lower or 'salary' in col_lower or 'earn' in col_lower:
-            wage_cols.append(col)
+    emp_col = national_columns['employment']
+    wage_cols = national_columns['wages']
     
     print(f"Employment column: {emp_col}")
     print(f"Wage columns: {wage_cols}")
@@ -133,24 +121,25 @@ try:
     # Add occupation code
     if occ_code_col:
         std_national_df['occupation_code'] = national_df[occ_code_col]
-        std_national_df['soc_code'] = std_national_df['occupation_code'].apply(to_soc_format)
+        std_national_df['soc_code'] = normalize_soc(std_national_df['occupation_code'])
     
     # Add occupation title if available
-    title_col = None
-    for col in national_df.columns:
-        if 'title' in col.lower() or 'name' in col.lower() or 'occupation' in col.lower():
-            title_col = col
-            break
+    title_col = national_columns['title']
     
     if title_col:
         std_national_df['occupation_title'] = national_df[title_col]
     else:
-        std_national_df['occupation_title'] = std_national_df['soc_code'].apply(lambda x: f"Occupation {x}")
+        std_national_df['occupation_title'] = "Occupation " + std_national_df['soc_code'].astype(str)
     
     # Add employment data
     if emp_col:
         std_national_df['employment'] = national_df[emp_col]
     
+    # Add the relative standard errors (percent) of employment and the mean wage
+    for field in ('employment_rse', 'wage_rse'):
+        if national_columns.get(field):
+            std_national_df[field] = national_df[national_columns[field]]
+    
     # Add wage data
     for col in wage_cols:
         col_name = col.lower().replace(' ', '_')
@@ -165,15 +154,8 @@ try:
         else:
             std_national_df[col_name] = national_df[col]
     
-    # Add major group information
-    std_national_df['major_group'] = std_national_df['soc_code'].apply(lambda x: x.split('-')[0] if isinstance(x, str) and '-' in x else '')
-    std_national_df['major_group_name'] = std_national_df['major_group'].map(major_group_names)
-    std_national_df['is_major_group'] = std_national_df['soc_code'].apply(lambda x: isinstance(x, str) and x.endswith('-0000'))
-    
-    # Add uber category
-    std_national_df['uber_category'] = std_national_df['major_group'].map(
-        lambda x: major_to_uber.get(x, 'Other') if pd.notna(x) else None
-    )
+    # Add major group information and uber category
+    add_taxonomy_columns(std_national_df)
     
     # Save the standardized national data
     std_national_df.to_csv('/home/ubuntu/research_project/data/processed/national/bls_national_data.csv', index=False)
@@ -193,8 +175,12 @@ except Exception as e:
 # Process state data
 print("\nProcessing state BLS data...")
 try:
-    # Read the Excel file
-    state_df = pd.read_excel(state_file)
+    # Read the Excel file (from the cache when the workbook has not changed)
+    state_df, state_columns, from_cache = load_xlsx_cached(
+        excel_source(state_file, state_zip), excel_cache_dir,
+        detect_columns=lambda df: detect_columns(df, find_state=True))
+    if from_cache:
+        print("Loaded state data and its column mapping from the cache")
     print(f"State data shape: {state_df.shape}")
     print(f"State data columns: {state_df.columns.tolist()}")
     
@@ -203,25 +189,8 @@ try:
     print(state_df.head())
     
     # Check for state, occupation code columns
-    state_col = None
-    occ_code_col = None
-    
-    for col in state_df.columns:
-        col_lower = col.lower()
-        if 'state' in col_lower:
-            state_col = col
-        if 'occ' in col_lower and 'code' in col_lower:
-            occ_code_col = col
-    
-    if not occ_code_col:
-        # Try to identify by looking at values
-        for col in state_df.columns:
-            if state_df[col].dtype == object:
-                sample_vals = state_df[col].dropna().head(10).tolist()
-                if any('-' in str(val) for val in sample_vals):
-                    occ_code_col = col
-                    print(f"Identified occupation code column: {occ_code_col}")
-                    break
+    state_col = state_columns['state']
+    occ_code_col = state_columns['occupation_code']
     
     if occ_code_col:
         print(f"Using occupation code column: {occ_code_col}")
@@ -235,15 +204,8 @@ try:
         print("Could not identify state column.")
     
     # Check for employment and wage columns
-    emp_col = None
-    wage_cols = []
-    
-    for col in state_df.columns:
-        col_lower = col.lower()
-        if 'employment' in col_lower or 'emp' in col_lower:
-            emp_col = col
-        if 'wage' in col_lower or 'salary' in col_lower or 'earn' in col_lower:
-            wage_cols.append(col)
+    emp_col = state_columns['employment']
+    wage_cols = state_columns['wages']
     
     print(f"Employment column: {emp_col}")
     print(f"Wage columns: {wage_cols}")
@@ -258,24 +220,25 @@ try:
     # Add occupation code
     if occ_code_col:
         std_state_df['occupation_code'] = state_df[occ_code_col]
-        std_state_df['soc_code'] = std_state_df['occupation_code'].apply(to_soc_format)
+        std_state_df['soc_code'] = normalize_soc(std_state_df['occupation_code'])
     
     # Add occupation title if available
-    title_col = None
-    for col in state_df.columns:
-        if 'title' in col.lower() or 'name' in col.lower() or 'occupation' in col.lower():
-            title_col = col
-            break
+    title_col = state_columns['title']
     
     if title_col:
         std_state_df['occupation_title'] = state_df[title_col]
     else:
-        std_state_df['occupation_title'] = std_state_df['soc_code'].apply(lambda x: f"Occupation {x}")
+        std_state_df['occupation_title'] = "Occupation " + std_state_df['soc_code'].astype(str)
     
     # Add employment data
     if emp_col:
         std_state_df['employment'] = state_df[emp_col]
     
+    # Add the relative standard errors (percent) of employment and the mean wage
+    for field in ('employment_rse', 'wage_rse'):
+        if state_columns.get(field):
+            std_state_df[field] = state_df[state_columns[field]]
+    
     # Add wage data
     for col in wage_cols:
         col_name = col.lower().replace(' ', '_')
@@ -290,15 +253,8 @@ try:
         else:
             std_state_df[col_name] = state_df[col]
     
-    # Add major group information
-    std_state_df['major_group'] = std_state_df['soc_code'].apply(lambda x: x.split('-')[0] if isinstance(x, str) and '-' in x else '')
-    std_state_df['major_group_name'] = std_state_df['major_group'].map(major_group_names)
-    std_state_df['is_major_group'] = std_state_df['soc_code'].apply(lambda x: isinstance(x, str) and x.endswith('-0000'))
-    
-    # Add uber category
-    std_state_df['uber_category'] = std_state_df['major_group'].map(
-        lambda x: major_to_uber.get(x, 'Other') if pd.notna(x) else None
-    )
+    # Add major group information and uber category
+    add_taxonomy_columns(std_state_df)
     
     # Save the standardized state data
     std_state_df.to_csv('/home/ubuntu/research_project/data/processed/states/bls_state_data.csv', index=False)
@@ -319,17 +275,21 @@ except Exception as e:
     print(traceback.format_exc())
 
 # Create Excel file with multiple sheets
-try:
-    with pd.ExcelWriter('/home/ubuntu/research_project/data/processed/bls_labor_market_data.xlsx') as writer:
+if args.skip_excel:
+    print("\nSkipping the BLS labor market data Excel file (--skip-excel)")
+else:
+    try:
+        sheets = []
         if 'std_national_df' in locals() and not std_national_df.empty:
-            std_national_df.to_excel(writer, sheet_name='National', index=False)
+            sheets.append(('National', std_national_df))
         if 'std_state_df' in locals() and not std_state_df.empty:
-            std_state_df.to_excel(writer, sheet_name='States', index=False)
-    
-    print("\nSaved comprehensive BLS labor market data Excel file")
-except Exception as e:
-    print(f"Error saving Excel file: {str(e)}")
-    import traceback
-    print(traceback.format_exc())
+            sheets.append(('States', std_state_df))
+        write_xlsx('/home/ubuntu/research_project/data/processed/bls_labor_market_data.xlsx', sheets, workers=args.workers)
+        
+        print("\nSaved comprehensive BLS labor market data Excel file")
+    except Exception as e:
+        print(f"Error saving Excel file: {str(e)}")
+        import traceback
+        print(traceback.format_exc())
 
 print("\nBLS data processing complete!")
@@ -1,9 +1,40 @@
 import pandas as pd
 import numpy as np
 import os
-import re
+import io
 import json
-from collections import defaultdict
+import argparse
+from itertools import chain, islice
+
+from oews_series import DATATYPE_NAMES, NATIONAL_AREA_CODE
+from oews_reader import DEFAULT_BLOCK_BYTES, load_area_names, open_input
+from oews_ingest import iter_alldata_summaries, pivot_area_values, WideTableBuilder
+from oews_rows import CompactRows
+from oews_store import store_is_current, store_summary
+from oews_checkpoint import open_checkpoint_log, append_checkpoint, checkpoint_matches, checkpoint_source
+from oews_excel import write_xlsx
+from onet_cache import DEFAULT_CACHE_ROOT, build_onet_cache, load_onet_table
+from onet_crosswalk import ONET_CODE_COLUMN, OnetCrosswalk, onet_crosswalk
+from soc_taxonomy import MAJOR_GROUP_NAMES, UBER_CATEGORIES, add_taxonomy_columns, normalize_soc
+
+parser = argparse.ArgumentParser(description="Process the BLS AllData file and O*NET data")
+parser.add_argument('--input', default='/home/ubuntu/upload/oe.data.1.AllData.txt',
+                    help="Path of the BLS oe.data.1.AllData.txt file (.zip, .gz and .xz are read without extracting)")
+parser.add_argument('--workers', type=int, default=1,
+                    help="Number of worker processes parsing byte ranges of the input in parallel")
+parser.add_argument('--store', default='data/processed/bls_store',
+                    help="Parquet store built by build_oews_store.py, used instead of the raw file when current")
+parser.add_argument('--store-only', action='store_true',
+                    help="Read the store without checking it against --input (which need not exist)")
+parser.add_argument('--areas', default='/home/ubuntu/upload/oe.area',
+                    help="BLS oe.area file with area names (state names are built in when it is missing)")
+parser.add_argument('--onet-cache', default=DEFAULT_CACHE_ROOT,
+                    help="Parquet cache of the O*NET release (see build_onet_cache.py); filled on first use")
+parser.add_argument('--skip-excel', action='store_true',
+                    help="Do not write job_task_complexity_data.xlsx (e.g. in CI runs)")
+parser.add_argument('--resume', action='store_true',
+                    help="Continue an interrupted ingest from the last chunk committed to the checkpoint log")
+args = parser.parse_args()
 
 # Create output directories
 os.makedirs('data/processed', exist_ok=True)
@@ -14,164 +45,114 @@ os.makedirs('data/processed/complexity', exist_ok=True)
 
 print("Processing BLS data file in chunks with improved error handling...")
 
-# Define chunk size for processing
-CHUNK_SIZE = 50000  # Reduced chunk size for better stability
-
-# Define data type codes based on BLS documentation
-data_type_codes = {
-    '01': 'employment',
-    '02': 'employment_rse',
-    '03': 'hourly_mean_wage',
-    '04': 'annual_mean_wage',
-    '05': 'wage_rse',
-    '06': 'hourly_10pct_wage',
-    '07': 'hourly_25pct_wage',
-    '08': 'hourly_median_wage',
-    '09': 'hourly_75pct_wage',
-    '10': 'hourly_90pct_wage',
-    '11': 'annual_10pct_wage',
-    '12': 'annual_25pct_wage',
-    '13': 'annual_median_wage',
-    '14': 'annual_75pct_wage',
-    '15': 'annual_90pct_wage',
-    '16': 'annual_mean_wage_rse',
-    '17': 'hourly_mean_wage_rse'
-}
+# Raw BLS AllData file
+BLS_DATA_FILE = args.input
 
-# Function to extract area code, occupation code, and data type from series_id
-def parse_series_id(series_id):
-    # Format: OEUMareacodeindustryoccupationdatatype
-    # Example: OEUM001018000000000000001
-    if len(series_id) < 24:
-        return None, None, None
-    
-    survey_abbr = series_id[3:4]
-    area_code = series_id[4:10]
-    industry_code = series_id[10:16]
-    occupation_code = series_id[16:22]
-    data_type = series_id[22:24]
-    
-    return area_code, occupation_code, data_type
+# Read the store instead of the raw file when it was built from the same file
+USE_STORE = store_is_current(args.store, BLS_DATA_FILE, store_only=args.store_only)
 
-# Function to convert occupation code to SOC format
-def to_soc_format(occ_code):
-    # Convert to SOC format (XX-XXXX)
-    if len(occ_code) == 6 and occ_code.isdigit():
-        return f"{occ_code[:2]}-{occ_code[2:6]}"
-    return occ_code
+# Define chunk size for processing (bytes of the raw file parsed per chunk)
+CHUNK_BYTES = DEFAULT_BLOCK_BYTES
+
+# Data type codes based on BLS documentation
+data_type_codes = DATATYPE_NAMES
 
 # First, let's examine the raw BLS data file to understand its structure
-print("\nExamining raw BLS data file...")
-with open('/home/ubuntu/upload/oe.data.1.AllData.txt', 'r') as f:
-    raw_lines = f.readlines()[:20]  # Read first 20 lines for inspection
-    
-print(f"Raw BLS data file has {len(raw_lines)} lines (showing first 20):")
-for i, line in enumerate(raw_lines):
-    print(f"Line {i+1}: {line.strip()}")
+if os.path.exists(BLS_DATA_FILE):
+    print("\nExamining raw BLS data file...")
+    with io.TextIOWrapper(open_input(BLS_DATA_FILE)) as f:
+        raw_lines = list(islice(f, 20))  # Read first 20 lines for inspection
+        
+    print(f"Raw BLS data file has {len(raw_lines)} lines (showing first 20):")
+    for i, line in enumerate(raw_lines):
+        print(f"Line {i+1}: {line.strip()}")
 
 # Process the file in chunks
 print("\nProcessing BLS data in chunks...")
 
 # Initialize dictionaries to store data
-national_data = {}  # For national data (area_code '000000')
+national_data = WideTableBuilder()  # Occupation x data type table of national data (area_code '0000000')
+area_values = []  # Compact cross-industry rows of every area, routed to state and metro tables after the scan
 occupation_codes = set()  # To track unique occupation codes
 data_types = set()  # To track unique data type codes
 area_codes = set()  # To track unique area codes
 
+# Append-only log of the chunks processed so far (each record holds the chunk's new
+# codes and values plus the byte offset reached), so an interrupted ingest can resume
+CHECKPOINT_LOG = 'data/processed/national/ingest_checkpoint.log'
+
 # Process the file in chunks
 chunk_count = 0
 total_rows = 0
+checkpoint_log = None
+committed_offset = 0
 
 try:
-    # Open the file and read the header
-    with open('/home/ubuntu/upload/oe.data.1.AllData.txt', 'r') as f:
-        header = f.readline().strip().split('\t')
-        header = [col.strip() for col in header]  # Clean header
+    # Stream the file as typed columnar chunks (byte ranges parsed in parallel with --workers)
+    if USE_STORE:
+        # The whole file as one chunk: codes from the store manifest, values from the partitions
+        print(f"Reading data from the store in {args.store}")
+        chunks = [(None, None, store_summary(args.store), False)]
+    else:
+        if args.resume and not checkpoint_matches(CHECKPOINT_LOG, BLS_DATA_FILE):
+            # Byte offsets of another file (or of an older version of this one) mean nothing here
+            previous_source = checkpoint_source(CHECKPOINT_LOG)
+            print(f"{CHECKPOINT_LOG} was not written for the current {BLS_DATA_FILE}"
+                  f"{' (it belongs to ' + previous_source['path'] + ')' if previous_source else ''}; starting over")
+        checkpoint_log, committed = open_checkpoint_log(CHECKPOINT_LOG, BLS_DATA_FILE, resume=args.resume)
+        if committed:
+            committed_offset = committed[-1][1]
+            print(f"Resuming after {len(committed)} committed chunks at byte offset {committed_offset}")
+        print(f"Using {args.workers} worker process(es)")
+        # Committed chunks are replayed from the log, the rest of the file is parsed
+        chunks = chain(
+            ((start, stop, chunk, False) for start, stop, chunk in committed),
+            ((start, stop, chunk, True) for start, stop, chunk in iter_alldata_summaries(
+                BLS_DATA_FILE, workers=args.workers, block_bytes=CHUNK_BYTES, start=committed_offset)),
+        )
+        recorded_codes = {'area_codes': set(), 'occupation_codes': set(), 'datatypes': set()}
+    for start, stop, chunk, is_new in chunks:
+        chunk_count += 1
+        print(f"\nProcessing chunk {chunk_count}...")
+        total_rows += chunk['rows']
         
-        # Process the file in chunks
-        while True:
-            chunk_count += 1
-            print(f"\nProcessing chunk {chunk_count}...")
-            
-            # Read a chunk of lines
-            lines = []
-            for _ in range(CHUNK_SIZE):
-                line = f.readline()
-                if not line:
-                    break
-                lines.append(line.strip().split('\t'))
-            
-            if not lines:
-                break  # End of file
-            
-            # Create DataFrame from chunk
-            chunk_df = pd.DataFrame(lines, columns=header)
-            total_rows += len(chunk_df)
-            
-            # Clean column names and values
-            chunk_df.columns = chunk_df.columns.str.strip()
-            if 'series_id' in chunk_df.columns:
-                chunk_df['series_id'] = chunk_df['series_id'].str.strip()
-            
-            # Process each row in the chunk
-            for _, row in chunk_df.iterrows():
-                series_id = row['series_id']
-                value = row['value']
-                
-                # Parse the series_id
-                area_code, occupation_code, data_type = parse_series_id(series_id)
-                
-                if area_code and occupation_code and data_type:
-                    # Track unique codes
-                    occupation_codes.add(occupation_code)
-                    data_types.add(data_type)
-                    area_codes.add(area_code)
-                    
-                    # Only process national data (area_code '000000')
-                    if area_code == '000000':
-                        # Initialize dictionary for this occupation if needed
-                        if occupation_code not in national_data:
-                            national_data[occupation_code] = {}
-                        
-                        # Add the data point
-                        national_data[occupation_code][data_type] = value
-            
-            print(f"Processed {len(chunk_df)} rows in chunk {chunk_count}")
-            print(f"Total rows processed: {total_rows}")
-            print(f"Unique occupation codes: {len(occupation_codes)}")
-            print(f"Unique data types: {len(data_types)}")
-            print(f"Unique area codes: {len(area_codes)}")
-            
-            # Save intermediate results periodically
-            if chunk_count % 5 == 0:
-                print("Saving intermediate results...")
-                with open(f'data/processed/national/national_data_chunk_{chunk_count}.json', 'w') as f:
-                    json.dump(national_data, f)
-                
-                # Also save the sets as lists
-                with open(f'data/processed/national/occupation_codes_chunk_{chunk_count}.json', 'w') as f:
-                    json.dump(list(occupation_codes), f)
-                
-                with open(f'data/processed/national/data_types_chunk_{chunk_count}.json', 'w') as f:
-                    json.dump(list(data_types), f)
-                
-                with open(f'data/processed/national/area_codes_chunk_{chunk_count}.json', 'w') as f:
-                    json.dump(list(area_codes), f)
+        # Track unique codes
+        occupation_codes.update(chunk['occupation_codes'])
+        data_types.update(chunk['datatypes'])
+        area_codes.update(chunk['area_codes'])
+        
+        # The chunk values hold cross-industry data for every area; national rows (area_code '0000000')
+        # fill the national table, all rows are kept for the state and metro tables
+        values = chunk['values']
+        area_values.append(values)
+        national_chunk = values.take(values.codes('area_code') == values.code_of('area_code', NATIONAL_AREA_CODE))
+        national_data.add(national_chunk.column('occupation_code'), national_chunk.column('datatype'),
+                          national_chunk.values)
+        
+        print(f"Processed {chunk['rows']} rows in chunk {chunk_count}")
+        print(f"Total rows processed: {total_rows}")
+        print(f"Unique occupation codes: {len(occupation_codes)}")
+        print(f"Unique data types: {len(data_types)}")
+        print(f"Unique area codes: {len(area_codes)}")
+        
+        # Commit the chunk to the checkpoint log (only its delta is written)
+        if checkpoint_log is not None:
+            if is_new:
+                append_checkpoint(checkpoint_log, start, stop, chunk, recorded_codes)
+            else:
+                for name in recorded_codes:
+                    recorded_codes[name].update(chunk[name])
+            committed_offset = stop
 
 except Exception as e:
     print(f"Error during processing: {str(e)}")
-    print("Saving current progress...")
-    with open('data/processed/national/national_data_error.json', 'w') as f:
-        json.dump(national_data, f)
-    
-    with open('data/processed/national/occupation_codes_error.json', 'w') as f:
-        json.dump(list(occupation_codes), f)
-    
-    with open('data/processed/national/data_types_error.json', 'w') as f:
-        json.dump(list(data_types), f)
-    
-    with open('data/processed/national/area_codes_error.json', 'w') as f:
-        json.dump(list(area_codes), f)
+    if checkpoint_log is not None:
+        print(f"Progress up to byte offset {committed_offset} is saved in {CHECKPOINT_LOG}; "
+              f"rerun with --resume to continue from there")
+
+finally:
+    if checkpoint_log is not None:
+        checkpoint_log.close()
 
 print("\nFinished processing BLS data")
 print(f"Total rows processed: {total_rows}")
@@ -185,19 +166,14 @@ print(f"Sample data types: {list(data_types)}")
 
 # Convert occupation codes to SOC format
 print("\nConverting occupation codes to SOC format...")
-soc_mapping = {}
-for occ_code in occupation_codes:
-    soc_mapping[occ_code] = to_soc_format(occ_code)
+soc_mapping = dict(zip(occupation_codes, normalize_soc(list(occupation_codes))))
 
 print(f"Created SOC mapping for {len(soc_mapping)} occupation codes")
 print(f"Sample SOC mappings: {list(soc_mapping.items())[:10]}")
 
 # Check if we have data for each data type
 print("\nChecking data availability for each data type...")
-data_type_counts = defaultdict(int)
-for occ_data in national_data.values():
-    for data_type in occ_data:
-        data_type_counts[data_type] += 1
+data_type_counts = national_data.value_counts()
 
 for data_type, count in data_type_counts.items():
     data_name = data_type_codes.get(data_type, f"unknown_{data_type}")
@@ -205,29 +181,10 @@ for data_type, count in data_type_counts.items():
 
 # Convert to DataFrame
 print("\nConverting national data to DataFrame...")
-national_rows = []
+national_df = national_data.to_frame('occupation_code')
 
-for occ_code, data in national_data.items():
-    # Convert occupation code to SOC format
-    soc_code = soc_mapping.get(occ_code, occ_code)
-    
-    # Create record
-    record = {
-        'occupation_code': occ_code,
-        'soc_code': soc_code
-    }
-    
-    # Add data fields
-    for data_type, value in data.items():
-        data_name = data_type_codes.get(data_type, f"unknown_{data_type}")
-        try:
-            record[data_name] = float(value)
-        except:
-            record[data_name] = value
-    
-    national_rows.append(record)
-
-national_df = pd.DataFrame(national_rows)
+# Convert occupation codes to SOC format
+national_df.insert(1, 'soc_code', normalize_soc(national_df['occupation_code']))
 print(f"National data shape: {national_df.shape}")
 print(f"National data columns: {national_df.columns.tolist()}")
 
@@ -249,32 +206,20 @@ if missing_fields:
 national_df.to_csv('data/processed/national/bls_national_data.csv', index=False)
 print("Saved national BLS data")
 
-# Define major group names based on SOC classification
-major_group_names = {
-    '11': 'Management',
-    '13': 'Business & Financial Operations',
-    '15': 'Computer & Mathematical',
-    '17': 'Architecture & Engineering',
-    '19': 'Life, Physical, & Social Science',
-    '21': 'Community & Social Service',
-    '23': 'Legal',
-    '25': 'Educational Instruction & Library',
-    '27': 'Arts, Design, Entertainment, Sports, & Media',
-    '29': 'Healthcare Practitioners & Technical',
-    '31': 'Healthcare Support',
-    '33': 'Protective Service',
-    '35': 'Food Preparation & Serving Related',
-    '37': 'Building & Grounds Cleaning & Maintenance',
-    '39': 'Personal Care & Service',
-    '41': 'Sales & Related',
-    '43': 'Office & Administrative Support',
-    '45': 'Farming, Fishing, & Forestry',
-    '47': 'Construction & Extraction',
-    '49': 'Installation, Maintenance, & Repair',
-    '51': 'Production',
-    '53': 'Transportation & Material Moving',
-    '55': 'Military Specific',
-}
+# Route the values of every area into wide tables (one row per area and occupation)
+print("\nCreating wide tables for every area...")
+area_names = load_area_names(args.areas)
+all_area_values = CompactRows.concat(area_values)
+print(f"Area values: {len(all_area_values)} rows in {all_area_values.nbytes / 1e6:.1f} MB")
+area_df = pivot_area_values(all_area_values, area_names)
+del area_values, all_area_values
+
+state_df = area_df[area_df['areatype'] == 'S'].reset_index(drop=True)
+metro_df = area_df[area_df['areatype'] == 'M'].reset_index(drop=True)
+state_df.to_csv('data/processed/states/bls_state_data.csv', index=False)
+metro_df.to_csv('data/processed/metro/bls_metro_data.csv', index=False)
+print(f"Saved state data for {state_df['area_code'].nunique()} states and metro data for "
+      f"{metro_df['area_code'].nunique()} metropolitan areas")
 
 # Load O*NET data
 print("\nLoading O*NET data...")
@@ -290,9 +235,11 @@ if not os.path.exists(onet_path):
             print(f"Found O*NET data at: {onet_path}")
             break
 
-# Load occupation data
+# Load occupation data (converted into the O*NET cache on first use)
+onet_cache = None
 try:
-    occupation_data = pd.read_excel(f'{onet_path}/Occupation Data.xlsx')
+    onet_cache = build_onet_cache(onet_path, args.onet_cache)
+    occupation_data = load_onet_table(onet_cache, 'Occupation Data', columns=['O*NET-SOC Code', 'Title'])
     print(f"Occupation data shape: {occupation_data.shape}")
     print(f"Occupation data columns: {occupation_data.columns.tolist()}")
 except Exception as e:
@@ -300,82 +247,51 @@ except Exception as e:
     # Create a synthetic occupation data
     print("Creating synthetic O*NET occupation data")
     occupation_data = pd.DataFrame({
-        'O*NET-SOC Code': [f"{code[:2]}-{code[2:6]}.00" for code in list(soc_mapping.values())[:100]],
+        'O*NET-SOC Code': list(normalize_soc(list(soc_mapping)[:100], style='onet')),
         'Title': [f"Occupation {i+1}" for i in range(100)]
     })
 
 # Extract O*NET SOC codes and titles
 print("\nExtracting O*NET SOC codes and titles...")
-onet_soc_titles = occupation_data[['O*NET-SOC Code', 'Title']].copy()
-onet_soc_titles.rename(columns={'O*NET-SOC Code': 'onet_soc_code', 'Title': 'occupation_title'}, inplace=True)
+onet_soc_titles = occupation_data[[ONET_CODE_COLUMN, 'Title']].copy()
+onet_soc_titles.rename(columns={ONET_CODE_COLUMN: 'onet_soc_code', 'Title': 'occupation_title'}, inplace=True)
 print(f"O*NET SOC titles shape: {onet_soc_titles.shape}")
 print(f"O*NET SOC codes sample: {onet_soc_titles['onet_soc_code'].head(10).tolist()}")
 
-# Convert O*NET SOC codes to BLS SOC format (XX-XXXX)
-print("\nConverting O*NET SOC codes to BLS SOC format...")
-def onet_to_bls_soc(onet_soc):
-    # O*NET SOC format: XX-XXXX.XX
-    # BLS SOC format: XX-XXXX
-    match = re.match(r'(\d{2})-(\d{4})\.(\d{2})', onet_soc)
-    if match:
-        return f"{match.group(1)}-{match.group(2)}"
-    else:
-        return onet_soc
-
-onet_soc_titles['soc_code'] = onet_soc_titles['onet_soc_code'].apply(onet_to_bls_soc)
-print(f"Converted SOC codes sample: {onet_soc_titles['soc_code'].head(10).tolist()}")
-
-# Create a mapping of SOC codes to occupation titles
-soc_to_title = {}
-for _, row in onet_soc_titles.iterrows():
-    soc_to_title[row['soc_code']] = row['occupation_title']
+# Crosswalk from O*NET-SOC codes (XX-XXXX.XX) to BLS SOC codes (XX-XXXX), built once per release
+print("\nBuilding the O*NET-SOC to BLS SOC crosswalk...")
+if onet_cache is not None:
+    crosswalk = onet_crosswalk(onet_cache)
+else:
+    crosswalk = OnetCrosswalk.build(onet_soc_titles['onet_soc_code'].astype(str))
+print(f"Crosswalk: {len(crosswalk.onet_codes)} O*NET occupations into {len(crosswalk)} SOC occupations")
+
+# Create a mapping of SOC codes to occupation titles (the title of the main O*NET
+# occupation, XX-XXXX.00, of each SOC code)
+onet_titles = pd.Series(onet_soc_titles['occupation_title'].to_numpy(),
+                        index=normalize_soc(onet_soc_titles['onet_soc_code'], style='onet').to_numpy())
+onet_titles = onet_titles[~onet_titles.index.duplicated()]
+soc_to_title = dict(zip(crosswalk.soc_codes, onet_titles.reindex(crosswalk.primary_onet_codes())))
 
 # Add major group titles
-for major_group, title in major_group_names.items():
-    soc_code = f"{major_group}-0000"
-    soc_to_title[soc_code] = title
+soc_to_title.update({f"{major_group}-0000": title for major_group, title in MAJOR_GROUP_NAMES.items()})
+
+# Function to add titles, major groups and uber categories to occupation data
+def add_occupation_labels(df):
+    # Add occupation titles
+    df['occupation_title'] = df['soc_code'].map(soc_to_title)
+    
+    # Fill missing titles with a placeholder
+    df['occupation_title'] = df['occupation_title'].fillna("Occupation " + df['soc_code'].astype(str))
+    
+    # Add major group, major group name and uber category information
+    return add_taxonomy_columns(df)
 
 # Merge BLS and O*NET data
 print("\nMerging BLS and O*NET data...")
-# Add occupation titles to national data
-national_df['occupation_title'] = national_df['soc_code'].map(soc_to_title)
-
-# Fill missing titles with a placeholder
-national_df['occupation_title'] = national_df['occupation_title'].fillna(
-    national_df['soc_code'].apply(lambda x: f"Occupation {x}")
-)
-
-# Add major group information
-national_df['major_group'] = national_df['soc_code'].apply(lambda x: x.split('-')[0] if '-' in x else '')
-national_df['major_group_name'] = national_df['major_group'].map(major_group_names)
-national_df['is_major_group'] = national_df['soc_code'].apply(lambda x: x.endswith('-0000'))
-
+national_df = add_occupation_labels(national_df)
 print(f"Merged data shape: {national_df.shape}")
 
-# Create uber categories (broader groupings)
-uber_categories = {
-    'Management & Business': ['11', '13'],
-    'STEM': ['15', '17', '19'],
-    'Education & Social Services': ['21', '23', '25', '27'],
-    'Healthcare': ['29', '31'],
-    'Service': ['33', '35', '37', '39'],
-    'Sales & Office': ['41', '43'],
-    'Natural Resources & Construction': ['45', '47'],
-    'Production & Transportation': ['49', '51', '53'],
-    'Military': ['55']
-}
-
-# Create reverse mapping from major group to uber category
-major_to_uber = {}
-for uber, majors in uber_categories.items():
-    for major in majors:
-        major_to_uber[major] = uber
-
-# Add uber category to data
-national_df['uber_category'] = national_df['major_group'].map(
-    lambda x: major_to_uber.get(x, 'Other') if pd.notna(x) else None
-)
-
 # Save the comprehensive labor market data
 national_df.to_csv('data/processed/national/labor_market_data.csv', index=False)
 print("Saved comprehensive labor market data")
@@ -398,181 +314,129 @@ if missing_columns:
         elif col == 'annual_90pct_wage':
             national_df[col] = national_df['annual_mean_wage'] * np.random.uniform(1.3, 1.8, size=len(national_df))
 
-# Create hierarchical structure for treemap
-print("\nCreating hierarchical structure for treemap...")
-treemap_data = []
-
-# First level: Uber categories
-for uber, majors in uber_categories.items():
-    uber_employment = national_df[national_df['uber_category'] == uber]['employment'].sum()
-    uber_mean_wage = national_df[national_df['uber_category'] == uber]['annual_mean_wage'].mean()
-    
-    uber_item = {
-        'id': f"uber_{uber.replace(' & ', '_').replace(' ', '_')}",
-        'name': uber,
-        'value': float(uber_employment) if not np.isnan(uber_employment) else 0,
-        'mean_wage': float(uber_mean_wage) if not np.isnan(uber_mean_wage) else 0,
-        'level': 'uber',
-        'parent': None
-    }
-    treemap_data.append(uber_item)
+# Function to create the hierarchical structure for a treemap
+def build_treemap_data(df):
+    treemap_data = []
     
-    # Second level: Major groups within uber category
-    for major in majors:
-        major_soc = f"{major}-0000"
-        major_data = national_df[national_df['soc_code'] == major_soc]
+    # First level: Uber categories
+    for uber, majors in UBER_CATEGORIES.items():
+        uber_employment = df[df['uber_category'] == uber]['employment'].sum()
+        uber_mean_wage = df[df['uber_category'] == uber]['annual_mean_wage'].mean()
         
-        if not major_data.empty:
-            major_employment = major_data['employment'].values[0]
-            major_mean_wage = major_data['annual_mean_wage'].values[0]
-            major_name = major_data['occupation_title'].values[0]
-            
-            major_item = {
-                'id': f"major_{major}",
-                'name': major_name,
-                'value': float(major_employment) if not np.isnan(major_employment) else 0,
-                'mean_wage': float(major_mean_wage) if not np.isnan(major_mean_wage) else 0,
-                'level': 'major',
-                'parent': uber_item['id']
-            }
-            treemap_data.append(major_item)
-            
-            # Third level: Detailed occupations within major group
-            detailed_occs = national_df[(national_df['major_group'] == major) & (~national_df['is_major_group'])]
+        uber_item = {
+            'id': f"uber_{uber.replace(' & ', '_').replace(' ', '_')}",
+            'name': uber,
+            'value': float(uber_employment) if not np.isnan(uber_employment) else 0,
+            'mean_wage': float(uber_mean_wage) if not np.isnan(uber_mean_wage) else 0,
+            'level': 'uber',
+            'parent': None
+        }
+        treemap_data.append(uber_item)
+        
+        # Second level: Major groups within uber category
+        for major in majors:
+            major_soc = f"{major}-0000"
+            major_data = df[df['soc_code'] == major_soc]
             
-            for _, occ in detailed_occs.iterrows():
-                occ_item = {
-                    'id': f"occ_{occ['soc_code']}",
-                    'name': occ['occupation_title'],
-                    'value': float(occ['employment']) if 'employment' in occ and not np.isnan(occ['employment']) else 0,
-                    'mean_wage': float(occ['annual_mean_wage']) if 'annual_mean_wage' in occ and not np.isnan(occ['annual_mean_wage']) else 0,
-                    'level': 'detailed',
-                    'parent': major_item['id'],
-                    'soc_code': occ['soc_code']
+            if not major_data.empty:
+                major_employment = major_data['employment'].values[0]
+                major_mean_wage = major_data['annual_mean_wage'].values[0]
+                major_name = major_data['occupation_title'].values[0]
+                
+                major_item = {
+                    'id': f"major_{major}",
+                    'name': major_name,
+                    'value': float(major_employment) if not np.isnan(major_employment) else 0,
+                    'mean_wage': float(major_mean_wage) if not np.isnan(major_mean_wage) else 0,
+                    'level': 'major',
+                    'parent': uber_item['id']
                 }
-                treemap_data.append(occ_item)
+                treemap_data.append(major_item)
+                
+                # Third level: Detailed occupations within major group
+                detailed_occs = df[(df['major_group'] == major) & (~df['is_major_group'])]
+                
+                for _, occ in detailed_occs.iterrows():
+                    occ_item = {
+                        'id': f"occ_{occ['soc_code']}",
+                        'name': occ['occupation_title'],
+                        'value': float(occ['employment']) if 'employment' in occ and not np.isnan(occ['employment']) else 0,
+                        'mean_wage': float(occ['annual_mean_wage']) if 'annual_mean_wage' in occ and not np.isnan(occ['annual_mean_wage']) else 0,
+                        'level': 'detailed',
+                        'parent': major_item['id'],
+                        'soc_code': occ['soc_code']
+                    }
+                    treemap_data.append(occ_item)
+    
+    return treemap_data
+
+# Create hierarchical structure for treemap
+print("\nCreating hierarchical structure for treemap...")
+treemap_data = build_treemap_data(national_df)
 
 # Save treemap data
 with open('data/processed/national/treemap_data.json', 'w') as f:
     json.dump(treemap_data, f)
 print(f"Saved treemap data with {len(treemap_data)} nodes")
 
-# Create state-level data
+# Function to create the treemap and summary of one area from its rows in the area tables
+def build_area_treemap(area_rows, **identifiers):
+    area_rows = add_occupation_labels(area_rows.reset_index(drop=True))
+    for col in ['employment', 'annual_mean_wage']:
+        if col not in area_rows.columns:
+            area_rows[col] = np.nan
+    
+    area_treemap = []
+    for item in build_treemap_data(area_rows):
+        # Add area identifiers
+        item.update(identifiers)
+        area_treemap.append(item)
+    
+    summary = dict(identifiers)
+    summary['area_code'] = area_rows['area_code'].iloc[0]
+    summary['total_employment'] = sum(item['value'] for item in area_treemap if 'value' in item and item['level'] == 'detailed')
+    summary['avg_wage'] = np.mean([item['mean_wage'] for item in area_treemap if 'mean_wage' in item and item['level'] == 'detailed'])
+    return area_treemap, summary
+
+# Create state-level data from the state rows of the BLS file
 print("\nCreating state-level data...")
-states = [
-    'Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado', 'Connecticut', 
-    'Delaware', 'Florida', 'Georgia', 'Hawaii', 'Idaho', 'Illinois', 'Indiana', 'Iowa', 
-    'Kansas', 'Kentucky', 'Louisiana', 'Maine', 'Maryland', 'Massachusetts', 'Michigan', 
-    'Minnesota', 'Mississippi', 'Missouri', 'Montana', 'Nebraska', 'Nevada', 'New Hampshire', 
-    'New Jersey', 'New Mexico', 'New York', 'North Carolina', 'North Dakota', 'Ohio', 
-    'Oklahoma', 'Oregon', 'Pennsylvania', 'Rhode Island', 'South Carolina', 'South Dakota', 
-    'Tennessee', 'Texas', 'Utah', 'Vermont', 'Virginia', 'Washington', 'West Virginia', 
-    'Wisconsin', 'Wyoming'
-]
-
-# Create state-level data with variations from national data
 state_data = []
-for state in states:
-    state_factor = np.random.uniform(0.7, 1.3)  # Random factor to vary employment by state
-    wage_factor = np.random.uniform(0.8, 1.2)   # Random factor to vary wages by state
-    
-    state_treemap = []
-    for item in treemap_data:
-        state_item = item.copy()
-        
-        # Adjust employment and wages by state factors
-        if 'value' in state_item:
-            state_item['value'] = state_item['value'] * state_factor
-        if 'mean_wage' in state_item:
-            state_item['mean_wage'] = state_item['mean_wage'] * wage_factor
-        
-        # Add state identifier
-        state_item['state'] = state
-        state_treemap.append(state_item)
+for area_code, state_rows in state_df.groupby('area_code', sort=True):
+    state = state_rows['area_name'].iloc[0]
+    state_treemap, summary = build_area_treemap(state_rows, state=state)
     
     # Save state-level treemap data
     with open(f'data/processed/states/treemap_data_{state.lower().replace(" ", "_")}.json', 'w') as f:
         json.dump(state_treemap, f)
     
-    state_data.append({
-        'state': state,
-        'employment_factor': state_factor,
-        'wage_factor': wage_factor,
-        'total_employment': sum(item['value'] for item in state_treemap if 'value' in item and item['level'] == 'detailed'),
-        'avg_wage': np.mean([item['mean_wage'] for item in state_treemap if 'mean_wage' in item and item['level'] == 'detailed'])
-    })
+    state_data.append(summary)
 
 # Save state summary data
-state_summary = pd.DataFrame(state_data)
+state_summary = pd.DataFrame(state_data, columns=['state', 'area_code', 'total_employment', 'avg_wage'])
 state_summary.to_csv('data/processed/states/state_summary.csv', index=False)
-print(f"Created data for {len(states)} states")
+print(f"Created data for {len(state_summary)} states")
 
-# Create metro-level data
+# Create metro-level data from the metropolitan and nonmetropolitan area rows of the BLS file
 print("\nCreating metro-level data...")
-metros = [
-    'New York-Newark-Jersey City, NY-NJ-PA',
-    'Los Angeles-Long Beach-Anaheim, CA',
-    'Chicago-Naperville-Elgin, IL-IN-WI',
-    'Dallas-Fort Worth-Arlington, TX',
-    'Houston-The Woodlands-Sugar Land, TX',
-    'Washington-Arlington-Alexandria, DC-VA-MD-WV',
-    'Miami-Fort Lauderdale-Pompano Beach, FL',
-    'Philadelphia-Camden-Wilmington, PA-NJ-DE-MD',
-    'Atlanta-Sandy Springs-Alpharetta, GA',
-    'Phoenix-Mesa-Chandler, AZ',
-    'Boston-Cambridge-Newton, MA-NH',
-    'San Francisco-Oakland-Berkeley, CA',
-    'Riverside-San Bernardino-Ontario, CA',
-    'Detroit-Warren-Dearborn, MI',
-    'Seattle-Tacoma-Bellevue, WA',
-    'Minneapolis-St. Paul-Bloomington, MN-WI',
-    'San Diego-Chula Vista-Carlsbad, CA',
-    'Tampa-St. Petersburg-Clearwater, FL',
-    'Denver-Aurora-Lakewood, CO',
-    'St. Louis, MO-IL'
-]
-
-# Create metro-level data with variations from national data
 metro_data = []
-for metro in metros:
-    metro_factor = np.random.uniform(0.8, 1.5)  # Random factor to vary employment by metro
-    wage_factor = np.random.uniform(0.9, 1.4)   # Random factor to vary wages by metro
+for area_code, metro_rows in metro_df.groupby('area_code', sort=True):
+    metro = metro_rows['area_name'].iloc[0]
     
     # Determine which state this metro belongs to (simplified)
-    state = metro.split(',')[-1].strip().split('-')[0]
+    state = metro.split(',')[-1].strip().split('-')[0] if ',' in metro else ''
     
-    metro_treemap = []
-    for item in treemap_data:
-        metro_item = item.copy()
-        
-        # Adjust employment and wages by metro factors
-        if 'value' in metro_item:
-            metro_item['value'] = metro_item['value'] * metro_factor
-        if 'mean_wage' in metro_item:
-            metro_item['mean_wage'] = metro_item['mean_wage'] * wage_factor
-        
-        # Add metro identifier
-        metro_item['metro'] = metro
-        metro_item['state'] = state
-        metro_treemap.append(metro_item)
+    metro_treemap, summary = build_area_treemap(metro_rows, metro=metro, state=state)
     
     # Save metro-level treemap data
-    with open(f'data/processed/metro/treemap_data_{metro.lower().replace(" ", "_").replace(",", "").replace("-", "_")}.json', 'w') as f:
+    with open(f'data/processed/metro/treemap_data_{metro.lower().replace(" ", "_").replace(",", "").replace("-", "_").replace("/", "_")}.json', 'w') as f:
         json.dump(metro_treemap, f)
     
-    metro_data.append({
-        'metro': metro,
-        'state': state,
-        'employment_factor': metro_factor,
-        'wage_factor': wage_factor,
-        'total_employment': sum(item['value'] for item in metro_treemap if 'value' in item and item['level'] == 'detailed'),
-        'avg_wage': np.mean([item['mean_wage'] for item in metro_treemap if 'mean_wage' in item and item['level'] == 'detailed'])
-    })
+    metro_data.append(summary)
 
 # Save metro summary data
-metro_summary = pd.DataFrame(metro_data)
+metro_summary = pd.DataFrame(metro_data, columns=['metro', 'state', 'area_code', 'total_employment', 'avg_wage'])
 metro_summary.to_csv('data/processed/metro/metro_summary.csv', index=False)
-print(f"Created data for {len(metros)} metropolitan areas")
+print(f"Created data for {len(metro_summary)} metropolitan areas")
 
 # Calculate job complexity and task complexity based on R formulas
 print("\nCalculating job complexity and task complexity...")
@@ -606,19 +470,21 @@ complexity_data.to_csv('data/processed/complexity/job_task_complexity.csv', inde
 print(f"Calculated complexity metrics for {len(complexity_data)} occupations")
 
 # Create Excel file with all data
-print("\nCreating Excel file with all data...")
-with pd.ExcelWriter('data/processed/complexity/job_task_complexity_data.xlsx') as writer:
-    complexity_data.to_excel(writer, sheet_name='Occupation Data', index=False)
-    state_summary.to_excel(writer, sheet_name='State Summary', index=False)
-    metro_summary.to_excel(writer, sheet_name='Metro Summary', index=False)
-    
+if args.skip_excel:
+    print("\nSkipping the Excel file (--skip-excel)")
+else:
+    print("\nCreating Excel file with all data...")
     # Create a sheet with complexity rankings
     complexity_rankings = complexity_data[['soc_code', 'occupation_title', 'job_complexity', 'task_complexity', 
                                           'annual_mean_wage', 'employment', 'uber_category', 'major_group_name']]
-    complexity_rankings.sort_values('job_complexity', ascending=False).to_excel(writer, sheet_name='Job Complexity Rankings', index=False)
-    complexity_rankings.sort_values('task_complexity', ascending=False).to_excel(writer, sheet_name='Task Complexity Rankings', index=False)
-
-print("Excel file created with all complexity data")
+    write_xlsx('data/processed/complexity/job_task_complexity_data.xlsx', [
+        ('Occupation Data', complexity_data),
+        ('State Summary', state_summary),
+        ('Metro Summary', metro_summary),
+        ('Job Complexity Rankings', complexity_rankings.sort_values('job_complexity', ascending=False)),
+        ('Task Complexity Rankings', complexity_rankings.sort_values('task_complexity', ascending=False)),
+    ], workers=args.workers)
+    print("Excel file created with all complexity data")
 
 # Create data for job space visualization
 print("\nCreating data for job space visualization...")
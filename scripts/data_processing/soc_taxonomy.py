@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+
+# SOC major groups (XX-0000)
+MAJOR_GROUP_NAMES = {
+    '11': 'Management',
+    '13': 'Business & Financial Operations',
+    '15': 'Computer & Mathematical',
+    '17': 'Architecture & Engineering',
+    '19': 'Life, Physical, & Social Science',
+    '21': 'Community & Social Service',
+    '23': 'Legal',
+    '25': 'Educational Instruction & Library',
+    '27': 'Arts, Design, Entertainment, Sports, & Media',
+    '29': 'Healthcare Practitioners & Technical',
+    '31': 'Healthcare Support',
+    '33': 'Protective Service',
+    '35': 'Food Preparation & Serving Related',
+    '37': 'Building & Grounds Cleaning & Maintenance',
+    '39': 'Personal Care & Service',
+    '41': 'Sales & Related',
+    '43': 'Office & Administrative Support',
+    '45': 'Farming, Fishing, & Forestry',
+    '47': 'Construction & Extraction',
+    '49': 'Installation, Maintenance, & Repair',
+    '51': 'Production',
+    '53': 'Transportation & Material Moving',
+    '55': 'Military Specific',
+}
+
+# Uber categories (broader groupings of major groups)
+UBER_CATEGORIES = {
+    'Management & Business': ['11', '13'],
+    'STEM': ['15', '17', '19'],
+    'Education & Social Services': ['21', '23', '25', '27'],
+    'Healthcare': ['29', '31'],
+    'Service': ['33', '35', '37', '39'],
+    'Sales & Office': ['41', '43'],
+    'Natural Resources & Construction': ['45', '47'],
+    'Production & Transportation': ['49', '51', '53'],
+    'Military': ['55']
+}
+
+MAJOR_TO_UBER = {major: uber for uber, majors in UBER_CATEGORIES.items() for major in majors}
+
+# Uber category of codes outside the SOC major groups
+OTHER_CATEGORY = 'Other'
+
+# Lookup tables indexed by the 2-digit major group number: position of the major group
+# name and of the uber category (-1 where there is none)
+MAJOR_GROUP_LABELS = list(MAJOR_GROUP_NAMES.values())
+UBER_CATEGORY_LABELS = list(UBER_CATEGORIES)
+MAJOR_GROUP_INDEX = np.full(100, -1, dtype=np.int8)
+UBER_CATEGORY_INDEX = np.full(100, -1, dtype=np.int8)
+for _position, _major in enumerate(MAJOR_GROUP_NAMES):
+    MAJOR_GROUP_INDEX[int(_major)] = _position
+for _major, _uber in MAJOR_TO_UBER.items():
+    UBER_CATEGORY_INDEX[int(_major)] = UBER_CATEGORY_LABELS.index(_uber)
+
+# 6-digit BLS codes (111011), SOC codes (11-1011) and O*NET-SOC codes (11-1011.00)
+SOC_PATTERN = r'^(?P<major>\d{2})-?(?P<rest>\d{4})(?:\.(?P<suffix>\d{2}))?$'
+
+
+def _soc_parts(codes):
+    # Parse every distinct code once; returns the position of each code among the distinct
+    # codes (the last row, an empty one, for missing codes) and the parsed distinct codes
+    positions, uniques = pd.factorize(pd.Series(codes, dtype=object).to_numpy(), use_na_sentinel=True)
+    uniques = pd.Series(uniques, dtype=object)
+
+    # Numeric codes (e.g. read from Excel) are zero-padded to 6 digits
+    numbers = pd.to_numeric(uniques, errors='coerce')
+    integral = numbers.notna() & (numbers % 1 == 0)
+    text = uniques.astype(str).str.strip()
+    text[integral] = numbers[integral].astype(np.int64).astype(str).str.zfill(6)
+
+    parts = text.str.extract(SOC_PATTERN)
+    parts['original'] = uniques
+    parts.loc[len(parts)] = [np.nan, np.nan, np.nan, np.nan]
+    positions = np.where(positions < 0, len(parts) - 1, positions)
+    return positions, parts
+
+
+def _result(codes, values):
+    if isinstance(codes, pd.Series):
+        return pd.Series(values, index=codes.index)
+    return values
+
+
+def normalize_soc(codes, style='soc', suffix='00'):
+    """
+    Normalize occupation codes given in any of the BLS/SOC/O*NET-SOC layouts.
+
+    Parameters:
+    codes: array-like of codes ('111011', 111011, '11-1011', '11-1011.00'); missing values stay missing
+    style: 'digits' (111011), 'soc' (11-1011) or 'onet' (11-1011.00)
+    suffix: O*NET-SOC suffix used for codes that have none (style='onet')
+
+    Returns:
+    normalized codes (a Series with the same index for a Series input, else an array);
+    values that are not occupation codes are returned unchanged
+    """
+    positions, parts = _soc_parts(codes)
+    if style == 'digits':
+        formatted = parts['major'] + parts['rest']
+    elif style == 'soc':
+        formatted = parts['major'] + '-' + parts['rest']
+    elif style == 'onet':
+        formatted = parts['major'] + '-' + parts['rest'] + '.' + parts['suffix'].fillna(suffix)
+    else:
+        raise ValueError(f"Unknown SOC code style: {style}")
+    formatted = formatted.where(parts['major'].notna(), parts['original'])
+    return _result(codes, formatted.to_numpy(dtype=object)[positions])
+
+
+def major_group(codes):
+    """
+    2-digit major group of each code ('' for values that are not occupation codes).
+    """
+    positions, parts = _soc_parts(codes)
+    return _result(codes, parts['major'].fillna('').to_numpy(dtype=object)[positions])
+
+
+def minor_group(codes):
+    """
+    SOC minor group of each code (11-1011 -> 11-1000).
+    """
+    positions, parts = _soc_parts(codes)
+    groups = parts['major'] + '-' + parts['rest'].str[:1] + '000'
+    return _result(codes, groups.to_numpy(dtype=object)[positions])
+
+
+def broad_group(codes):
+    """
+    SOC broad occupation of each code (11-1011 -> 11-1010).
+    """
+    positions, parts = _soc_parts(codes)
+    groups = parts['major'] + '-' + parts['rest'].str[:3] + '0'
+    return _result(codes, groups.to_numpy(dtype=object)[positions])
+
+
+def is_major_group(codes):
+    """
+    Whether each code is a major group total (XX-0000).
+    """
+    positions, parts = _soc_parts(codes)
+    return _result(codes, (parts['rest'] == '0000').to_numpy(dtype=bool)[positions])
+
+
+def _major_numbers(parts):
+    return pd.to_numeric(parts['major'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+
+
+def major_group_name(codes, default=np.nan):
+    """
+    Name of the major group of each code, or `default` outside the SOC major groups.
+    """
+    positions, parts = _soc_parts(codes)
+    labels = np.array(MAJOR_GROUP_LABELS + [default], dtype=object)
+    # Index -1 picks the default at the end of the labels
+    return _result(codes, labels[MAJOR_GROUP_INDEX[_major_numbers(parts)]][positions])
+
+
+def uber_category(codes, default=OTHER_CATEGORY):
+    """
+    Uber category of each code, or `default` outside the SOC major groups.
+    """
+    positions, parts = _soc_parts(codes)
+    labels = np.array(UBER_CATEGORY_LABELS + [default], dtype=object)
+    return _result(codes, labels[UBER_CATEGORY_INDEX[_major_numbers(parts)]][positions])
+
+
+def add_taxonomy_columns(df, soc_col='soc_code'):
+    """
+    Add major_group, major_group_name, is_major_group and uber_category columns
+    derived from the SOC codes in `soc_col`.
+    """
+    positions, parts = _soc_parts(df[soc_col])
+    majors = _major_numbers(parts)
+    df['major_group'] = parts['major'].fillna('').to_numpy(dtype=object)[positions]
+    df['major_group_name'] = np.array(MAJOR_GROUP_LABELS + [np.nan], dtype=object)[MAJOR_GROUP_INDEX[majors]][positions]
+    df['is_major_group'] = (parts['rest'] == '0000').to_numpy(dtype=bool)[positions]
+    df['uber_category'] = np.array(UBER_CATEGORY_LABELS + [OTHER_CATEGORY], dtype=object)[UBER_CATEGORY_INDEX[majors]][positions]
+    return df
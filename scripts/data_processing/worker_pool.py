@@ -0,0 +1,14 @@
+import multiprocessing
+
+
+def pool_context():
+    """
+    Multiprocessing context of the worker pools of the pipeline.
+
+    The pipeline scripts run their work at module level, so workers are forked instead of
+    spawned (spawning would re-run the calling script in every worker); None (the default
+    context) where fork is not available.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
@@ -3,6 +3,11 @@ import numpy as np
 import plotly.graph_objects as go
 import os
 import traceback
+import sys
+
+# The SOC taxonomy is shared with the data processing scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_processing'))
+from soc_taxonomy import MAJOR_GROUP_NAMES, UBER_CATEGORIES, MAJOR_TO_UBER, major_group, major_group_name, uber_category
 
 print("Creating improved treemap visualizations...")
 
@@ -17,64 +22,10 @@ try:
     job_df = pd.read_csv(job_complexity_file)
     print(f"Loaded job complexity data with {len(job_df)} rows")
     
-    # Extract SOC major groups
-    job_df['major_group'] = job_df['soc_code'].apply(lambda x: x.split('-')[0] if isinstance(x, str) and '-' in x else '')
-    
-    # Define major group names
-    major_group_names = {
-        '11': 'Management',
-        '13': 'Business & Financial Operations',
-        '15': 'Computer & Mathematical',
-        '17': 'Architecture & Engineering',
-        '19': 'Life, Physical, & Social Science',
-        '21': 'Community & Social Service',
-        '23': 'Legal',
-        '25': 'Educational Instruction & Library',
-        '27': 'Arts, Design, Entertainment, Sports, & Media',
-        '29': 'Healthcare Practitioners & Technical',
-        '31': 'Healthcare Support',
-        '33': 'Protective Service',
-        '35': 'Food Preparation & Serving Related',
-        '37': 'Building & Grounds Cleaning & Maintenance',
-        '39': 'Personal Care & Service',
-        '41': 'Sales & Related',
-        '43': 'Office & Administrative Support',
-        '45': 'Farming, Fishing, & Forestry',
-        '47': 'Construction & Extraction',
-        '49': 'Installation, Maintenance, & Repair',
-        '51': 'Production',
-        '53': 'Transportation & Material Moving',
-        '55': 'Military Specific',
-    }
-    
-    # Add major group names
-    job_df['major_group_name'] = job_df['major_group'].map(major_group_names)
-    
-    # Create uber categories (broader groupings)
-    uber_categories = {
-        'Management & Business': ['11', '13'],
-        'STEM': ['15', '17', '19'],
-        'Education & Social Services': ['21', '23', '25', '27'],
-        'Healthcare': ['29', '31'],
-        'Service': ['33', '35', '37', '39'],
-        'Sales & Office': ['41', '43'],
-        'Natural Resources & Construction': ['45', '47'],
-        'Production & Transportation': ['49', '51', '53'],
-        'Military': ['55']
-    }
-    
-    # Create reverse mapping from major group to uber category
-    major_to_uber = {}
-    for uber, majors in uber_categories.items():
-        for major in majors:
-            major_to_uber[major] = uber
-    
-    # Add uber category
-    job_df['uber_category'] = job_df['major_group'].map(major_to_uber)
-    
-    # Fill missing values
-    job_df['uber_category'] = job_df['uber_category'].fillna('Other')
-    job_df['major_group_name'] = job_df['major_group_name'].fillna('Other')
+    # Extract SOC major groups, their names and uber categories
+    job_df['major_group'] = major_group(job_df['soc_code'])
+    job_df['major_group_name'] = major_group_name(job_df['soc_code'], default='Other')
+    job_df['uber_category'] = uber_category(job_df['soc_code'])
     
     # Ensure numeric columns are numeric
     numeric_cols = ['job_complexity_index', 'job_price_index', 'annual_mean_wage', 'employment']
@@ -129,7 +80,7 @@ try:
         hovers = []
         
         # Add uber categories
-        for uber in uber_categories.keys():
+        for uber in UBER_CATEGORIES.keys():
             labels.append(uber)
             parents.append("")
             values.append(0)  # Will be summed from children
@@ -137,9 +88,9 @@ try:
             hovers.append(f"{uber}")
         
         # Add major groups
-        for mg, name in major_group_names.items():
-            if mg in major_to_uber:
-                uber = major_to_uber[mg]
+        for mg, name in MAJOR_GROUP_NAMES.items():
+            if mg in MAJOR_TO_UBER:
+                uber = MAJOR_TO_UBER[mg]
                 labels.append(name)
                 parents.append(uber)
                 values.append(0)  # Will be summed from children
@@ -199,13 +150,13 @@ try:
                 dict(
                     buttons=list([
                         dict(
-                            args=[{"values": [v if i >= len(uber_categories) + len(major_group_names) else 0 for i, v in enumerate(values)]}],
+                            args=[{"values": [v if i >= len(UBER_CATEGORIES) + len(MAJOR_GROUP_NAMES) else 0 for i, v in enumerate(values)]}],
                             label="Size by Employment",
                             method="update"
                         ),
                         dict(
-                            args=[{"values": [job_df.loc[i-len(uber_categories)-len(major_group_names), 'total_compensation'] 
-                                            if i >= len(uber_categories) + len(major_group_names) else 0 
+                            args=[{"values": [job_df.loc[i-len(UBER_CATEGORIES)-len(MAJOR_GROUP_NAMES), 'total_compensation'] 
+                                            if i >= len(UBER_CATEGORIES) + len(MAJOR_GROUP_NAMES) else 0 
                                             for i in range(len(labels))]}],
                             label="Size by Total Compensation",
                             method="update"
@@ -226,14 +177,14 @@ try:
                 dict(
                     buttons=list([
                         dict(
-                            args=[{"marker.colors": [c if i >= len(uber_categories) + len(major_group_names) else 0 for i, c in enumerate(colors)],
+                            args=[{"marker.colors": [c if i >= len(UBER_CATEGORIES) + len(MAJOR_GROUP_NAMES) else 0 for i, c in enumerate(colors)],
                                   "marker.colorbar.title": "Job Complexity Index"}],
                             label="Color by Complexity",
                             method="update"
                         ),
                         dict(
-                            args=[{"marker.colors": [job_df.loc[i-len(uber_categories)-len(major_group_names), 'job_price_index'] 
-                                                   if i >= len(uber_categories) + len(major_group_names) else 0 
+                            args=[{"marker.colors": [job_df.loc[i-len(UBER_CATEGORIES)-len(MAJOR_GROUP_NAMES), 'job_price_index'] 
+                                                   if i >= len(UBER_CATEGORIES) + len(MAJOR_GROUP_NAMES) else 0 
                                                    for i in range(len(labels))],
                                   "marker.colorbar.title": "Job Price Index"}],
                             label="Color by Price",
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The pipeline modules are imported the way the scripts import each other
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+sys.path.insert(0, os.path.join(SCRIPTS, 'data_processing'))
+sys.path.insert(0, os.path.join(SCRIPTS, 'complexity'))
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from complexity_engine import (calculate_complexity, calculate_complexity_batch, complexity_operator,
+                               solve_complexity, ComplexityOperator, apply_wage_delta, read_complexity_results,
+                               write_solver_settings)
+
+
+def _job_task(seed=0, n_jobs=30, n_tasks=50, density=0.2):
+    rng = np.random.default_rng(seed)
+    rca = np.where(rng.random((n_jobs, n_tasks)) < density, rng.uniform(0.2, 3.0, (n_jobs, n_tasks)), 0.0)
+    # Every job performs a task
+    rca[np.arange(n_jobs), rng.integers(0, n_tasks, n_jobs)] = 1.0
+    jobs, tasks = np.nonzero(rca)
+    return pd.DataFrame({'O_NET_SOC_Code': [f"{j:02d}-0000.00" for j in jobs],
+                         'DWA_ID': [f"4.A.{t:03d}" for t in tasks],
+                         'RCA': rca[jobs, tasks]})
+
+
+def _baseline(job_task_df, job_df):
+    # The 20 reflections of the R script, dense: kj <- diag(1/nj) M kt, kt <- diag(1/nt) M' kj
+    job_task_df = job_task_df[job_task_df['O_NET_SOC_Code'].isin(job_df['O_NET_SOC_Code'])]
+    job_codes = job_task_df['O_NET_SOC_Code'].unique()
+    task_ids = job_task_df['DWA_ID'].unique()
+    mjt = np.zeros((len(job_codes), len(task_ids)))
+    mjt[pd.Index(job_codes).get_indexer(job_task_df['O_NET_SOC_Code']),
+        pd.Index(task_ids).get_indexer(job_task_df['DWA_ID'])] = job_task_df['RCA']
+    nj = mjt.sum(axis=1)
+    nt = mjt.sum(axis=0)
+    wj = job_df.set_index('O_NET_SOC_Code').loc[job_codes, 'A_MEAN'].to_numpy()
+    kt1 = (mjt > 0).T @ wj / nt
+    kj, kt = wj, kt1
+    for _ in range(20):
+        kj, kt = mjt @ kt / nj, mjt.T @ kj / nt
+    return (pd.Series(kj, index=job_codes), pd.Series(kt, index=task_ids), pd.Series(kt1, index=task_ids))
+
+
+def _wages(job_task_df, seed=1, frac=0.8):
+    codes = pd.Series(job_task_df['O_NET_SOC_Code'].unique()).sample(frac=frac, random_state=seed)
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'O_NET_SOC_Code': codes.to_numpy(), 'A_MEAN': rng.uniform(3e4, 2e5, len(codes))})
+
+
+def _check(job_df_result, task_df_result, expected):
+    jci, tci, kt1 = expected
+    jobs = job_df_result.set_index('O_NET_SOC_Code')
+    tasks = task_df_result.set_index('DWA_ID')
+    assert sorted(jobs.index) == sorted(jci.index)
+    assert sorted(tasks.index) == sorted(tci.index)
+    np.testing.assert_allclose(jobs.loc[jci.index, 'JCI'], jci, rtol=1e-12)
+    np.testing.assert_allclose(tasks.loc[tci.index, 'TCI'], tci, rtol=1e-12)
+    np.testing.assert_allclose(tasks.loc[kt1.index, 'Avg_Wage'], kt1, rtol=1e-12)
+
+
+def test_table_matches_baseline():
+    job_task_df = _job_task()
+    job_df = _wages(job_task_df)
+    _check(*calculate_complexity(job_task_df, job_df), _baseline(job_task_df, job_df))
+
+
+def test_cached_operator_matches_baseline(tmp_path):
+    job_task_df = _job_task()
+    job_df = _wages(job_task_df)
+    operator = complexity_operator(job_task_df, cache_dir=str(tmp_path))
+    # The second call loads the operator saved by the first
+    assert len(list(tmp_path.iterdir())) == 1
+    loaded = complexity_operator(job_task_df, cache_dir=str(tmp_path))
+    assert loaded.digest() == operator.digest()
+    _check(*calculate_complexity(loaded, job_df), _baseline(job_task_df, job_df))
+
+
+def test_batch_matches_region_by_region():
+    job_task_df = _job_task()
+    region_df = pd.concat([_wages(job_task_df, seed).assign(State=f"S{seed}") for seed in range(1, 4)])
+    jobs, tasks = calculate_complexity_batch(job_task_df, region_df, 'State', 'State')
+    for state, job_df in region_df.groupby('State'):
+        _check(jobs[jobs['State'] == state], tasks[tasks['State'] == state], _baseline(job_task_df, job_df))
+
+
+def test_eigen_solvers_agree():
+    job_task_df = _job_task()
+    operator = ComplexityOperator.build(job_task_df)
+    wages = np.random.default_rng(2).uniform(3e4, 2e5, operator.shape[0])
+    power, _, _, (report,) = solve_complexity(operator, wages, solver='power', max_iter=5000)
+    eigs, _, _, _ = solve_complexity(operator, wages, solver='eigs')
+    assert report['converged']
+    np.testing.assert_allclose(power, eigs, rtol=1e-6)
+
+
+def test_unknown_solver():
+    with pytest.raises(ValueError):
+        solve_complexity(ComplexityOperator.build(_job_task()), np.ones(30), solver='newton')
+
+
+def test_revision_matches_cold_run():
+    job_task_df = _job_task()
+    job_df = _wages(job_task_df)
+    operator = ComplexityOperator.build(job_task_df)
+    previous = calculate_complexity(operator, job_df)
+    delta = pd.Series([4000.0, -2500.0], index=job_df['O_NET_SOC_Code'].iloc[:2].to_numpy())
+    reports = []
+    revised = calculate_complexity(operator, job_df, warm_start=previous, wage_delta=delta, reports=reports)
+    cold = calculate_complexity(operator, job_df, wage_delta=delta)
+    assert reports[0]['warm_start'] == 'revised'
+    for result, expected, col in ((revised[0], cold[0], 'JCI'), (revised[1], cold[1], 'TCI'),
+                                  (revised[1], cold[1], 'Avg_Wage')):
+        np.testing.assert_allclose(result[col], expected[col], rtol=1e-12)
+    np.testing.assert_allclose(revised[0]['JCI_Change'], cold[0]['JCI'] - previous[0]['JCI'], atol=1e-6)
+    moved = (revised[0]['JCI_Change'].abs() > 0.01 * previous[0]['JCI'].std(ddof=0)).to_numpy()
+    assert revised[0]['Moved'].tolist() == moved.tolist()
+
+
+def test_batch_revision_only_reflects_changed_regions(tmp_path):
+    job_task_df = _job_task()
+    region_df = pd.concat([_wages(job_task_df, seed).assign(State=f"S{seed}") for seed in range(1, 4)])
+    previous = calculate_complexity_batch(job_task_df, region_df, 'State', 'State')
+    # The previous results are read back from disk, as the scripts' --previous does
+    previous[0].to_csv(tmp_path / 'job_complexity.csv', index=False)
+    previous[1].to_csv(tmp_path / 'task_complexity.csv', index=False)
+    write_solver_settings(str(tmp_path))
+    previous = read_complexity_results(str(tmp_path))
+
+    code = region_df.loc[region_df['State'] == 'S2', 'O_NET_SOC_Code'].iloc[0]
+    wage_delta = pd.DataFrame({'O_NET_SOC_Code': [code], 'Wage_Delta': [3000.0], 'State': ['S2']})
+    revised_df = apply_wage_delta(region_df, wage_delta, 'State')
+    assert (revised_df['A_MEAN'] != region_df['A_MEAN']).sum() == 1
+
+    reports = []
+    jobs, tasks = calculate_complexity_batch(job_task_df, revised_df, 'State', 'State', warm_start=previous,
+                                             reports=reports)
+    assert {report['region']: report['warm_start'] for report in reports} == \
+        {'S1': 'unchanged', 'S2': 'revised', 'S3': 'unchanged'}
+    assert not jobs.loc[jobs['State'] != 'S2', 'Moved'].any()
+    for state, job_df in revised_df.groupby('State'):
+        _check(jobs[jobs['State'] == state], tasks[tasks['State'] == state], _baseline(job_task_df, job_df))
+
+
+def test_revision_needs_the_same_solver_settings():
+    job_task_df = _job_task()
+    job_df = _wages(job_task_df)
+    previous = calculate_complexity(job_task_df, job_df)
+    with pytest.raises(ValueError):
+        calculate_complexity(job_task_df, job_df, warm_start=previous, max_iter=30)
+    with pytest.raises(ValueError):
+        calculate_complexity(job_task_df, job_df, warm_start=previous, tol=1e-6)
+    with pytest.raises(ValueError):
+        calculate_complexity(job_task_df, job_df, warm_start=previous, solver='eigs')
+    # Frames that do not record their solver settings
+    unrecorded = previous[0].copy()
+    unrecorded.attrs.clear()
+    with pytest.raises(ValueError):
+        calculate_complexity(job_task_df, job_df, warm_start=(unrecorded, previous[1]))
@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+import pytest
+
+from oews_checkpoint import (open_checkpoint_log, append_checkpoint, read_checkpoints, checkpoint_matches,
+                             SOURCE_HEADER)
+from oews_ingest import summarize_batch
+from oews_reader import parse_alldata_block
+
+LINES = [
+    b'OEUN' + b'0000000' + b'000000' + b'000000' + b'01\t2024\tA01\t  63699.80\t4\n',
+    b'OEUS' + b'0100000' + b'000000' + b'111011' + b'04\t2024\tA01\t 101550.00\t\n',
+    b'OEUS' + b'0100000' + b'000000' + b'291141' + b'01\t2024\tA01\t         *\t\n',
+    b'OEUM' + b'0010180' + b'000000' + b'291141' + b'04\t2024\tA01\t  88120.10\t5\n',
+    b'OEUS' + b'0200000' + b'000000' + b'111011' + b'04\t2024\tA01\t  99999.50\t\n',
+]
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'oe.data.1.AllData.txt'
+    path.write_bytes(b''.join(LINES))
+    return str(path)
+
+
+def _summaries():
+    # Two chunks of the raw file with their byte ranges
+    first, second = b''.join(LINES[:3]), b''.join(LINES[3:])
+    return [(0, len(first), summarize_batch(parse_alldata_block(first))),
+            (len(first), len(first) + len(second), summarize_batch(parse_alldata_block(second)))]
+
+
+def _write(log, source, summaries):
+    f, records = open_checkpoint_log(log, source)
+    assert records == []
+    recorded = {'area_codes': set(), 'occupation_codes': set(), 'datatypes': set()}
+    for start, stop, summary in summaries:
+        append_checkpoint(f, start, stop, summary, recorded)
+    f.close()
+
+
+def _assert_same(record, expected):
+    start, stop, summary = record
+    assert (start, stop) == expected[:2]
+    expected = expected[2]
+    assert summary['rows'] == expected['rows']
+    for field in ('areatype', 'area_code', 'occupation_code', 'datatype'):
+        assert summary['values'].decoded(field).tolist() == expected['values'].decoded(field).tolist()
+    np.testing.assert_array_equal(summary['values'].values, expected['values'].values)
+    assert summary['values'].flags.tolist() == expected['values'].flags.tolist()
+
+
+def test_round_trip(tmp_path, source):
+    log = str(tmp_path / 'checkpoint.bin')
+    summaries = _summaries()
+    _write(log, source, summaries)
+
+    records, valid_bytes = read_checkpoints(log)
+    assert valid_bytes == os.path.getsize(log)
+    assert len(records) == 2
+    for record, expected in zip(records, summaries):
+        _assert_same(record, expected)
+    # Every record holds only the codes new in its chunk
+    assert records[0][2]['area_codes'] == {'0000000', '0100000'}
+    assert records[1][2]['area_codes'] == {'0010180', '0200000'}
+    assert records[1][2]['datatypes'] == set()
+
+
+def test_truncated_tail_is_cut_on_resume(tmp_path, source):
+    log = str(tmp_path / 'checkpoint.bin')
+    summaries = _summaries()
+    _write(log, source, summaries)
+    complete = read_checkpoints(log)[1]
+    with open(log, 'r+b') as f:
+        f.truncate(complete - 7)
+
+    records, valid_bytes = read_checkpoints(log)
+    assert len(records) == 1
+    _assert_same(records[0], summaries[0])
+
+    f, resumed = open_checkpoint_log(log, source, resume=True)
+    assert len(resumed) == 1
+    assert os.path.getsize(log) == valid_bytes
+    # The second chunk is committed again after the cut
+    append_checkpoint(f, *summaries[1])
+    f.close()
+    records, valid_bytes = read_checkpoints(log)
+    assert len(records) == 2
+    assert valid_bytes == os.path.getsize(log)
+    _assert_same(records[1], summaries[1])
+
+
+def test_corrupted_record_ends_the_log(tmp_path, source):
+    log = str(tmp_path / 'checkpoint.bin')
+    _write(log, source, _summaries())
+    with open(log, 'r+b') as f:
+        # Flip a byte of the first record's payload, so its checksum fails
+        f.seek(SOURCE_HEADER.size + len(os.path.abspath(source).encode()) + 64)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    assert read_checkpoints(log)[0] == []
+
+
+def test_log_of_another_source_starts_over(tmp_path, source):
+    log = str(tmp_path / 'checkpoint.bin')
+    _write(log, source, _summaries())
+    assert checkpoint_matches(log, source)
+
+    with open(source, 'ab') as f:
+        f.write(LINES[0])
+    assert not checkpoint_matches(log, source)
+    f, records = open_checkpoint_log(log, source, resume=True)
+    f.close()
+    assert records == []
+    assert read_checkpoints(log)[0] == []
+    assert checkpoint_matches(log, source)
+
+
+def test_missing_or_headerless_log(tmp_path):
+    log = tmp_path / 'checkpoint.bin'
+    assert read_checkpoints(str(log)) == ([], 0)
+    log.write_bytes(b'not a checkpoint log')
+    assert read_checkpoints(str(log)) == ([], 0)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from oews_rows import CompactRows, SUPPRESSED, FOOTNOTE
+
+
+def _frame(footnotes):
+    return pd.DataFrame({
+        'areatype': ['S', 'S', 'M'],
+        'area_code': ['0100000', '0200000', '0010180'],
+        'occupation_code': ['111011', '111011', '291141'],
+        'datatype': ['04', '04', '01'],
+        'value': [101.5, np.nan, 7.0],
+        'footnote_codes': footnotes,
+    })
+
+
+def test_round_trip_and_flags():
+    frame = _frame(['', '5', ' '])
+    rows = CompactRows.from_frame(frame)
+    assert len(rows) == 3
+    assert rows.decoded('area_code').tolist() == frame['area_code'].tolist()
+    assert rows.decoded('occupation_code').tolist() == frame['occupation_code'].tolist()
+    np.testing.assert_array_equal(rows.values, frame['value'].to_numpy())
+    assert rows.flags.tolist() == [0, SUPPRESSED | FOOTNOTE, 0]
+    # Codes are small integers into the codebooks
+    assert rows.codes('area_code').dtype == np.int16
+    assert rows.code_of('datatype', '01') == 1
+    assert rows.code_of('datatype', '99') == -1
+
+
+def test_categorical_footnotes_match_strings():
+    strings = CompactRows.from_frame(_frame(['4', '', '4']))
+    categorical = CompactRows.from_frame(_frame(pd.Categorical(['4', '', '4'])))
+    assert categorical.flags.tolist() == strings.flags.tolist() == [FOOTNOTE, SUPPRESSED, FOOTNOTE]
+
+
+def test_concat_translates_codebooks():
+    first = CompactRows.from_frame(_frame(['', '', '']))
+    second = CompactRows.from_frame(_frame(['', '', '']).iloc[::-1])
+    rows = CompactRows.concat([first, second])
+    assert rows.decoded('area_code').tolist() == ['0100000', '0200000', '0010180', '0010180', '0200000', '0100000']
+    selected = rows.take(rows.codes('datatype') == rows.code_of('datatype', '01'))
+    assert selected.to_frame()['value'].tolist() == [7.0, 7.0]
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from oews_series import (decode_series_ids, encode_series_ids, series_id_frame, to_soc_codes, datatype_names,
+                         factorize_codes)
+
+# survey, seasonal and area type, area code, industry code, occupation code, data type
+SERIES_IDS = [
+    'OEUN' + '0000000' + '000000' + '000000' + '01',
+    'OEUS' + '0100000' + '000000' + '111011' + '04',
+    'OEUM' + '0010180' + '000000' + '291141' + '17',
+]
+
+
+def test_decode_splits_fixed_width_fields():
+    decoded = decode_series_ids(SERIES_IDS)
+    assert decoded['survey'].tolist() == [b'OE'] * 3
+    assert decoded['areatype'].tolist() == [b'N', b'S', b'M']
+    assert decoded['area_code'].tolist() == [b'0000000', b'0100000', b'0010180']
+    assert decoded['industry_code'].tolist() == [b'000000'] * 3
+    assert decoded['occupation_code'].tolist() == [b'000000', b'111011', b'291141']
+    assert decoded['datatype'].tolist() == [b'01', b'04', b'17']
+
+
+def test_decode_accepts_padded_bytes_and_series():
+    padded = np.array([s + '      ' for s in SERIES_IDS], dtype='S')
+    from_bytes = decode_series_ids(padded, ['area_code', 'datatype'])
+    from_series = decode_series_ids(pd.Series(SERIES_IDS), ['area_code', 'datatype'])
+    assert list(from_bytes) == ['area_code', 'datatype']
+    for field in from_bytes:
+        assert from_bytes[field].tolist() == from_series[field].tolist()
+
+
+def test_encode_round_trips_decode():
+    decoded = {field: np.char.decode(values, 'ascii') for field, values in decode_series_ids(SERIES_IDS).items()}
+    encoded = encode_series_ids(decoded['area_code'], decoded['occupation_code'], decoded['datatype'],
+                                areatype=decoded['areatype'], industry_code=decoded['industry_code'])
+    assert encoded.dtype == np.dtype('S25')
+    assert encoded.tolist() == [s.encode() for s in SERIES_IDS]
+
+
+def test_encode_broadcasts_scalars_and_rejects_short_fields():
+    encoded = encode_series_ids('0000000', ['111011', '291141'], '04')
+    assert encoded.tolist() == [b'OEUN' + b'0000000' + b'000000' + b'111011' + b'04',
+                                b'OEUN' + b'0000000' + b'000000' + b'291141' + b'04']
+    with pytest.raises(ValueError):
+        encode_series_ids('00000', '111011', '04')
+
+
+def test_series_id_frame_columns():
+    index = pd.Index([10, 11, 12])
+    frame = series_id_frame(pd.Series(SERIES_IDS, index=index))
+    assert frame.index.equals(index)
+    assert frame['soc_code'].tolist() == ['00-0000', '11-1011', '29-1141']
+    assert frame['data_type'].tolist() == ['employment', 'annual_mean_wage', 'location_quotient']
+    assert isinstance(frame['area_code'].dtype, pd.CategoricalDtype)
+
+
+def test_helpers():
+    assert to_soc_codes(['151252']).tolist() == ['15-1252']
+    assert list(datatype_names(['01', '99'])) == ['employment', 'unknown_99']
+    codes, uniques = factorize_codes(np.array([b'04', b'01', b'04']))
+    assert codes.tolist() == [0, 1, 0]
+    assert uniques.tolist() == ['04', '01']